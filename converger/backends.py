@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Execution backends used to run DFT jobs: local processes, PBS, and
+Slurm, and packing of many small jobs into one allocation of any of them
+
+@author: abishekk
+"""
+import concurrent.futures
+import itertools
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import uuid
+
+class Backend(object):
+    """
+    Base class for execution backends. A backend submits a command that
+    reads inputFile and writes outputFile inside workDir, reports which of
+    its jobs are still queued or running, and cancels jobs.
+    
+    Usage:
+        backend = get_backend('pbs', coresPerJob=16)
+        jobId = backend.submit(backend.command('pw.x'), 'in.pw.si',
+                               'out.pw.si', '/path/to/job')
+        backend.status([jobId])
+    """
+    
+    def __init__(self, coresPerJob=16, mpiCmd='mpirun -np', params=None):
+        """
+        Initializes a backend
+        
+        coresPerJob: int, number of MPI ranks used by every job
+        mpiCmd: string, MPI launcher to which coresPerJob is appended, no
+                MPI launcher is used if empty
+        params: string, extra options passed to the queue manager
+        
+        Has 3 attributes:
+            self.coresPerJob: int, determined by coresPerJob
+            self.mpiCmd: string, determined by mpiCmd
+            self.params: string, determined by params
+        """
+        self.coresPerJob = int(coresPerJob)
+        self.mpiCmd = mpiCmd
+        self.params = params
+        
+        if (self.coresPerJob < 1):
+            raise Exception('Number of cores per job must be at least 1')
+        if self.params == None:
+            self.params = ''
+    
+    def command(self, executable):
+        """
+        Build the command that runs executable on coresPerJob cores
+        
+        executable: string, DFT executable eg. pw.x
+        
+        returns: string, eg. mpirun -np 16 pw.x
+        """
+        if not self.mpiCmd:
+            return executable
+        return self.mpiCmd + ' ' + str(self.coresPerJob) + ' ' + executable
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        """
+        Submit a job without waiting for it to finish
+        
+        cmd: string, command to run eg. mpirun -np 16 pw.x
+        inputFile: string, name of the input file inside workDir
+        outputFile: string, name of the output file inside workDir
+        workDir: string, directory in which the job runs
+        params: string, options passed to the queue manager for this job
+                only, default is self.params
+        
+        returns: string, job id
+        """
+        raise NotImplementedError
+    
+    def status(self, jobIds):
+        """
+        Find which of the jobs are still queued or running
+        
+        jobIds: list of strings, job ids returned by submit
+        
+        returns: set of strings, job ids that have not finished
+        
+        Raises an exception if the queue manager cannot be queried, so
+        that a failed query is never taken as every job having finished
+        """
+        raise NotImplementedError
+    
+    def cancel(self, jobId):
+        """
+        Remove a job from the queue
+        
+        jobId: string, job id returned by submit
+        """
+        raise NotImplementedError
+
+def _query_queue(args, finishedMsg):
+    """
+    Run a status query of a queue manager
+    
+    args: list of strings, command and its arguments
+    finishedMsg: string, error printed for a job id the queue manager no
+                 longer knows, which has finished
+    
+    returns: string, output of the query
+    """
+    jobStatus = subprocess.Popen(args, stdout=subprocess.PIPE, \
+                                 stderr=subprocess.PIPE, \
+                                 universal_newlines=True)
+    output, errors = jobStatus.communicate()
+    # a failed query with no output tells nothing about the jobs, unless
+    # it failed only because none of them is known any more
+    if jobStatus.returncode != 0 and not output.strip():
+        errors = [line for line in errors.splitlines() if line.strip()]
+        if not errors or not all(finishedMsg in line for line in errors):
+            raise Exception('Status query ' + args[0] + ' failed: ' + \
+                            ' '.join(errors[:1]))
+    return output
+
+class LocalBackend(Backend):
+    """
+    Run jobs concurrently on the local machine, each waited for by a thread
+    of a pool. The number of concurrent jobs is totalCores // coresPerJob
+    so that all the cores are used without oversubscribing. Every job runs
+    in a session of its own, so that cancelling a running job kills its
+    command and all the processes it started.
+    
+    Usage:
+        backend = LocalBackend(coresPerJob=4, totalCores=16)
+    """
+    
+    def __init__(self, coresPerJob=1, totalCores=None, mpiCmd='mpirun -np', \
+                 params=None):
+        """
+        Initializes a pool of threads to run jobs locally
+        
+        coresPerJob: int, number of MPI ranks used by every job
+        totalCores: int, cores available on the machine, default is all
+        mpiCmd: string, MPI launcher, not used when coresPerJob is 1
+        params: string, not used by the local backend
+        
+        Has 8 attributes in addition to those of Backend:
+            self.totalCores: int, determined by totalCores
+            self._pool: ThreadPoolExecutor, runs the jobs
+            self._futures: dictionary, job id -> future of the job
+            self._counter: iterator, source of job ids
+            self._prefix: string, start of the job ids of this backend
+            self._processes: dictionary, job id -> Popen of running jobs
+            self._cancelled: set of strings, job ids cancelled
+            self._lock: threading.Lock, guards the processes of the jobs
+        """
+        super().__init__(coresPerJob, mpiCmd, params)
+        if totalCores is None:
+            totalCores = os.cpu_count() or 1
+        self.totalCores = int(totalCores)
+        maxWorkers = max(1, self.totalCores // self.coresPerJob)
+        self._pool = concurrent.futures.ThreadPoolExecutor(maxWorkers)
+        self._futures = {}
+        self._counter = itertools.count(1)
+        self._prefix = uuid.uuid4().hex[:8]
+        self._processes = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+    
+    def command(self, executable):
+        if self.coresPerJob == 1:
+            return executable
+        return super().command(executable)
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        runCmd = cmd + ' < ' + inputFile + ' > ' + outputFile
+        # ids of another process, eg. in a journal, never match
+        jobId = 'local.' + self._prefix + '-' + str(next(self._counter))
+        self._futures[jobId] = self._pool.submit(self._run, jobId, runCmd, \
+                                                 workDir)
+        return jobId
+    
+    def _run(self, jobId, runCmd, workDir):
+        """
+        Run the shell command of a job in workDir, executed in a worker
+        thread
+        
+        returns: int, exit status of the command, None if the job was
+                 cancelled before it started
+        """
+        with self._lock:
+            if jobId in self._cancelled:
+                return None
+            process = subprocess.Popen(runCmd, shell=True, cwd=workDir, \
+                                       start_new_session=True)
+            self._processes[jobId] = process
+        try:
+            return process.wait()
+        finally:
+            with self._lock:
+                self._processes.pop(jobId, None)
+    
+    def status(self, jobIds):
+        return set(jobId for jobId in jobIds if jobId in self._futures \
+                   and not self._futures[jobId].done())
+    
+    def cancel(self, jobId, timeout=5.0):
+        """
+        Remove a job waiting for a free worker, or kill a running job and
+        wait until it has stopped
+        
+        jobId: string, job id returned by submit
+        timeout: float, time in s given to a running job to stop after
+                 SIGTERM before it is killed with SIGKILL
+        """
+        with self._lock:
+            if jobId not in self._futures:
+                return
+            self._cancelled.add(jobId)
+            process = self._processes.get(jobId)
+        self._futures[jobId].cancel()
+        if process is None:
+            return
+        
+        # the session holds the command and every process it started
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(process.pid, sig)
+            except OSError:
+                return
+            try:
+                process.wait(timeout)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+    
+    def shutdown(self):
+        """
+        Wait for running jobs and release the worker threads
+        """
+        self._pool.shutdown(wait=True)
+
+class PBSBackend(Backend):
+    """
+    Submit jobs to a PBS/Torque queue with qsub
+    
+    Usage:
+        backend = PBSBackend(coresPerJob=16, params='-l walltime=01:00:00')
+    """
+    
+    def __init__(self, coresPerJob=16, mpiCmd='mpirun -np', params=None, \
+                 submitCmd='qsub', statusCmd='qstat', cancelCmd='qdel'):
+        """
+        Initializes a backend for PBS
+        
+        submitCmd: string, command used to submit a job script from stdin
+        statusCmd: string, command used to query the status of job ids
+        cancelCmd: string, command used to remove a job from the queue
+        
+        Has 3 attributes in addition to those of Backend:
+            self.submitCmd: string, determined by submitCmd
+            self.statusCmd: string, determined by statusCmd
+            self.cancelCmd: string, determined by cancelCmd
+        """
+        super().__init__(coresPerJob, mpiCmd, params)
+        self.submitCmd = submitCmd
+        self.statusCmd = statusCmd
+        self.cancelCmd = cancelCmd
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        if params is None:
+            params = self.params
+        runCmd = cmd + ' < ' + inputFile + ' > ' + outputFile
+        args = shlex.split(self.submitCmd) + ['-V', '-d', workDir] + \
+               shlex.split(params) + ['-']
+        jobSubmit = subprocess.Popen(args, stdin=subprocess.PIPE, \
+                                     stdout=subprocess.PIPE, \
+                                     universal_newlines=True)
+        # qsub returns job ID to stdout
+        return jobSubmit.communicate(runCmd)[0].strip()
+    
+    def status(self, jobIds):
+        if not jobIds:
+            return set()
+        qstatMsg = _query_queue(shlex.split(self.statusCmd) + list(jobIds), \
+                                'Unknown Job Id')
+        return self.parse_status(qstatMsg, jobIds)
+    
+    def cancel(self, jobId):
+        subprocess.call(shlex.split(self.cancelCmd) + [jobId], \
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    @staticmethod
+    def parse_status(qstatMsg, jobIds):
+        """
+        Find the jobs that are still in the queue from qstat output
+        
+        qstatMsg: string, output of qstat for all the job ids
+        jobIds: list of strings, job ids that were queried
+        
+        returns: set of strings, job ids still queued or running
+        """
+        # qstat may truncate the server name, so match on the job number
+        byNumber = {jobId.split('.')[0]: jobId for jobId in jobIds}
+        queued = set()
+        for line in qstatMsg.splitlines():
+            words = line.split()
+            if not words:
+                continue
+            jobId = byNumber.get(words[0].split('.')[0])
+            # state 'C' is a completed job that Torque still lists
+            if jobId is not None and not (len(words) >= 6 and \
+                                          words[4] == 'C'):
+                queued.add(jobId)
+        
+        return queued
+
+class SlurmBackend(Backend):
+    """
+    Submit jobs to a Slurm queue with sbatch
+    
+    Usage:
+        backend = SlurmBackend(coresPerJob=16, params='--time=01:00:00')
+    """
+    
+    def __init__(self, coresPerJob=16, mpiCmd='srun -n', params=None, \
+                 submitCmd='sbatch', statusCmd='squeue', cancelCmd='scancel'):
+        """
+        Initializes a backend for Slurm
+        
+        submitCmd: string, command used to submit a job
+        statusCmd: string, command used to query the status of job ids
+        cancelCmd: string, command used to remove a job from the queue
+        
+        Has 3 attributes in addition to those of Backend:
+            self.submitCmd: string, determined by submitCmd
+            self.statusCmd: string, determined by statusCmd
+            self.cancelCmd: string, determined by cancelCmd
+        """
+        super().__init__(coresPerJob, mpiCmd, params)
+        self.submitCmd = submitCmd
+        self.statusCmd = statusCmd
+        self.cancelCmd = cancelCmd
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        if params is None:
+            params = self.params
+        runCmd = cmd + ' < ' + inputFile + ' > ' + outputFile
+        args = shlex.split(self.submitCmd) + ['--parsable', \
+               '--chdir=' + workDir, '--ntasks=' + str(self.coresPerJob)] + \
+               shlex.split(params) + ['--wrap=' + runCmd]
+        jobSubmit = subprocess.Popen(args, stdout=subprocess.PIPE, \
+                                     universal_newlines=True)
+        # --parsable prints 'jobid' or 'jobid;cluster'
+        return jobSubmit.communicate()[0].strip().split(';')[0]
+    
+    def status(self, jobIds):
+        if not jobIds:
+            return set()
+        listed = set(_query_queue(shlex.split(self.statusCmd) + \
+                                  ['-h', '-o', '%i', '-j', ','.join(jobIds)], \
+                                  'Invalid job id').split())
+        return set(jobId for jobId in jobIds if jobId in listed)
+    
+    def cancel(self, jobId):
+        subprocess.call(shlex.split(self.cancelCmd) + [jobId], \
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class PackedBackend(Backend):
+    """
+    Run many small jobs inside one allocation of another backend. Jobs
+    submitted close together are packed: the first status query submits
+    them as a single job that runs them slots at a time, each on
+    backend.coresPerJob // slots cores. One queue wait then covers a whole
+    batch of points instead of one wait per point.
+    
+    Each job of a pack is a shell script in packDir. Every one of the slots
+    lanes of the pack script claims the next job that no lane has started
+    (mkdir is atomic, also on shared file systems), runs it and marks it
+    done, so short and long jobs keep all the lanes busy. Job numbers
+    start with a prefix unique to each PackedBackend, so that markers left
+    in packDir by an earlier run never match the jobs of a new one.
+    
+    The allocation of each job is also kept in packDir, so that a new
+    process that follows a job of a process that died, eg. from a
+    journal, finds it there. A job of another process that cannot be
+    found is reported as still queued rather than submitted twice: give
+    packDir when a study may be resumed.
+    
+    Usage:
+        backend = PackedBackend(PBSBackend(coresPerJob=16,
+                                params='-l walltime=02:00:00'), slots=4)
+        backend.command('pw.x') # mpirun -np 4 pw.x
+    """
+    
+    def __init__(self, backend, slots=4, maxJobs=None, packDir=None, \
+                 mpiCmd=None):
+        """
+        Initializes packing of jobs into allocations of backend
+        
+        backend: Backend, submits the allocations, its coresPerJob is the
+                 size of each allocation
+        slots: int, number of jobs run at the same time in an allocation
+        maxJobs: int, largest number of jobs packed in one allocation, no
+                 limit if None
+        packDir: string, directory of the pack and job scripts, which must
+                 be visible from the compute nodes, default is a directory
+                 'packs' next to the job directory of the first job
+        mpiCmd: string, MPI launcher of the jobs in an allocation, default
+                is backend.mpiCmd
+        
+        Has 9 attributes in addition to those of Backend:
+            self.backend: Backend, determined by backend
+            self.slots: int, determined by slots
+            self.maxJobs: int, determined by maxJobs
+            self.packDir: string, determined by packDir
+            self._pending: list, [job id, command, input file, output file,
+                           job directory] of jobs not packed yet
+            self._packs: dictionary, job id -> [allocation id, script
+                         directory, job number] of packed jobs
+            self._lock: threading.Lock, guards the jobs, which are submitted
+                        and queried from worker threads of JobEngine
+            self._counter: iterator, source of job numbers
+            self._prefix: string, start of the job numbers of this backend
+        """
+        if (int(slots) < 1 or backend.coresPerJob < int(slots)):
+            raise Exception('Slots must be between 1 and the cores per ' + \
+                            'allocation')
+        super().__init__(backend.coresPerJob // int(slots), \
+                         backend.mpiCmd if mpiCmd is None else mpiCmd, \
+                         backend.params)
+        self.backend = backend
+        self.slots = int(slots)
+        self.maxJobs = maxJobs
+        self.packDir = packDir
+        self._pending = []
+        self._packs = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._prefix = uuid.uuid4().hex[:8]
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        # a job shares the allocation, which is submitted with the options
+        # of self.backend, so params is not used
+        with self._lock:
+            jobId = 'packed.' + self._prefix + '-' + str(next(self._counter))
+            self._pending.append([jobId, cmd, inputFile, outputFile, \
+                                  workDir])
+            full = self.maxJobs is not None and \
+                   len(self._pending) >= self.maxJobs
+        if full:
+            self.flush()
+        return jobId
+    
+    def flush(self):
+        """
+        Submit the jobs not packed yet as one allocation
+        
+        returns: string, allocation id, None if no job was waiting
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        if not pending:
+            return None
+        
+        packDir = self.packDir
+        if packDir is None:
+            packDir = os.path.join(os.path.dirname(pending[0][4]), 'packs')
+        packDir = os.path.abspath(packDir)
+        if not os.path.exists(packDir):
+            os.makedirs(packDir)
+        
+        numbers = []
+        for jobId, cmd, inputFile, outputFile, workDir in pending:
+            number = jobId.split('.')[1]
+            with open(os.path.join(packDir, 'job.' + number + '.sh'), \
+                      'w') as fileptr:
+                fileptr.write('cd ' + shlex.quote(workDir) + ' && ' + cmd + \
+                              ' < ' + shlex.quote(inputFile) + ' > ' + \
+                              shlex.quote(outputFile) + '\n')
+            numbers.append(number)
+        
+        packName = 'pack.' + numbers[0]
+        with open(os.path.join(packDir, packName + '.sh'), 'w') as fileptr:
+            fileptr.write(self.pack_script(numbers))
+        allocId = self.backend.submit('sh ' + packName + '.sh', \
+                                      '/dev/null', packName + '.log', packDir)
+        
+        for number in numbers:
+            with open(os.path.join(packDir, 'job.' + number + '.alloc'), \
+                      'w') as fileptr:
+                fileptr.write(allocId + '\n')
+        
+        with self._lock:
+            for jobId, number in zip([job[0] for job in pending], numbers):
+                self._packs[jobId] = [allocId, packDir, number]
+        return allocId
+    
+    def pack_script(self, numbers):
+        """
+        Shell script run in an allocation
+        
+        numbers: list of strings, numbers of the jobs in the pack
+        
+        returns: string, script that runs the jobs in self.slots lanes
+        """
+        lines = ['#!/bin/sh\n', \
+                 '# each lane runs the next job no lane has claimed\n', \
+                 'lane() {\n', \
+                 '    for job in ' + ' '.join(numbers) + '; do\n', \
+                 '        mkdir job.$job.claim 2> /dev/null || continue\n', \
+                 '        sh job.$job.sh\n', \
+                 '        touch job.$job.done\n', \
+                 '    done\n', \
+                 '}\n']
+        lines += ['lane &\n']*min(self.slots, len(numbers))
+        lines.append('wait\n')
+        return ''.join(lines)
+    
+    def status(self, jobIds):
+        # the first query after a batch of submits packs the batch
+        self.flush()
+        
+        with self._lock:
+            packs = {jobId: self._packs[jobId] for jobId in jobIds \
+                     if jobId in self._packs}
+        foreign = set(jobId for jobId in jobIds if jobId not in packs and \
+                      not jobId.startswith('packed.' + self._prefix + '-'))
+        for jobId in list(foreign):
+            pack = self.find_pack(jobId)
+            if pack is not None:
+                packs[jobId] = pack
+                foreign.remove(jobId)
+        
+        queued = self.backend.status(sorted(set(pack[0] for pack in \
+                                                packs.values())))
+        return foreign | set(jobId for jobId, [allocId, packDir, number] \
+                             in packs.items() if allocId in queued and \
+                             not os.path.exists(os.path.join(packDir, \
+                                 'job.' + number + '.done')))
+    
+    def find_pack(self, jobId):
+        """
+        Find the allocation of a job packed by another process in packDir,
+        or in the directories of the packs of this backend, and follow it
+        
+        jobId: string, job id returned by submit in the other process
+        
+        returns: list, [allocation id, pack directory, job number], None if
+                 the job is not found
+        """
+        number = jobId.split('.', 1)[1]
+        with self._lock:
+            packDirs = set(pack[1] for pack in self._packs.values())
+        if self.packDir is not None:
+            packDirs.add(os.path.abspath(self.packDir))
+        
+        for packDir in sorted(packDirs):
+            try:
+                with open(os.path.join(packDir, 'job.' + number + \
+                                       '.alloc')) as fileptr:
+                    allocId = fileptr.read().strip()
+            except OSError:
+                continue
+            with self._lock:
+                self._packs[jobId] = [allocId, packDir, number]
+            return [allocId, packDir, number]
+        return None
+    
+    def cancel(self, jobId):
+        with self._lock:
+            self._pending = [job for job in self._pending \
+                             if job[0] != jobId]
+            pack = self._packs.pop(jobId, None)
+        if pack is None:
+            return
+        
+        # claim the job so that no lane starts it, a running job goes on
+        allocId, packDir, number = pack
+        try:
+            os.mkdir(os.path.join(packDir, 'job.' + number + '.claim'))
+        except OSError:
+            pass
+        with self._lock:
+            inUse = any(other[0] == allocId for other in self._packs.values())
+        if not inUse:
+            self.backend.cancel(allocId)
+
+_backends = {'local': LocalBackend, 'pbs': PBSBackend, 'slurm': SlurmBackend}
+
+def get_backend(name, **kwargs):
+    """
+    Create an execution backend from its name
+    
+    name: string, one of 'local', 'pbs', 'slurm'
+    kwargs: options passed to the backend eg. coresPerJob=4
+    
+    returns: Backend
+    """
+    if name not in _backends:
+        raise Exception('Backend must be one of: ' + \
+                        ', '.join(sorted(_backends)))
+    return _backends[name](**kwargs)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of output parsing, input generation and job scheduling on
+synthetic QE inputs and outputs. Results are written as JSON so that runs
+can be compared to catch regressions.
+
+Usage:
+    python benchmarks.py [results.json] [scale]
+
+@author: abishekk
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from backends import Backend
+from input_reader import InputReader
+from input_writer import InputTemplate, InputWriter
+from job_engine import JobEngine
+from output_parser import OutputParser
+
+def make_qe_input(numAtoms, numKpoints):
+    """
+    Synthesize a QE input with many atoms and an explicit list of k-points
+    
+    numAtoms: int, number of atoms in ATOMIC_POSITIONS
+    numKpoints: int, number of k-points listed in K_POINTS
+    
+    returns: list of strings, lines of the input with '\n' included
+    """
+    lines = ['&control\n', "    calculation = 'scf'\n", \
+             "    prefix = 'bench'\n", "    pseudo_dir = './'\n", '/\n', \
+             '&system\n', '    ibrav = 2, celldm(1) = 10.20, ' + \
+             'nat = %d, ntyp = 1,\n' % numAtoms, '    ecutwfc = 18.0\n', \
+             '/\n', '&electrons\n', '    conv_thr = 1.0d-8\n', '/\n', \
+             'ATOMIC_SPECIES\n', ' Si  28.086  Si.pz-vbc.UPF\n', \
+             'ATOMIC_POSITIONS crystal\n']
+    for atom in range(numAtoms):
+        lines.append(' Si %.6f %.6f %.6f\n' % ((atom*0.37) % 1.0, \
+                     (atom*0.61) % 1.0, (atom*0.83) % 1.0))
+    lines += ['K_POINTS crystal\n', '%d\n' % numKpoints]
+    for kpt in range(numKpoints):
+        lines.append('%.6f %.6f %.6f 1\n' % ((kpt*0.13) % 1.0, \
+                     (kpt*0.29) % 1.0, (kpt*0.47) % 1.0))
+    return lines
+
+def make_qe_output(numAtoms, numKpoints, numIterations):
+    """
+    Synthesize the output of a QE SCF run with the lines parsed by
+    OutputParser
+    
+    numAtoms: int, number of atoms with a force
+    numKpoints: int, number of k-points listed with their bands
+    numIterations: int, number of SCF iterations
+    
+    returns: string, contents of the output file
+    """
+    parts = ['\n     Program PWSCF v.6.0 starts on  6Dec2016 at 13:23:27\n', \
+             '\n     number of atoms/cell      = %12d\n' % numAtoms, \
+             '\n     number of k points= %5d\n' % numKpoints]
+    for kpt in range(numKpoints):
+        parts.append('        k(%5d) = (   0.1250000   0.1250000   ' \
+                     '0.1250000), wk =   0.0625000\n' % (kpt + 1))
+    
+    parts.append('\n     Self-consistent Calculation\n')
+    for it in range(1, numIterations + 1):
+        parts.append('\n     iteration #%3d     ecut=    18.00 Ry     ' \
+                     'beta=0.70\n' % it)
+        parts.append('     Davidson diagonalization with overlap\n' \
+                     '     ethr =  1.00E-02,  avg # of iterations =  2.0\n' \
+                     '\n     total cpu time spent up to now is        ' \
+                     '0.1 secs\n\n')
+        parts.append('     total energy              = %16.8f Ry\n' % \
+                     (-15.8 - 0.1/it))
+        parts.append('     estimated scf accuracy    < %16.8f Ry\n' % \
+                     (0.1/it**2))
+    
+    parts.append('\n     End of self-consistent calculation\n')
+    for kpt in range(numKpoints):
+        parts.append('\n          k = 0.1250 0.1250 0.1250 (   335 PWs)   ' \
+                     'bands (ev):\n\n    -5.6039   4.6467   5.9568   ' \
+                     '5.9568\n')
+    parts.append('\n     the Fermi energy is     6.1234 ev\n')
+    parts.append('\n!    total energy              = %16.8f Ry\n' % \
+                 (-15.8 - 0.1/numIterations))
+    parts.append('\n     convergence has been achieved in %3d iterations\n' \
+                 % numIterations)
+    
+    parts.append('\n     Forces acting on atoms (Cartesian axes, Ry/au):\n\n')
+    for atom in range(numAtoms):
+        parts.append('     atom %4d type  1   force =    -0.00100000   ' \
+                     '0.00200000    0.00300000\n' % (atom + 1))
+    parts.append('\n     Total force =     0.000000     Total SCF ' \
+                 'correction =     0.000000\n')
+    parts.append('\n          total   stress  (Ry/bohr**3)                   '\
+                 '(kbar)     P=  -10.24\n' \
+                 '  -0.00006961   0.00000000   0.00000000        -10.24' \
+                 '      0.00      0.00\n' \
+                 '   0.00000000  -0.00006961   0.00000000          0.00' \
+                 '    -10.24      0.00\n' \
+                 '   0.00000000  -0.00000000  -0.00006961          0.00' \
+                 '     -0.00    -10.24\n')
+    parts.append('\n     PWSCF        :     0.24s CPU         0.27s WALL\n' \
+                 '\n   JOB DONE.\n')
+    return ''.join(parts)
+
+def baseline_parse(outPath):
+    """
+    Parse the total energy and k-points of an output line by line with
+    substring tests, the way OutputParser first did, as a reference for
+    the parse benchmark
+    
+    returns: list of total energy in eV and number of k-points
+    """
+    rydtoev = OutputParser('qe').rydtoev
+    totEnergy = kpoints = None
+    with open(outPath, 'r') as fileptr:
+        for line in fileptr:
+            if '!' in line:
+                totEnergy = float(line.split()[4])*rydtoev
+            if 'number of k points' in line:
+                kpoints = int(line.split()[4])
+    return [totEnergy, kpoints]
+
+def time_it(func, repeat=3):
+    """
+    Returns shortest time in s of repeat calls of func (float)
+    """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+class FakeQueue(Backend):
+    """
+    In-process stand-in for a queue manager in which every job finishes
+    after a given time. Each status query costs statusDelay seconds like a
+    call to qstat would.
+    
+    Usage:
+        queue = FakeQueue(statusDelay=0.01)
+        engine = JobEngine(queue, minInterval=0.05)
+    """
+    
+    def __init__(self, statusDelay=0.01, durations=None):
+        """
+        Initializes an empty queue
+        
+        statusDelay: float, time in s taken by each status query
+        durations: function, returns the run time in s of the next job,
+                   default 0.1 s
+        
+        Has 4 attributes in addition to those of Backend:
+            self.statusDelay: float, determined by statusDelay
+            self.durations: function, determined by durations
+            self.submitted: int, number of jobs submitted
+            self._finishAt: dictionary, job id -> time the job finishes
+        """
+        super().__init__(1, '')
+        self.statusDelay = float(statusDelay)
+        self.durations = durations
+        self.submitted = 0
+        self._finishAt = {}
+        
+        if self.durations is None:
+            self.durations = lambda: 0.1
+    
+    def submit(self, cmd, inputFile, outputFile, workDir, params=None):
+        self.submitted += 1
+        jobId = str(self.submitted) + '.fake'
+        self._finishAt[jobId] = time.monotonic() + self.durations()
+        return jobId
+    
+    def status(self, jobIds):
+        time.sleep(self.statusDelay)
+        now = time.monotonic()
+        return set(jobId for jobId in jobIds \
+                   if self._finishAt.get(jobId, now) > now)
+    
+    def cancel(self, jobId):
+        self._finishAt.pop(jobId, None)
+
+def bench_parse(workDir, numAtoms, numKpoints, numIterations):
+    """
+    Time parsing a large output in full and with early exit, and the
+    line by line parse of baseline_parse
+    
+    returns: dictionary of results
+    """
+    outPath = os.path.join(workDir, 'out.bench')
+    with open(outPath, 'w') as fileptr:
+        fileptr.write(make_qe_output(numAtoms, numKpoints, numIterations))
+    sizeMB = os.path.getsize(outPath)/1e6
+    
+    readOut = OutputParser('qe')
+    full = time_it(lambda: readOut.parse_op_file(outPath))
+    kpoints = time_it(lambda: readOut.parse_op_file(outPath, ['kpoints']))
+    baseline = time_it(lambda: baseline_parse(outPath))
+    
+    return {'atoms': numAtoms, 'kpoints': numKpoints, \
+            'iterations': numIterations, 'size MB': sizeMB, \
+            'full s': full, 'full MB/s': sizeMB/full, \
+            'kpoints only s': kpoints, 'baseline s': baseline, \
+            'full / baseline': full/baseline}
+
+def bench_input(workDir, numAtoms, numKpoints, numVariants):
+    """
+    Time reading and indexing a large input, looking up parameters and
+    cards, converting the k-point list to a grid, and writing variants
+    
+    returns: dictionary of results
+    """
+    inPath = os.path.join(workDir, 'in.bench')
+    lines = make_qe_input(numAtoms, numKpoints)
+    InputWriter(inPath, lines).write_lines_to_file()
+    sizeMB = os.path.getsize(inPath)/1e6
+    
+    inReader = InputReader(inPath, 'qe')
+    read = time_it(inReader.read_file)
+    lookup = time_it(lambda: [inReader.find_line_number(key) for key in \
+                              ['kpoints', 'kinetic energy cutoff', \
+                               'ATOMIC_POSITIONS', '&electrons']*250])
+    
+    def to_grid():
+        inReader.read_file()
+        inReader.set_card('K_POINTS', 'automatic', ['4 4 4 0 0 0\n'])
+    grid = time_it(to_grid)
+    
+    modLines = inReader.get_lines_file()
+    slot = inReader.find_line_number('kpoints') + 1
+    write = time_it(lambda: InputWriter(inPath, modLines). \
+                    write_lines_to_file())
+    
+    template = InputTemplate(modLines, {'kpoints': slot})
+    variants = [[os.path.join(workDir, 'in.%d' % i), \
+                 {'kpoints': '%d %d %d 0 0 0\n' % (i, i, i)}] \
+                for i in range(numVariants)]
+    batch = time_it(lambda: template.write_batch(variants))
+    
+    return {'atoms': numAtoms, 'kpoints': numKpoints, 'size MB': sizeMB, \
+            'read s': read, 'lookups per s': 1000/lookup, \
+            'kpoints to grid s': grid, 'write s': write, \
+            'variants': numVariants, 'batch write s': batch, \
+            'variants per s': numVariants/batch}
+
+def bench_schedule(numJobs, statusDelay=0.01, minInterval=0.05, \
+                   maxInterval=1.0):
+    """
+    Submit many simulated jobs through JobEngine and measure the time spent
+    beyond the longest job and the number of status queries
+    
+    returns: dictionary of results
+    """
+    rng = random.Random(0)
+    durations = [rng.uniform(0.1, 1.0) for i in range(numJobs)]
+    queue = FakeQueue(statusDelay, iter(durations).__next__)
+    
+    async def study(workDir):
+        engine = JobEngine(queue, minInterval, maxInterval)
+        start = time.perf_counter()
+        handles = []
+        for i in range(numJobs):
+            handles.append(await engine.submit('pw.x', 'in.job', \
+                                               'out.%d' % i, workDir))
+        await asyncio.gather(*handles)
+        return time.perf_counter() - start, engine.statusCalls
+    
+    with tempfile.TemporaryDirectory() as workDir:
+        with open(os.path.join(workDir, 'in.job'), 'w') as fileptr:
+            fileptr.write('\n')
+        wall, statusCalls = asyncio.run(study(workDir))
+    
+    return {'jobs': numJobs, 'wall s': wall, \
+            'overhead s': wall - max(durations), \
+            'status calls': statusCalls, \
+            'status time s': statusCalls*statusDelay}
+
+def run_benchmarks(outFile=None, scale=1.0):
+    """
+    Run every benchmark and write the results as JSON
+    
+    outFile: string, JSON file for the results, not written if None
+    scale: float, multiplies the size of the synthetic inputs and outputs
+    
+    returns: dictionary of results
+    """
+    def size(n):
+        return max(1, int(n*scale))
+    
+    results = {'python': platform.python_version(), \
+               'machine': platform.machine(), \
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'), \
+               'scale': scale}
+    with tempfile.TemporaryDirectory() as workDir:
+        results['parse'] = bench_parse(workDir, size(2000), size(500), \
+                                       size(2000))
+        results['input'] = bench_input(workDir, size(5000), size(5000), \
+                                       size(200))
+    results['schedule'] = bench_schedule(size(200))
+    
+    if outFile is not None:
+        with open(outFile, 'w') as fileptr:
+            json.dump(results, fileptr, indent=2, sort_keys=True)
+    return results
+
+if __name__ == '__main__':
+    outFile = sys.argv[1] if len(sys.argv) > 1 else 'benchmarks.json'
+    scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    results = run_benchmarks(outFile, scale)
+    for name in ('parse', 'input', 'schedule'):
+        print(name + ': ' + json.dumps(results[name], sort_keys=True))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parse many DFT output files in parallel into one columnar table
+
+@author: abishekk
+"""
+import concurrent.futures
+import glob
+import os
+
+from output_parser import OutputParser
+
+# scalar columns of the table and the value used when a run lacks them
+_columns = {'total energy'   : float('nan'),
+            'fermi energy'   : float('nan'),
+            'kpoints'        : 0,
+            'scf iterations' : 0,
+            'converged'      : False,
+            'wall time'      : float('nan')}
+
+def find_outputs(patterns, outPattern='out.*'):
+    """
+    Collect output files from globs, directories and file names
+    
+    patterns: string or list of strings, a glob eg. 'kpoints_*/out.*', a
+              directory searched for outPattern, or a file name
+    outPattern: string, glob of output files inside a directory
+    
+    returns: list of strings, sorted paths of output files
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, outPattern)))
+        else:
+            paths.update(path for path in glob.glob(pattern) \
+                         if os.path.isfile(path))
+    
+    return sorted(paths)
+
+def _parse_one(path, dftCode, props):
+    """
+    Parse one output file, executed in a worker process of parse_outputs
+    
+    returns: dictionary, record of the run
+    """
+    readOut = OutputParser(dftCode)
+    readOut.parse_op_file(path, props)
+    return readOut.get_record()
+
+def parse_outputs(patterns, dftCode='qe', props=None, processes=None, \
+                  chunkSize=8):
+    """
+    Parse output files across a process pool into a table with one row per
+    run
+    
+    patterns: string or list of strings, passed to find_outputs
+    dftCode: string, program name eg. 'qe'
+    props: list of strings, properties to read, all if None
+    processes: int, number of worker processes, default is all cores
+    chunkSize: int, number of files sent to a worker at once
+    
+    returns: dictionary of NumPy arrays, see records_to_table
+    """
+    paths = find_outputs(patterns)
+    
+    if processes == 1 or len(paths) <= 1:
+        records = [_parse_one(path, dftCode, props) for path in paths]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            records = list(pool.map(_parse_one, paths, \
+                                    [dftCode]*len(paths), \
+                                    [props]*len(paths), \
+                                    chunksize=chunkSize))
+    
+    return records_to_table(paths, records)
+
+def records_to_table(paths, records):
+    """
+    Convert records from OutputParser.get_record into columns
+    
+    paths: list of strings, output file of each record
+    records: list of dictionaries, one per run
+    
+    returns: dictionary of NumPy arrays with keys 'path', 'total energy',
+             'fermi energy', 'kpoints', 'scf iterations', 'converged',
+             'wall time' and 'stress' (n x 3 x 3, NaN if missing)
+    """
+    # NumPy is only needed once the table is built
+    import numpy as np
+    
+    table = {'path': np.array(paths, dtype=str)}
+    for column, missing in _columns.items():
+        values = [record.get(column) for record in records]
+        values = [missing if value is None else value for value in values]
+        table[column] = np.array(values, dtype=type(missing))
+    
+    stress = np.full((len(records), 3, 3), np.nan)
+    for row, record in enumerate(records):
+        if record.get('stress'):
+            stress[row] = record['stress']
+    table['stress'] = stress
+    
+    return table
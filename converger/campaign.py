@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run the convergence studies of many structures at once through one queue
+
+@author: abishekk
+"""
+import asyncio
+import os
+
+from backends import PBSBackend, get_backend
+from job_engine import JobEngine
+from metrics import Metrics
+
+class Campaign(object):
+    """
+    Class to run many convergence studies concurrently. All the studies
+    submit through one JobEngine, so there is a single status poller, the
+    limits on jobs and cores in the queue hold for the whole campaign, and
+    free slots go to the study with the fewest jobs in the queue.
+    
+    Usage:
+        campaign = Campaign('pbs', maxJobs=20)
+        for name in ['si', 'ge', 'gaas']:
+            study = Converger('in.pw.' + name, 'total energy', 1e-4, 'qe',
+                              workDir=name)
+            campaign.add_study(study, ['ecutwfc', 'kpoints'],
+                               [[20], [4,4,4]], [[5], [1,1,1]], batchSize=2)
+        campaign.run()
+    """
+    
+    def __init__(self, backend=None, maxJobs=None, maxCores=None, \
+                 minInterval=2.0, maxInterval=60.0, metrics=None):
+        """
+        Initializes an empty campaign
+        
+        backend: Backend or string, where the jobs of every study run, see
+                 Converger. Default is PBS with 16 cores per job
+        maxJobs: int, largest number of jobs of the campaign in the queue,
+                 no limit if None
+        maxCores: int, largest number of cores used by the jobs in the
+                  queue, no limit if None
+        minInterval: float, shortest time between two status queries in s
+        maxInterval: float, longest time between two status queries in s
+        metrics: Metrics, counts the status queries of the campaign, a new
+                 Metrics if None
+        
+        Has 5 attributes:
+            self.backend: Backend, determined by backend
+            self.engine: JobEngine, submits and follows the jobs of every
+                         study
+            self.metrics: Metrics, determined by metrics
+            self.studies: list of Converger, studies of the campaign
+            self._specs: list, [modLines, slots, batchSize, adaptive] of
+                         each study
+        """
+        self.backend = backend
+        self.metrics = metrics
+        self.studies = []
+        self._specs = []
+        
+        if self.backend == None:
+            self.backend = PBSBackend(coresPerJob=16)
+        elif isinstance(self.backend, str):
+            self.backend = get_backend(self.backend)
+        if self.metrics == None:
+            self.metrics = Metrics()
+        
+        self.engine = JobEngine(self.backend, minInterval, maxInterval, \
+                                maxJobs=maxJobs, maxCores=maxCores)
+    
+    def add_study(self, study, convParms, startVals, steps, batchSize=1, \
+                  adaptive=False, restart=False):
+        """
+        Add the study of one structure. The study runs on the backend of
+        the campaign whatever backend it was created with.
+        
+        study: Converger, set up with the sample input of the structure and
+               a workDir of its own
+        convParms, startVals, steps, batchSize, adaptive, restart: see
+               Converger.start_joint_convergence
+        """
+        for other in self.studies:
+            if other.workDir == study.workDir:
+                raise Exception('Studies of a campaign need their own ' + \
+                                'workDir: ' + study.workDir)
+        
+        batchSize = int(batchSize)
+        if (batchSize < 1):
+            raise Exception('Batch size must be at least 1')
+        
+        modLines, slots = study.prepare_study(convParms, startVals, steps, \
+                                              restart)
+        study.backend = self.backend
+        self.studies.append(study)
+        self._specs.append([modLines, slots, batchSize, adaptive])
+    
+    def run(self):
+        """
+        Run every study until it converges and print their results
+        """
+        with self.metrics.profile():
+            asyncio.run(self.run_studies())
+        
+        for study in self.studies:
+            print(study.inputFile + ':')
+            study.print_results()
+    
+    def report(self, outFile='campaign.html', plotDir=None, processes=None):
+        """
+        Write the results of every study to one HTML report and, if plotDir
+        is given, the plot of each study to plotDir/<study>.png. The plots
+        are rendered in worker processes without a display.
+        
+        outFile: string, HTML file with the results of all the studies
+        plotDir: string, directory of the plots, no plots if None
+        processes: int, number of worker processes, default is all cores
+        
+        returns: list of strings, files written
+        """
+        from report import render_reports, write_html_report
+        
+        summaries = [study.get_summary() for study in self.studies]
+        written = []
+        if plotDir is not None:
+            if not os.path.exists(plotDir):
+                os.makedirs(plotDir)
+            written = render_reports(summaries, \
+                          [os.path.join(plotDir, \
+                                        os.path.basename(study.workDir) + \
+                                        '.png') for study in self.studies], \
+                          processes)
+        write_html_report(summaries, outFile, 'Campaign')
+        return written + [outFile]
+    
+    async def run_studies(self):
+        """
+        Run the points of every study concurrently through self.engine
+        """
+        await asyncio.gather(*[study.run_points(modLines, slots, batchSize, \
+                                                adaptive, self.engine) \
+                               for study, [modLines, slots, batchSize, \
+                                           adaptive] in \
+                               zip(self.studies, self._specs)])
+        self.metrics.count('status calls', self.engine.statusCalls)
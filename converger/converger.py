@@ -5,15 +5,38 @@ Class to set up QE calculations for checking convergence
 
 @author: abishekk
 """
+import asyncio
+import glob
 import numpy as np
+import shutil
 import sys
 import os
-import matplotlib.pyplot as plt
+import time
 
 from input_reader import InputReader
-from input_writer import InputWriter
-from job_launcher import JobLauncher
+from input_writer import InputTemplate, InputWriter
+from backends import PBSBackend, SlurmBackend, get_backend
+from bulk_parser import records_to_table
+from cost_model import input_features
+from grid_scheduler import GridScheduler
+from job_engine import JobEngine
+from kgrid_planner import KGridPlanner, cell_from_input, irreducible_count, \
+                          lattice_symmetries
+from metrics import Metrics
 from output_parser import OutputParser
+from retry_policy import OK, SUBMIT_FAILED, RetryPolicy, classify_outcome, \
+                         read_scheduler_errors, set_walltime
+
+# convergence parameters: generic name -> QE name
+_qeParams = {'kpoints'               : 'kpoints',
+             'kinetic energy cutoff' : 'ecutwfc',
+             'charge density cutoff' : 'ecutrho',
+             'smearing'              : 'degauss'}
+
+# outdir of every point when restarting from the previous point, relative to
+# the job directory, and the files of <prefix>.save copied between points
+_restartDir = 'out'
+_densityFiles = ('charge-density*', 'spin-polarization*', 'magnetization*')
 
 class Converger(object):
     """
@@ -22,10 +45,48 @@ class Converger(object):
     Usage:
         kptConv = Converger('in.pw.si', 'total energy', 1e-8, 'qe')
         kptConv.start_convergence('kpoints',[4,4,4], [1,1,1])
+    
+    To keep the next 3 grids in the queue at once:
+        kptConv.start_convergence('kpoints',[4,4,4], [1,1,1], batchSize=3)
+    
+    To converge the cutoff and the k-point grid together:
+        kptConv.start_joint_convergence(['ecutwfc', 'kpoints'], 
+                                        [[20], [4,4,4]], [[5], [1,1,1]],
+                                        batchSize=4)
+    
+    To run on the local machine, 4 cores per job:
+        kptConv = Converger('in.pw.si', 'total energy', 1e-8, 'qe',
+                            LocalBackend(coresPerJob=4))
+    
+    To start the SCF of every point from the charge density of the nearest
+    point that has finished:
+        kptConv.start_convergence('kpoints',[4,4,4], [1,1,1], restart=True)
+    
+    To be able to resume the study if this process dies, run it again with
+    the same journal:
+        kptConv = Converger('in.pw.si', 'total energy', 1e-8, 'qe',
+                            journal=StudyJournal('study.jsonl'))
+    
+    A point whose SCF does not converge, or whose job crashes, is killed
+    at its time limit or cannot be submitted, is submitted again with less
+    mixing and more SCF steps. To allow more retries, sooner:
+        kptConv = Converger('in.pw.si', 'total energy', 1e-8, 'qe',
+                            retry=RetryPolicy(maxRetries=4, delay=5.0))
+    
+    To keep the result of every run for queries across studies:
+        kptConv = Converger('in.pw.si', 'total energy', 1e-8, 'qe',
+                            store=ResultStore('results'))
+    
+    To plan k-point grids of equal spacing along every reciprocal vector
+    from the cell of the input, skipping grids that add no irreducible
+    k-points, starting from the spacing of [4,4,4]:
+        kptConv.start_convergence('kpoints',[4,4,4], 'auto')
     """
     
     def __init__(self, filename, convCriterion='total energy', \
-                 tol=1e-6, dftCode='qe'):
+                 tol=1e-6, dftCode='qe', backend=None, executable='pw.x', \
+                 cache=None, monitor=None, journal=None, metrics=None, \
+                 workDir=None, store=None, retry=None, costModel=None):
         """
         Initialize a convergence study with a sample input script, property 
         used for convergence, tolerance for that criterion, and DFT package to
@@ -35,32 +96,101 @@ class Converger(object):
         convCriterion: string, property that will be used to determine conv.
         tol: float, absolute tolerance for convCriterion
         dftCode: string, DFT code used in the study eg. 'qe', 'vasp'
+        backend: Backend or string, where the jobs run eg. 'local', 'pbs',
+                 'slurm'. Default is PBS with 16 cores per job
+        executable: string, DFT executable launched for every point
+        cache: ResultCache, reuse results of inputs computed before, no 
+               caching if None
+        monitor: JobMonitor, follows the outputs of running points and 
+                 cancels the ones whose SCF diverges, not used if None
+        journal: StudyJournal, records every point so that a study run
+                 again reattaches to queued jobs and reuses finished points
+                 instead of submitting them again, not used if None
+        metrics: Metrics, collects the time spent on every point and the
+                 number of status queries, a new Metrics if None
+        workDir: string, directory in which the job directories are
+                 created, default is the current working directory. All
+                 the paths are resolved here, so studies with different
+                 workDir can run in threads or tasks of one process
+        store: ResultStore, receives the result of every run, labelled
+               with the name of the input file, not used if None
+        retry: RetryPolicy, which failed points are submitted again and
+               how, default is RetryPolicy(). A point that fails for good
+               stops the study with an exception.
+        costModel: CostModel, learns the wall time of every run and
+                   predicts the cost of the next points, so that the
+                   cheapest ones run first and each job asks for the time
+                   limit its point needs, see point_params. The cores of
+                   the jobs stay backend.coresPerJob. Not used if None
         
-        Has 9 attributes:
+        Has 25 attributes:
             self.inputFile = string, DFT input file
             self.convergeUsing = string, convergence criterion eg. 
                                  'total energy', 'fermi energy' etc.
             self.tolerance = float, tolerance for determining convergence 
             self.dftPackage = string, name of DFT code to be used
-            self.convergeParam = string, variable to change for convergence 
-                                 study eg. ecutwfc, ecutrho, k-points
-            self.startValue = list, initial value of convergeParam
-            self.stepSize = list, increment for convergeParam
-            self._results = array, 2 columns: 1 - convergeParam value, 
-                            2 - convergeUsing value
-            self._notConverged: bool, flag to store if converged solution 
-                                obtained
+            self.backend = Backend, runs the jobs of the study
+            self.executable = string, DFT executable eg. pw.x
+            self.cache = ResultCache, stores parsed results by input hash
+            self.monitor = JobMonitor, follows outputs of running points
+            self.journal = StudyJournal, records the points of the study
+            self.metrics = Metrics, timings and counters of the study
+            self.store = ResultStore, keeps the results of all the runs
+            self.retry = RetryPolicy, determined by retry
+            self.costModel = CostModel, determined by costModel
+            self.workDir = string, absolute path of the job directories
+            self.convergeParam = list of strings, variables to change for 
+                                 convergence study eg. ecutwfc, kpoints
+            self.startValue = list of arrays, initial value of each 
+                              convergeParam
+            self.stepSize = list of arrays, increment for each convergeParam,
+                            None for k-point grids planned by kGrids
+            self.kGrids = KGridPlanner, planned k-point grids, None if the
+                          k-point grid is stepped
+            self.convergedValue = list of arrays, value of each 
+                                  convergeParam needed for convergence
+            self._results = array, 1 column per convergeParam value (number
+                            of k-points for a k-point grid), last column - 
+                            convergeUsing value
+            self._records = list, [output file, record from OutputParser] 
+                            of every point
+            self.restartPrefix = string, QE prefix of the charge density
+                                 copied between points, None if points
+                                 start from scratch
+            self._features = dictionary, sizes of the sample input used by
+                             costModel, see cost_model.input_features
+            self._rotations = array, symmetries of the cell used to count
+                              the irreducible k-points of stepped grids,
+                              None if the cell cannot be read
+            self._kCounts = dictionary, k-point grid -> irreducible
+                            k-points, see kpoint_count
         """
         
-        self.inputFile = filename
+        self.inputFile = os.path.abspath(filename)
         self.convergeUsing = str(convCriterion)
         self.tolerance = float(tol)
         self.dftPackage = dftCode
-        self.convergeParam = ''
+        self.backend = backend
+        self.executable = executable
+        self.cache = cache
+        self.monitor = monitor
+        self.journal = journal
+        self.metrics = metrics
+        self.workDir = workDir
+        self.store = store
+        self.retry = retry
+        self.costModel = costModel
+        self.convergeParam = []
         self.startValue = []
         self.stepSize = []        
+        self.kGrids = None
+        self.convergedValue = []
         self._results= []
-        self._notConverged = True
+        self._records = []
+        self.restartPrefix = None
+        self._features = None
+        self._rotations = None
+        self._kCounts = {}
         
         # open input file to check if it exists
         try:
@@ -79,153 +209,900 @@ class Converger(object):
         if (self.tolerance <= 0):
             raise Exception('Value for tolerance must be greater than 0')
     
-    def start_convergence(self, convParm, startVal, step):
+        # set up the backend that runs the jobs
+        if self.backend == None:
+            self.backend = PBSBackend(coresPerJob=16)
+        elif isinstance(self.backend, str):
+            self.backend = get_backend(self.backend)
+        
+        if self.metrics == None:
+            self.metrics = Metrics()
+        if self.retry == None:
+            self.retry = RetryPolicy()
+        if self.workDir == None:
+            self.workDir = os.getcwd()
+        self.workDir = os.path.abspath(self.workDir)
+    
+    def start_convergence(self, convParm, startVal, step, batchSize=1, \
+                          adaptive=False, restart=False):
         """
         Run convergence study with the specified parameter, its initial value, 
         and increment size
         
         convParam: string, convergence is determined w.r.t. this variable eg.
-                   'kpoints', 'ke cutoff'
+                   'kpoints', 'kinetic energy cutoff' (or 'ecutwfc'), 
+                   'charge density cutoff' (or 'ecutrho'), 'smearing' (or
+                   'degauss'), which needs occupations = 'smearing' in the
+                   sample
         startVal: list, initial value for convParam eg. 'kpoints' - [4,4,4], 
-                  'ke cutoff' - [10]
+                  'ecutwfc' - [10]
         step: list, increment for convParam between two runs 
-              eg. 'kpoints' = [2,2,2], 'ke cutoff' - [1]
+              eg. 'kpoints' = [2,2,2], 'ecutwfc' - [1], 'degauss' - [-0.005]
+              'auto' for 'kpoints' walks the grids of KGridPlanner
+              instead, ordered by k-point density, from the first one at
+              least as dense as startVal
+        batchSize: int, number of points kept in the queue at once. With 
+                   batchSize > 1 the next points (startVal + k*step) are 
+                   submitted speculatively and the ones not needed are 
+                   cancelled once convergence is reached
+        adaptive: bool, fit the energies computed so far and jump to the 
+                  value where the tolerance is predicted to be met instead 
+                  of adding step every time
+        restart: bool, start the SCF of each point from the charge density
+                 of the nearest finished point (startingpot='file') instead
+                 of from atomic densities. outdir is set to a directory
+                 inside each job directory, where the density is copied.
+        """
+        self.start_joint_convergence([convParm], [startVal], [step], \
+                                     batchSize, adaptive, restart)
+    
+    def start_joint_convergence(self, convParms, startVals, steps, \
+                                batchSize=1, adaptive=False, restart=False):
+        """
+        Converge several parameters together eg. cutoff and k-point grid. 
+        The study is converged when one more step of any parameter changes 
+        the total energy by at most the tolerance. Points are scheduled by 
+        GridScheduler, cheapest first.
+        
+        convParms: list of strings, parameters, see start_convergence
+        startVals: list of lists, initial value of each parameter
+        steps: list of lists, increment of each parameter
+        batchSize: int, number of points kept in the queue at once
+        adaptive: bool, jump along each parameter to the predicted 
+                  converged value, see GridScheduler
+        restart: bool, start each point from the charge density of the
+                 nearest finished point, see start_convergence
+        """
+        modLinesList, slots = self.prepare_study(convParms, startVals, \
+                                                 steps, restart)
+        batchSize = int(batchSize)
+        if (batchSize < 1):
+            raise Exception('Batch size must be at least 1')
+        
+        # launch jobs and wait for them through one shared poller
+        with self.metrics.profile():
+            asyncio.run(self.run_points(modLinesList, slots, batchSize, \
+                                        adaptive))
+        
+        # print result, the plot is written to a file in self.workDir
+        self.print_results()
+        self.plot_results()
+    
+    def prepare_study(self, convParms, startVals, steps, restart=False):
+        """
+        Check the parameters of a study and prepare the sample input, see
+        start_joint_convergence
+        
+        returns: modLines, list of strings with the modified input, and
+                 slots, dictionary of parameter -> line number of its value
+        """
+        if (len(convParms) != len(startVals) or len(convParms) != len(steps)):
+            raise Exception('Each parameter needs a start value and a step')
+        
+        self.convergeParam = []
+        self.startValue = []
+        self.stepSize = []
+        for convParm, startVal, step in zip(convParms, startVals, steps):
+            self.add_parameter(convParm, startVal, step)
+        if (len(set(self.convergeParam)) != len(self.convergeParam)):
+            raise Exception('Each parameter can be converged only once')
+        
+        # read sample inputfile
+        qeInput = InputReader(self.inputFile)
+        qeInput.read_file()
+        
+        # planned k-point grids and the cost of stepped ones follow the
+        # symmetries of the cell
+        self.kGrids = None
+        self._rotations = None
+        self._kCounts = {}
+        for param, startValue, stepSize in zip(self.convergeParam, \
+                                               self.startValue, \
+                                               self.stepSize):
+            if stepSize is None:
+                self.kGrids = KGridPlanner(cell_from_input(qeInput), \
+                                           startValue)
+                self._rotations = self.kGrids.rotations
+            elif (param == 'kpoints'):
+                try:
+                    self._rotations = lattice_symmetries( \
+                                          cell_from_input(qeInput))
+                except Exception:
+                    # cells that cannot be read count every k-point
+                    self._rotations = None
+        
+        # each point keeps its density in its own outdir, from where it is
+        # copied to the points that start from it
+        self.restartPrefix = None
+        if restart:
+            prefix = qeInput.get_parameter('prefix')
+            self.restartPrefix = 'pwscf' if prefix is None else \
+                                 prefix.strip('\'"')
+            qeInput.set_parameter('outdir', "'./" + _restartDir + "/'", \
+                                  'control')
+            qeInput.set_parameter('startingpot', "'atomic'", 'electrons')
+        
+        self._features = None
+        if self.costModel is not None:
+            self._features = input_features(qeInput)
+        
+        modLines, slots = self.prepare_lines(qeInput)
+        if restart:
+            slots['startingpot'] = qeInput.find_line_number('startingpot')
+        return modLines, slots
+                
+    def print_results(self):
+        """
+        Print the value of each parameter needed for convergence
+        """
+        print('Convergence test completed!')
+        for param, value in zip(self.convergeParam, self.convergedValue):
+            if (param == 'kpoints'):
+                print('K-point grid needed for convergence: ' + \
+                      np.array2string(value))
+            else:
+                print('Value of ' + param + ' needed for convergence: ' + \
+                      '%g' % value[0])
+    
+    def add_parameter(self, convParm, startVal, step):
+        """ 
+        Check the start value and step of a convergence parameter and add it
+        to the study
+        
+        convParm: string, parameter, see start_convergence
+        startVal: list, initial value of the parameter
+        step: list, increment of the parameter
         """
         # check if convergence parameter is valid string          
-        self.convergeParam = str(convParm)
-        if (self.convergeParam != 'kpoints'):
-            raise Exception('Currently, only \'kpoints\' is supported')
-        else:
+        convParm = str(convParm)
+        convParm = _qeParams.get(convParm, convParm)
+        if convParm not in _qeParams.values():
+            raise Exception('Convergence parameter must be one of: ' + \
+                            ', '.join(sorted(_qeParams)))
+        
+        if (convParm == 'kpoints'):
             # set initial values for the k-point grid
             # TO DO: check for non-integer in array
-            self.startValue = np.array(startVal)
-            self.startValue = self.startValue.astype(int)
-            if (len(self.startValue) != 3):
+            startValue = np.array(startVal)
+            startValue = startValue.astype(int)
+            if (len(startValue) != 3):
                 raise Exception('k-point grid is input as [x,y,z]')
-            if (any(i < 0 for i in self.startValue)):
+            if (any(i < 0 for i in startValue)):
                 raise Exception('k-point grid value must be greater than 0')           
-            # set step size for k-point grid
+            # set step size for k-point grid, or plan the grids from the
+            # cell once the input is read
             # TO DO: check for non-integer values
-            self.stepSize = np.array(step)
-            self.stepSize = self.stepSize.astype(int)
-            if (len(self.stepSize) != 3):
-                raise Exception('k-point grid step is input as [x,y,z]')        
-            if (any(i < 0 for i in self.stepSize)):
-                raise Exception('k-point grid step must be greater than 0')
-              
-        # read sample inputfile
-        qeInput = InputReader(self.inputFile)
-        qeInput.read_file()
-        linesList = qeInput.get_lines_file()
-        lineNum = qeInput.find_line_number(self.convergeParam)
+            if isinstance(step, str):
+                if (step != 'auto'):
+                    raise Exception('k-point grid step is [x,y,z] or auto')
+                stepSize = None
+            else:
+                stepSize = np.array(step)
+                stepSize = stepSize.astype(int)
+                if (len(stepSize) != 3):
+                    raise Exception('k-point grid step is input as [x,y,z]')
+                if (any(i < 0 for i in stepSize)):
+                    raise Exception('k-point grid step must be greater ' + \
+                                    'than 0')
+        else:
+            # cutoffs and smearing are single values
+            startValue = np.array(startVal, dtype=float).reshape(-1)
+            if (len(startValue) != 1 or startValue[0] <= 0):
+                raise Exception(convParm + ' is input as [x] with x > 0')
+            stepSize = np.array(step, dtype=float).reshape(-1)
+            if (len(stepSize) != 1 or stepSize[0] == 0):
+                raise Exception(convParm + ' step is input as [x], x != 0')
+        
+        self.convergeParam.append(convParm)
+        self.startValue.append(startValue)
+        self.stepSize.append(stepSize)
+    
+    def prepare_lines(self, qeInput):
+        """
+        Set up the sample input so that each convergence parameter has a 
+        line of its own that can be changed for every point
+        
+        qeInput: InputReader, sample input that has been read
+        
+        returns: modLines, list of strings with the modified input, and 
+                 slots, dictionary of parameter -> line number of its value
+        """
+        # the smearing is only used with smeared occupations
+        if ('degauss' in self.convergeParam):
+            occupations = qeInput.get_parameter('occupations')
+            if (occupations is None or \
+                occupations.strip('\'"').lower() != 'smearing'):
+                raise Exception("Converging degauss needs " + \
+                                "occupations = 'smearing' in the sample")
+        
+        # namelist parameters missing from the sample are added to &system
+        for param in self.convergeParam:
+            if (param != 'kpoints' and qeInput.get_parameter(param) is None):
+                qeInput.set_parameter(param, '0', 'system')
+        
+        # k-point convergence requires the k-points to be generated 
+        # automatically, any other k-point card is changed to automatic
+        if ('kpoints' in self.convergeParam):
+            if qeInput.get_card('K_POINTS') is None:
+                raise Exception('Sample input has no K_POINTS card')
+            qeInput.set_card('K_POINTS', 'automatic', ['0 0 0 0 0 0\n'])
+        
+        # line numbers are final once all the lines have been added
+        slots = {}
+        for param in self.convergeParam:
+            slots[param] = qeInput.find_line_number(param)
+        if ('kpoints' in slots):
+            slots['kpoints'] += 1
+        
+        return qeInput.get_lines_file(), slots
+    
+    def point_values(self, point):
+        """
+        Returns list of the value of each parameter at a point of the grid
+        
+        point: tuple, index of the point along each parameter
+        """
+        return [self.axis_value(axis, index) \
+                for axis, index in enumerate(point)]
+    
+    def axis_value(self, axis, index):
+        """
+        Returns value of a parameter at an index along its axis (array)
+        
+        axis: int, position of the parameter in self.convergeParam
+        index: int, index of the point along the parameter
+        """
+        if self.stepSize[axis] is None:
+            return self.kGrids.grid(index)
+        return self.startValue[axis] + index*self.stepSize[axis]
+    
+    def point_valid(self, point):
+        """
+        Check if a point can be run: cutoffs and smearing must stay above
+        0, which a negative step or an adaptive jump may not respect
+        
+        point: tuple, index of the point along each parameter
+        
+        returns: bool, True if every value of the point is allowed
+        """
+        for axis, param in enumerate(self.convergeParam):
+            if (param != 'kpoints' and \
+                self.axis_value(axis, point[axis])[0] <= 0):
+                return False
+        return True
+    
+    def point_features(self, point):
+        """
+        Returns sizes of the run of a point (dictionary), those of the
+        sample input (see cost_model.input_features) with the irreducible
+        k-points and the cutoffs of the point
+        
+        point: tuple, index of the point along each parameter
+        """
+        features = dict(self._features or {})
+        for axis, (param, value) in enumerate(zip(self.convergeParam, \
+                                                  self.point_values(point))):
+            if self.stepSize[axis] is None:
+                features['kpoints'] = self.kGrids.count(point[axis])
+            elif (param == 'kpoints'):
+                features['kpoints'] = self.kpoint_count(value)
+            elif (param in ('ecutwfc', 'ecutrho')):
+                features[param] = float(value[0])
+        return features
+    
+    def kpoint_count(self, grid):
+        """
+        Returns number of irreducible k-points of a stepped grid (int),
+        every k-point of the grid if the cell cannot be read
+        
+        grid: array, divisions along each reciprocal lattice vector
+        """
+        grid = tuple(int(i) for i in np.maximum(grid, 1))
+        if grid not in self._kCounts:
+            if self._rotations is None:
+                self._kCounts[grid] = int(np.prod(grid))
+            else:
+                self._kCounts[grid] = irreducible_count(grid, \
+                                                        self._rotations)
+        return self._kCounts[grid]
+    
+    def point_cost(self, point):
+        """
+        Estimate the relative cost of a point, proportional to the number of
+        irreducible k-points of the grid times the number of plane waves
+        (ecut^1.5). Once self.costModel has learnt from runs, the cost is
+        the wall time it predicts.
+        
+        point: tuple, index of the point along each parameter
+        
+        returns: float, relative cost
+        """
+        features = self.point_features(point)
+        if self.costModel is not None:
+            seconds = self.costModel.predict_time(features, \
+                                                  self.backend.coresPerJob)
+            if seconds is not None:
+                return seconds
+        
+        cost = 1.0
+        for param in self.convergeParam:
+            if (param == 'kpoints'):
+                cost *= float(features['kpoints'])
+            elif (param in ('ecutwfc', 'ecutrho')):
+                cost *= features[param]**1.5
+        return cost
+    
+    def point_params(self, point):
+        """
+        Queue options of the job of a point, with the time limit that
+        self.costModel asks for the point. The cores stay those of
+        self.backend.
+        
+        point: tuple, index of the point along each parameter
+        
+        returns: string, None if the backend options are used unchanged
+        """
+        if self.costModel is None:
+            return None
+        seconds = self.costModel.request_time(self.point_features(point), \
+                                              self.backend.coresPerJob)
+        if seconds is None:
+            return None
+        option = '--time=' if isinstance(self.backend, SlurmBackend) \
+                 else '-l walltime='
+        return set_walltime(self.backend.params, seconds, option)
+    
+    def point_measure(self, axis, index):
+        """
+        Size of a parameter used to fit the energy with a power law: the 
+        cutoff, k-points per direction (geometric mean) for a k-point grid, 
+        and the inverse of the smearing
+        
+        axis: int, position of the parameter in self.convergeParam
+        index: int, index of the point along the parameter
+        
+        returns: float, size of the parameter
+        """
+        param = self.convergeParam[axis]
+        value = self.axis_value(axis, index)
+        if (param == 'kpoints'):
+            return float(np.prod(np.maximum(value, 1)))**(1.0/3.0)
+        if (param == 'degauss'):
+            return 1.0/value[0] if value[0] > 0 else float('inf')
+        return float(value[0])
+    
+    async def run_points(self, modLines, slots, batchSize, adaptive=False, \
+                         engine=None):
+        """
+        Submit points until the convergence criterion is met, keeping 
+        batchSize jobs in the queue
+        
+        modLines: list of strings, sample input prepared by prepare_lines
+        slots: dictionary, parameter -> line number of its value
+        batchSize: int, number of points kept in the queue at once
+        adaptive: bool, let the scheduler jump to predicted converged values
+        engine: JobEngine, shared with other studies eg. by a Campaign, a
+                new engine for self.backend if None
+        """
+        ownEngine = engine is None
+        if ownEngine:
+            engine = JobEngine(self.backend)
+        template = InputTemplate(modLines, slots)
+        sched = GridScheduler(len(self.convergeParam), self.tolerance, \
+                              batchSize, self.point_cost, adaptive, \
+                              self.point_measure, valid=self.point_valid)
+        
+        # point -> [task, handle, output file path, cache key] of every 
+        # submitted point still running
+        running = {}
+        # [point, job directory] of finished points, whose density the next
+        # points start from
+        seeds = None
+        if self.restartPrefix is not None:
+            seeds = []
+        # point -> [job directory, input file, output file, lines of input],
+        # and number of times it was submitted again after failing
+        pointJobs = {}
+        attempts = {}
+        # point -> queue options of its last run when they differ from those
+        # of the backend
+        pointParams = {}
+        # output file -> handle of running points, followed by the monitor
+        watched = {}
+        if self.monitor is not None:
+            watcher = asyncio.ensure_future(self.watch_points(engine, \
+                                                              watched))
+        
+        while not sched.is_converged():
+            # keep batchSize points in the queue, their inputs are written 
+            # together
+            try:
+                points = sched.next_points(len(running))
+            except Exception:
+                # the next point cannot be run eg. degauss <= 0
+                for entry in running.values():
+                    await self.cancel_point(engine, entry[1], entry[2])
+                raise
+            jobs = self.write_points(template, points, seeds)
+            for point, job in zip(points, jobs):
+                pointJobs[point] = job
+                params = self.point_params(point)
+                if params is not None:
+                    pointParams[point] = params
+                handle, outPath, key, result = await self.submit_point( \
+                                                    engine, *job, params)
+                if result is not None:
+                    # cached, nothing was submitted
+                    self.add_result(sched, point, outPath, result)
+                else:
+                    running[point] = [asyncio.ensure_future(handle), \
+                                      handle, outPath, key]
+                    watched[outPath] = handle
+            
+            if not running:
+                continue
+            
+            # check convergence as soon as any point finishes
+            done = (await asyncio.wait([entry[0] for entry in \
+                                        running.values()], \
+                    return_when=asyncio.FIRST_COMPLETED))[0]
+            for point in [p for p in running if running[p][0] in done]:
+                task, handle, outPath, key = running.pop(point)
+                if task.exception() is not None:
+                    # the queue could not be queried, the job may still run
+                    for entry in running.values():
+                        await self.cancel_point(engine, entry[1], entry[2])
+                    raise task.exception()
+                watched.pop(outPath, None)
+                if self.monitor is not None:
+                    self.monitor.forget(outPath)
+                
+                # parse output file after job finishes and update results
+                result = self.harvest_point(outPath, key)
+                outcome = classify_outcome(result, read_scheduler_errors( \
+                              os.path.dirname(outPath), handle.jobId))
+                if outcome != OK:
+                    # a failed point never reaches the scheduler
+                    self.metrics.count('jobs failed')
+                    attempt = attempts.get(point, 0)
+                    if not self.retry.should_retry(outcome, attempt):
+                        for entry in running.values():
+                            await self.cancel_point(engine, entry[1], \
+                                                    entry[2])
+                        raise Exception('Point failed (' + outcome + \
+                                        '): ' + outPath)
+                    attempts[point] = attempt + 1
+                    option = '--time=' \
+                             if isinstance(self.backend, SlurmBackend) \
+                             else '-l walltime='
+                    pointParams[point] = self.retry.adjust_params( \
+                        pointParams.get(point, self.backend.params), \
+                        outcome, option)
+                    handle, outPath, key, result = await self.retry_point( \
+                        engine, pointJobs[point], outcome, attempt, \
+                        pointParams[point])
+                    if result is None:
+                        running[point] = [asyncio.ensure_future(handle), \
+                                          handle, outPath, key]
+                        watched[outPath] = handle
+                        continue
                 
-        # modify k-point input card
-        # TO DO: make it generic
-        if (self.convergeParam == 'kpoints'):
-            modLinesList = self.modify_kpoint_card(linesList, lineNum)
+                self.add_result(sched, point, outPath, result)
+                self.store_point(point, outPath, result)
+                if self.costModel is not None:
+                    self.costModel.add_record(result)
+                if seeds is not None:
+                    seeds.append([point, os.path.dirname(outPath)])
+            
+            # points the scheduler moved past are not needed any more
+            for point in sched.obsolete(list(running)):
+                task, handle, outPath, key = running.pop(point)
+                watched.pop(outPath, None)
+                await self.cancel_point(engine, handle, outPath)
+        
+        # speculative jobs beyond the converged point are not needed
+        for task, handle, outPath, key in running.values():
+            await self.cancel_point(engine, handle, outPath)
+        
+        if self.monitor is not None:
+            watcher.cancel()
+        if self.store is not None:
+            self.store.flush()
+        if self.costModel is not None:
+            self.costModel.save()
+        
+        # the status calls of a shared engine are counted by its owner
+        if ownEngine:
+            self.metrics.count('status calls', engine.statusCalls)
+        self.convergedValue = self.point_values(sched.converged_point())
+    
+    def harvest_point(self, outPath, key):
+        """
+        Parse the output of a finished point and store the result in the
+        cache and the journal
+        
+        outPath: string, path of the output file
+        key: string, cache key of the input, None if there is no cache
+        
+        returns: dictionary, record from OutputParser
+        """
+        # time from submission to the end of the job, of which the run time
+        # is printed by the code and the rest was spent in the queue
+        turnaround = self.metrics.stop(outPath, 'turnaround')
+        
+        # a job that never ran leaves no output
+        result = {}
+        if os.path.exists(outPath):
+            with self.metrics.span(outPath, 'parse'):
+                readOut = OutputParser(self.dftPackage)
+                readOut.parse_op_file(outPath)
+                result = readOut.get_record()
+        
+        if result.get('wall time') is not None:
+            self.metrics.record(outPath, 'run', result['wall time'])
+            if turnaround is not None:
+                self.metrics.record(outPath, 'queue wait', \
+                                    max(0.0, turnaround - result['wall time']))
+        
+        # only keep runs that converged
+        if self.cache is not None and classify_outcome(result) == OK:
+            self.cache.put(key, result)
+        if self.journal is not None:
+            self.journal.finished(outPath, result)
+        
+        return result
+    
+    async def cancel_point(self, engine, handle, outPath):
+        """
+        Remove the job of a point from the queue and record it in the
+        journal
+        
+        engine: JobEngine, used to cancel the job
+        handle: JobHandle, returned by submit_point
+        outPath: string, path of the output file
+        """
+        if handle.done():
+            return
+        await engine.cancel(handle)
+        if self.journal is not None:
+            self.journal.cancelled(outPath)
+    
+    def add_result(self, sched, point, outPath, result):
+        """
+        Store the result of a finished point and pass its energy to the 
+        scheduler
+        
+        sched: GridScheduler, scheduler of the study
+        point: tuple, index of the point along each parameter
+        outPath: string, path of the output file
+        result: dictionary, record from OutputParser
+        """
+        # k-point grids are stored as the number of k-points used
+        row = []
+        for param, value in zip(self.convergeParam, self.point_values(point)):
+            if (param == 'kpoints'):
+                row.append(result['kpoints'])
+            else:
+                row.append(float(value[0]))
+        
+        # store output in results array
+        self._results.append(row + [result['total energy']])
+        self._records.append([outPath, result])
+        sched.add_result(point, result['total energy'])
+    
+    def store_point(self, point, outPath, result):
+        """
+        Add the result of a run to self.store with the value of every
+        parameter at the point, and the cutoff and k-point grid of its input
+        when they are not varied. Results reused from the cache or the
+        journal are stored already.
+        
+        point: tuple, index of the point along each parameter
+        outPath: string, path of the output file
+        result: dictionary, record from OutputParser
+        """
+        if self.store is None:
+            return
+        # the input of a job is next to its output, in.<job> and out.<job>
+        outDir, outFile = os.path.split(outPath)
+        qeInput = InputReader(os.path.join(outDir, 'in.' + \
+                                           outFile[len('out.'):]))
+        qeInput.read_file()
+        params = dict(zip(self.convergeParam, self.point_values(point)))
+        self.store.add(outPath, result, os.path.basename(self.inputFile), \
+                       params, qeInput)
+    
+    async def watch_points(self, engine, running):
+        """
+        Follow the outputs of running points with self.monitor and cancel 
+        the points whose SCF diverges
+        
+        engine: JobEngine, used to cancel jobs
+        running: dictionary, output file -> JobHandle of running points, 
+                 updated by run_points
+        """
+        while True:
+            await asyncio.sleep(self.monitor.interval)
+            
+            for outPath in list(running):
+                self.monitor.follow(outPath)
+            self.monitor.update()
+            
+            for outPath in self.monitor.diverging():
+                self.monitor.forget(outPath)
+                handle = running.pop(outPath, None)
+                if handle is not None:
+                    print('SCF diverging, job cancelled: ' + outPath)
+                    await engine.cancel(handle)
+    
+    def write_points(self, template, points, seeds=None):
+        """
+        Create the job directories and write the input files of several 
+        points of the convergence grid in one batch
+        
+        template: InputTemplate, sample input prepared by prepare_lines 
+                  with a slot for each parameter
+        points: list of tuples, index of each point along each parameter
+        seeds: list of [point, job directory] of finished points to restart
+               from, see stage_density, points start from scratch if None
         
-        while self._notConverged:
-            # create input file for job
+        returns: list of [job directory, input file, output file, lines of 
+                 input] for each point
+        """
+        start = time.perf_counter()
+        jobs = []
+        variants = []
+        for point in points:
+            values = self.point_values(point)
+            
             # for each value, a separate folder is created and all the files
             # relevant to the run are stored in it
-            jobStr = self.convergeParam + '_' + \
-                      np.array2string(self.startValue,separator='_')[1:-1]
-            workDir = os.getcwd()
-            jobPath = workDir + '/' + jobStr
+            jobStr = '_'.join(param + '_' + self.value_string(value, '_') \
+                              for param, value in \
+                              zip(self.convergeParam, values))
+            jobPath = os.path.join(self.workDir, jobStr)
             inpFile = 'in.' + jobStr
             outFile = 'out.' + jobStr
             
             # create job directory
             if not os.path.exists(jobPath):
                 os.makedirs(jobPath)            
-            os.chdir(jobPath)
-            
-            # change convParam value
-            if (self.convergeParam == 'kpoints'):
-                modLinesList[lineNum+1] = \
-                np.array2string(self.startValue,separator=' ')[1:-1] + \
-                ' 0 0 0\n'
-            
-            # create new input files with changed convParam
-            newInput = InputWriter(inpFile, modLinesList)
-            newInput.write_lines_to_file()
-            
-            # launch task
-            task = JobLauncher('mpirun -np 16 pw.x', inpFile, outFile)
-            task.job_run()
-            
-            # parse output file after job finishes and update results
-            readOut = OutputParser(self.dftPackage)
-            readOut.parse_op_file(outFile)
-            
-            # store output in results array
-            # TO DO: retrieve the relevant convergeParam (make generic)
-            self._results.append([readOut.get_kpoints(), \
-                                  readOut.get_totenergy()])
-            
-            # check convergence
-            if(len(self._results) >= 2):
-                deltaTotEnergy = abs(self._results[-1][1] - \
-                                     self._results[-2][1])
-            
-            if (deltaTotEnergy <= self.tolerance):
-                # total energy has converged
-                self._notConverged = False
-            else:
-                # update convParam and set up new calculation
-                os.chdir(workDir)
-                self.startValue += self.stepSize
-                    
-        # print, plot result
-        print('Convergence test completed!')
-        if (self.convergeParam == 'kpoints'):
-            print('K-point grid needed for convergence: ' + self.startValue)
-        self.plot_results()
-              
-    # TO DO: make it DFT package independent
-    def modify_kpoint_card(self,lines,lineNum):
-        """ 
-        Modify k-point card to generate k-points automatically
+            
+            # change convParam values, parameters that share a line of the
+            # template are all changed in that one line
+            slotLines = {}
+            changes = []
+            for param, value in zip(self.convergeParam, values):
+                if (param == 'kpoints'):
+                    slotLines[param] = self.value_string(value, ' ') + \
+                                       ' 0 0 0\n'
+                else:
+                    changes.append([param, self.value_string(value, ' ')])
+            
+            # start from the density of the nearest finished point
+            if seeds is not None:
+                staged = self.stage_density(point, jobPath, seeds)
+                changes.append(['startingpot', "'file'" if staged else \
+                                                "'atomic'"])
+            
+            for param, value in changes:
+                line = slotLines.get(param, \
+                                     template.lines[template.slots[param]])
+                line = InputReader.replace_value(line, param, value)
+                for name, lineNum in template.slots.items():
+                    if lineNum == template.slots[param]:
+                        slotLines[name] = line
+            
+            jobs.append([jobPath, inpFile, outFile])
+            variants.append([jobPath + '/' + inpFile, slotLines])
+            
+        # create new input files with changed convParam
+        texts = template.write_batch(variants)
+        for job, text in zip(jobs, texts):
+            job.append(text.splitlines(True))
         
-        Note: k-point convergence requires the k-points to be generated 
-        automatically. Any other method of specifying k-points needs to be 
-        changed to automatic mode.
+        # the batch is written at once, each point gets an equal share
+        seconds = (time.perf_counter() - start)/max(1, len(jobs))
+        for [jobPath, inpFile, outFile, jobLines] in jobs:
+            self.metrics.record(jobPath + '/' + outFile, 'input', seconds)
+        return jobs
+    
+    def stage_density(self, point, jobPath, seeds):
+        """
+        Copy the charge density of the finished point nearest to point into
+        the outdir of jobPath
         
-        lines: list of strings, lines of sample input
-        lineNum: int, line number at which k-point card begins
+        point: tuple, index of the point along each parameter
+        jobPath: string, job directory of point
+        seeds: list of [point, job directory] of finished points
         
-        returns: modLines, list of strings containing modified k-point card
+        returns: bool, True if a density was copied
+        """
+        saveDir = self.restartPrefix + '.save'
+        for seed, seedPath in sorted(seeds, key=lambda seed: \
+                                     sum(abs(i - j) for i, j in \
+                                         zip(seed[0], point))):
+            files = []
+            for pattern in _densityFiles:
+                files += glob.glob(os.path.join(seedPath, _restartDir, \
+                                                saveDir, pattern))
+            if files:
+                target = os.path.join(jobPath, _restartDir, saveDir)
+                if not os.path.exists(target):
+                    os.makedirs(target)
+                for name in files:
+                    shutil.copy2(name, target)
+                return True
+        return False
+            
+    async def retry_point(self, engine, job, outcome, attempt, params=None):
         """
-        modLines = lines.copy()
-        # kptOption can be 'gamma', 'automatic', or a list of k-points
-        kptOption = modLines[lineNum].split()[1]
+        Submit a failed point again after the delay of self.retry, with the
+        input changed as self.retry asks. The output of the failed run is
+        kept as <output>.failed<attempt>.
         
-        if kptOption == 'gamma':
-            # add a line with k-point grid since gamma takes no params
-            modLines[lineNum] = 'K_POINTS automatic\n'
-            if lineNum == len(lines)-1 :
-                modLines.append('0 0 0 0 0 0\n')
-            else:
-                modLines.insert(lineNum+1,'0 0 0 0 0 0\n')
-        elif kptOption == 'automatic':
-            modLines[lineNum+1] = '0 0 0 0 0 0\n'
-        else:
-            # the list of k-points specified has to be deleted
-            modLines[lineNum] = 'K_POINTS automatic\n'
-            kptNum = int(lines[lineNum+1])
-            modLines[lineNum+1] = '0 0 0 0 0 0\n'
-            del modLines[lineNum+2:lineNum+2+kptNum]
+        engine: JobEngine, used to submit the job
+        job: list, [job directory, input file, output file, lines of input]
+             from write_points
+        outcome: string, how the failed run ended
+        attempt: int, number of times the point was submitted again so far
+        params: string, queue options of the new run eg. with a longer time
+                limit from self.retry.adjust_params, default is
+                self.backend.params
         
-        return modLines
+        returns: list, see submit_point
+        """
+        jobPath, inpFile, outFile = job[:3]
+        await asyncio.sleep(self.retry.delay_for(attempt))
+        
+        outPath = os.path.join(jobPath, outFile)
+        if os.path.exists(outPath):
+            os.replace(outPath, outPath + '.failed' + str(attempt + 1))
+        inPath = os.path.join(jobPath, inpFile)
+        qeInput = InputReader(inPath)
+        qeInput.read_file()
+        jobLines = qeInput.get_lines_file()
+        if self.retry.adjust_input(qeInput, outcome):
+            jobLines = qeInput.get_lines_file()
+            InputWriter(inPath, jobLines).write_lines_to_file()
+        
+        self.metrics.count('jobs retried')
+        return await self.submit_point(engine, jobPath, inpFile, outFile, \
+                                       jobLines, params)
     
-    def plot_results(self):
+    async def submit_point(self, engine, jobPath, inpFile, outFile, \
+                           jobLines, params=None):
+        """
+        Submit the job of one point written by write_points without waiting.
+        Nothing is submitted if the result cache already has this input, or
+        if the journal shows that the point was submitted before: a job
+        still in the queue is followed again, and the output of a job that
+        has finished is parsed. A job that left the queue without a result
+        is submitted again.
+            
+        engine: JobEngine, used to submit the job
+        jobPath: string, job directory
+        inpFile: string, name of the input file in jobPath
+        outFile: string, name of the output file in jobPath
+        jobLines: list of strings, lines of the input file
+        params: string, queue options of the job, default is
+                self.backend.params
+            
+        returns: list, JobHandle for the submitted job (None on a cache 
+                 hit), path of its output file, cache key, cached result 
+                 (None on a cache miss)
+        """
+        outPath = jobPath + '/' + outFile
+        
+        # skip the run if the same input was computed before
+        key = None
+        if self.cache is not None:
+            key = self.cache.input_key(jobLines, jobPath)
+            result = self.cache.get(key)
+            if result is not None:
+                self.metrics.count('cache hits')
+                return [None, outPath, key, result]
+        
+        # pick up where a previous run of the study stopped
+        entry = None
+        if self.journal is not None:
+            entry = self.journal.get(outPath)
+        if entry is not None and entry['status'] == 'finished' and \
+           classify_outcome(entry['result']) == OK:
+            return [None, outPath, key, entry['result']]
+        if entry is not None and entry['status'] == 'submitted':
+            handle = await engine.attach(entry['job'], owner=self)
+            if handle is not None:
+                self.metrics.start(outPath, 'turnaround')
+                return [handle, outPath, key, None]
+            if os.path.exists(outPath):
+                result = self.harvest_point(outPath, key)
+                if classify_outcome(result) == OK:
+                    return [None, outPath, key, result]
+            
+        # launch task, a failed submission is tried again after a delay
+        attempt = 0
+        while True:
+            try:
+                with self.metrics.span(outPath, 'submit'):
+                    handle = await engine.submit( \
+                                    self.backend.command(self.executable), \
+                                    inpFile, outFile, jobPath, owner=self, \
+                                    params=params)
+                break
+            except Exception:
+                if not self.retry.should_retry(SUBMIT_FAILED, attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay_for(attempt))
+                attempt += 1
+        self.metrics.start(outPath, 'turnaround')
+        self.metrics.count('jobs submitted')
+        if self.journal is not None:
+            self.journal.submitted(outPath, handle.jobId, key)
+                    
+        return [handle, outPath, key, None]
+              
+    @staticmethod
+    def value_string(value, separator):
+        """ 
+        Returns value of a parameter as a string eg. '4 4 4' for a k-point 
+        grid, '30' for a cutoff
         """
-        Plot results of convergence tests
+        return separator.join('%g' % v for v in value)
+        
+    def get_results_table(self):
         """
-        results = np.asarray(self._results)
-        plt.plot(results[:,0],results[:,1],'ro-',linewidth=2,markersize=10)
-        plt.xlabel(self.convergeParam)
-        plt.ylabel(self.convergeUsing)
-        plt.title('Convergence test')
-        plt.show()
-        
\ No newline at end of file
+        Returns all the properties of every point as a dictionary of NumPy 
+        arrays with one row per point, see bulk_parser.records_to_table
+        """
+        return records_to_table([record[0] for record in self._records], \
+                                [record[1] for record in self._records])
+    
+    def get_summary(self):
+        """
+        Returns summary of the study for the report module (dictionary), see
+        report.make_summary
+        """
+        from report import make_summary
+        
+        return make_summary(os.path.basename(self.inputFile), \
+                            self.convergeParam, self.convergeUsing, \
+                            self._results, self.convergedValue)
+    
+    def plot_results(self, outFile=None):
+        """
+        Plot results of convergence tests to a file, no display is needed.
+        For a joint study the energy is plotted against the first parameter,
+        one line per value of the others.
+        
+        outFile: string, image or .html report, its extension sets the
+                 format, default is convergence.png in self.workDir
+        
+        returns: string, file written
+        """
+        # matplotlib is only imported by the report module when plotting
+        from report import render_reports
+        
+        if outFile is None:
+            outFile = os.path.join(self.workDir, 'convergence.png')
+        return render_reports([self.get_summary()], [outFile])[0]
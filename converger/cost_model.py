@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predict the wall time and memory of QE runs from the runs done before
+
+@author: abishekk
+"""
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+from kgrid_planner import cell_from_input, irreducible_count, \
+                          lattice_symmetries
+from output_parser import OutputParser
+
+# sizes of a run, in the order of the fitted exponents
+_features = ('kpoints', 'ecutwfc', 'atoms', 'processors')
+
+# exponents expected when there are few runs: time grows with the k-points,
+# the plane waves (ecut^1.5) and about the square of the atoms, and falls
+# with the processors; memory is summed over processes and does not
+# depend on them
+_timePrior = (1.0, 1.5, 2.0, -1.0)
+_memoryPrior = (0.0, 1.5, 2.0, 0.0)
+
+# core counts in queue options: PBS 'ppn=16' or 'ncpus=16', Slurm
+# '--ntasks=16' or '-n 16'
+_corePattern = re.compile(r'(ppn=|ncpus=|--ntasks[= ]|-n\s+)(\d+)')
+
+def input_features(qeInput):
+    """
+    Returns sizes of the run of an input (dictionary): irreducible k-points
+    (see kgrid_planner.irreducible_count), ecutwfc and atoms
+    
+    qeInput: InputReader, input read with read_file
+    """
+    features = {'kpoints': 1, 'ecutwfc': None, 'atoms': None}
+    for key, param in (('ecutwfc', 'ecutwfc'), ('atoms', 'nat')):
+        value = qeInput.get_parameter(param)
+        if value is not None:
+            features[key] = float(value.lower().replace('d', 'e'))
+    
+    card = qeInput.get_card('K_POINTS')
+    if card is not None and card[0] == 'automatic':
+        words = card[1][0].split()
+        grid = [int(word) for word in words[:3]]
+        shift = [int(word) for word in words[3:6]] or [0, 0, 0]
+        try:
+            rotations = lattice_symmetries(cell_from_input(qeInput))
+        except Exception:
+            # cells that cannot be read count every k-point of the grid
+            features['kpoints'] = int(np.prod(grid))
+        else:
+            features['kpoints'] = irreducible_count(grid, rotations, shift)
+    elif card is not None and card[0] != 'gamma' and card[1]:
+        features['kpoints'] = int(card[1][0].split()[0])
+    return features
+
+def set_cores(params, cores):
+    """
+    Set the number of cores in queue options
+    
+    params: string, options passed to the queue manager eg.
+            '-l nodes=1:ppn=16'
+    cores: int, new number of cores
+    
+    returns: string, params with the new number of cores, unchanged if it
+             has none
+    """
+    return _corePattern.sub(lambda match: match.group(1) + str(cores), params)
+
+class CostModel(object):
+    """
+    Class to learn the wall time and memory of runs from their outputs. Both
+    are fitted to power laws of the irreducible k-points, ecutwfc, atoms
+    and processors of each run,
+        log(time) = c + a*log(kpoints) + b*log(ecutwfc) + ...
+    with the exponents pulled towards those expected for plane wave codes,
+    so that a few runs that differ only in one size still give sensible
+    predictions for the others.
+    
+    Usage:
+        model = CostModel('cost.json')
+        model.add_output('out.pw.si')
+        model.predict_time({'kpoints': 10, 'ecutwfc': 30, 'atoms': 2}, 16)
+        model.request_time(features, 16)
+        model.save()
+    """
+    
+    def __init__(self, modelFile=None, weight=1.0, safety=1.5, \
+                 minTime=300.0, maxTime=None, memoryPerCore=None):
+        """
+        Initializes a cost model, with the runs saved in modelFile
+        
+        modelFile: string, JSON file with the runs learnt so far, read if
+                   it exists and written by save, runs are not kept if None
+        weight: float, how strongly the exponents are pulled towards the
+                expected ones, 0 for a plain least squares fit
+        safety: float, factor between the predicted time and the time
+                limit asked for, see request_time
+        minTime: float, shortest time limit in s asked for
+        maxTime: float, longest wall time in s a run should take, see
+                 choose_cores, not checked if None
+        memoryPerCore: float, memory in MB of each core, see choose_cores,
+                       not checked if None
+        
+        Has 8 attributes:
+            self.modelFile: string, determined by modelFile
+            self.weight: float, determined by weight
+            self.safety: float, determined by safety
+            self.minTime: float, determined by minTime
+            self.maxTime: float, determined by maxTime
+            self.memoryPerCore: float, determined by memoryPerCore
+            self.runs: list of [kpoints, ecutwfc, atoms, processors, wall
+                       time, memory] of every run learnt
+            self._fits: dictionary, 'time'/'memory' -> fitted coefficients,
+                        emptied when a run is learnt
+        """
+        self.modelFile = modelFile
+        self.weight = float(weight)
+        self.safety = float(safety)
+        self.minTime = float(minTime)
+        self.maxTime = maxTime
+        self.memoryPerCore = memoryPerCore
+        self.runs = []
+        self._fits = {}
+        
+        if self.modelFile is not None and os.path.exists(self.modelFile):
+            with open(self.modelFile, 'r') as fileptr:
+                self.runs = json.load(fileptr)['runs']
+    
+    def add_record(self, record):
+        """
+        Learn the cost of a run from its record
+        
+        record: dictionary, record from OutputParser
+        
+        returns: bool, True if the record had a wall time and the sizes of
+                 the run
+        """
+        if not record.get('wall time') or not record.get('kpoints') or \
+           not record.get('ecutwfc') or not record.get('atoms'):
+            return False
+        self.runs.append([int(record['kpoints']), float(record['ecutwfc']), \
+                          int(record['atoms']), \
+                          int(record.get('processors') or 1), \
+                          float(record['wall time']), record.get('memory')])
+        self._fits = {}
+        return True
+    
+    def add_output(self, outPath):
+        """
+        Learn the cost of a run from its output file, see add_record
+        """
+        readOut = OutputParser('qe')
+        readOut.parse_op_file(outPath)
+        return self.add_record(readOut.get_record())
+    
+    def save(self):
+        """
+        Write the runs learnt so far to self.modelFile
+        """
+        if self.modelFile is None:
+            return
+        tmpFile = self.modelFile + '.tmp'
+        with open(tmpFile, 'w') as fileptr:
+            json.dump({'runs': self.runs}, fileptr)
+        os.replace(tmpFile, self.modelFile)
+    
+    def fit(self, column, prior):
+        """
+        Fit a column of the runs to a power law of the sizes
+        
+        column: int, 4 for the wall time, 5 for the memory
+        prior: tuple, exponents expected for each size
+        
+        returns: array, log of the constant followed by the exponents, None
+                 if no run has the column
+        """
+        rows = [run for run in self.runs if run[column]]
+        if not rows:
+            return None
+        sizes = np.log(np.array([run[:4] for run in rows], dtype=float))
+        design = np.hstack([np.ones((len(rows), 1)), sizes])
+        values = np.log(np.array([run[column] for run in rows], dtype=float))
+        
+        # extra rows pull each exponent towards its prior
+        penalty = math.sqrt(self.weight)*np.hstack([np.zeros((4, 1)), \
+                                                    np.eye(4)])
+        design = np.vstack([design, penalty])
+        values = np.concatenate([values, \
+                                 math.sqrt(self.weight)*np.array(prior)])
+        return np.linalg.lstsq(design, values, rcond=None)[0]
+    
+    def predict(self, name, features, cores):
+        """
+        Returns predicted wall time in s or memory in MB of a run (float),
+        None if no run was learnt yet
+        
+        name: string, 'time' or 'memory'
+        features: dictionary, sizes of the run, see input_features
+        cores: int, processors of the run
+        """
+        if name not in self._fits:
+            if name == 'time':
+                self._fits[name] = self.fit(4, _timePrior)
+            else:
+                self._fits[name] = self.fit(5, _memoryPrior)
+        coefs = self._fits[name]
+        sizes = [features.get(key) for key in _features[:3]] + [cores]
+        if coefs is None or not all(sizes):
+            return None
+        return float(math.exp(coefs[0] + np.dot(coefs[1:], \
+                                                np.log(np.array(sizes, \
+                                                       dtype=float)))))
+    
+    def predict_time(self, features, cores):
+        """
+        Returns predicted wall time of a run in s (float), see predict
+        """
+        return self.predict('time', features, cores)
+    
+    def predict_memory(self, features, cores):
+        """
+        Returns predicted memory of a run in MB (float), see predict
+        """
+        return self.predict('memory', features, cores)
+    
+    def request_time(self, features, cores):
+        """
+        Returns time limit to ask for a run in s (float), the predicted
+        time times self.safety rounded up to minutes, None if no run was
+        learnt yet
+        """
+        seconds = self.predict_time(features, cores)
+        if seconds is None:
+            return None
+        minutes = max(self.minTime, seconds*self.safety)/60.0
+        return 60.0*math.ceil(minutes - 1e-9)
+    
+    def choose_cores(self, features, coreOptions):
+        """
+        Returns fewest cores from coreOptions (int) with which a run is
+        predicted to finish within self.maxTime and to fit in
+        self.memoryPerCore, the most cores if none does, None if no run was
+        learnt yet
+        
+        features: dictionary, sizes of the run, see input_features
+        coreOptions: list of ints, core counts that may be asked for
+        """
+        if self.predict_time(features, 1) is None:
+            return None
+        coreOptions = sorted(int(cores) for cores in coreOptions)
+        for cores in coreOptions:
+            if self.maxTime is not None and \
+               self.predict_time(features, cores) > self.maxTime:
+                continue
+            memory = self.predict_memory(features, cores)
+            if self.memoryPerCore is not None and memory is not None and \
+               memory/cores > self.memoryPerCore:
+                continue
+            return cores
+        return coreOptions[-1]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fit the energy against a convergence parameter and predict where it
+converges
+
+@author: abishekk
+"""
+import math
+import numpy as np
+
+def fit_exponential(indices, energies):
+    """
+    Fit E(n) = c + a*r**n by least squares, r searched on a grid
+    
+    indices: list of ints, index of each point along the parameter
+    energies: list of floats, energy of each point
+    
+    returns: [c, a, r, residual], None if fewer than 3 points
+    """
+    if len(indices) < 3:
+        return None
+    n = np.asarray(indices, dtype=float)
+    energy = np.asarray(energies, dtype=float)
+    best = None
+    for r in np.linspace(0.02, 0.98, 49):
+        basis = np.column_stack([np.ones_like(n), r**n])
+        coeffs, residual = _least_squares(basis, energy)
+        if best is None or residual < best[3]:
+            best = [coeffs[0], coeffs[1], r, residual]
+    return best
+
+def fit_power_law(measures, energies):
+    """
+    Fit E(x) = c + a*x**(-p) by least squares, p searched on a grid
+    
+    measures: list of floats, size of the parameter eg. cutoff, k-points per
+              direction
+    energies: list of floats, energy of each point
+    
+    returns: [c, a, p, residual], None if fewer than 3 points
+    """
+    if len(measures) < 3:
+        return None
+    x = np.asarray(measures, dtype=float)
+    energy = np.asarray(energies, dtype=float)
+    if any(x <= 0):
+        return None
+    best = None
+    for p in np.linspace(0.5, 8.0, 76):
+        basis = np.column_stack([np.ones_like(x), x**(-p)])
+        coeffs, residual = _least_squares(basis, energy)
+        if best is None or residual < best[3]:
+            best = [coeffs[0], coeffs[1], p, residual]
+    return best
+
+def _least_squares(basis, energy):
+    """
+    Returns coefficients and sum of squared residuals of a linear fit
+    """
+    coeffs = np.linalg.lstsq(basis, energy, rcond=None)[0]
+    residual = float(np.sum((basis.dot(coeffs) - energy)**2))
+    return coeffs, residual
+
+def predict_index(indices, energies, tol, measure=None, maxIndex=1000):
+    """
+    Predict the first index n at which one more step changes the energy by
+    at most tol. The exponential model in the index is always tried, the
+    power law in measure(n) too if measure is given and there are at least
+    4 points, and the model with the smaller residual is used.
+    
+    indices: list of ints, index of each point along the parameter
+    energies: list of floats, energy of each point
+    tol: float, absolute tolerance for the energy
+    measure: function, takes an index and returns the size of the parameter
+    maxIndex: int, largest index considered
+    
+    returns: int, predicted index, None if the trend cannot be fitted
+    """
+    models = []
+    fit = fit_exponential(indices, energies)
+    if fit is not None:
+        c, a, r, residual = fit
+        models.append([residual, \
+                       lambda n, a=a, r=r: abs(a)*r**n*(1.0 - r)])
+    if measure is not None and len(indices) >= 4:
+        fit = fit_power_law([measure(n) for n in indices], energies)
+        if fit is not None:
+            c, a, p, residual = fit
+            models.append([residual, lambda n, a=a, p=p: abs(a)* \
+                           abs(measure(n)**(-p) - measure(n + 1)**(-p))])
+    if not models:
+        return None
+    
+    residual, step = min(models, key=lambda model: model[0])
+    if math.isnan(step(max(indices))):
+        return None
+    for n in range(min(indices), maxIndex):
+        if step(n) <= tol:
+            return n
+    return None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Decide which points of a convergence grid to run next
+
+@author: abishekk
+"""
+from extrapolation import predict_index
+
+class GridScheduler(object):
+    """
+    Class to walk a grid of one or more convergence parameters. A point is a
+    tuple of indices, index n on an axis standing for start + n*step of that
+    parameter. The study is converged at point p once one more step along
+    any axis changes the energy by at most tol.
+    
+    Points needed to decide whether the current point is converged are run
+    first, cheapest first. Free slots in the batch are filled with the next
+    points along each axis, also cheapest first, so that expensive corners
+    of the grid are only run when they are needed.
+    
+    In adaptive mode the energies along an axis that is not converged are
+    fitted (see extrapolation.predict_index) and the current point jumps,
+    at most maxJump steps, to where the tolerance is predicted to be met,
+    instead of moving one step.
+    
+    Points that cannot be run, eg. a smearing that a negative step has
+    taken to zero, are never speculated on or jumped to, and the study
+    stops with an exception if it needs one.
+    
+    Usage:
+        sched = GridScheduler(2, 1e-6, batchSize=4)
+        for point in sched.next_points(numRunning):
+            ... submit point ...
+        sched.add_result(point, energy)
+        sched.is_converged()
+    """
+    
+    def __init__(self, numAxes, tol, batchSize=1, cost=None, \
+                 adaptive=False, measure=None, maxJump=4, valid=None):
+        """
+        Initializes a scheduler starting at index 0 on every axis
+        
+        numAxes: int, number of parameters converged together
+        tol: float, absolute tolerance for the energy
+        batchSize: int, number of points kept running at once
+        cost: function, takes a point and returns its relative cost,
+              default is the sum of the indices
+        adaptive: bool, jump to the predicted converged index
+        measure: function, takes an axis and an index and returns the size 
+                 of the parameter eg. the cutoff, used for power law fits
+        maxJump: int, largest number of steps of one jump
+        valid: function, takes a point and returns False if it cannot be
+               run, every point can be run if None
+        
+        Has 12 attributes:
+            self.numAxes: int, determined by numAxes
+            self.tolerance: float, determined by tol
+            self.batchSize: int, determined by batchSize
+            self.cost: function, determined by cost
+            self.adaptive: bool, determined by adaptive
+            self.measure: function, determined by measure
+            self.maxJump: int, determined by maxJump
+            self.valid: function, determined by valid
+            self.current: tuple, point being checked for convergence
+            self._energies: dictionary, point -> energy of finished points
+            self._submitted: set, points handed out by next_points
+            self._converged: bool, True once the current point converged
+        """
+        self.numAxes = int(numAxes)
+        self.tolerance = float(tol)
+        self.batchSize = int(batchSize)
+        self.cost = cost
+        self.adaptive = bool(adaptive)
+        self.measure = measure
+        self.maxJump = int(maxJump)
+        self.valid = valid
+        self.current = (0,)*self.numAxes
+        self._energies = {}
+        self._submitted = set()
+        self._converged = False
+        
+        if self.cost is None:
+            self.cost = sum
+        if self.valid is None:
+            self.valid = lambda point: True
+        if (self.numAxes < 1):
+            raise Exception('At least one convergence parameter is needed')
+        if (self.batchSize < 1):
+            raise Exception('Batch size must be at least 1')
+    
+    def shift(self, point, axis, steps=1):
+        """
+        Returns point moved by steps along axis (tuple)
+        """
+        point = list(point)
+        point[axis] += steps
+        return tuple(point)
+    
+    def needed(self):
+        """
+        Returns list of points needed to check the current point: the point
+        itself and one step along each axis
+        """
+        return [self.current] + [self.shift(self.current, axis) \
+                                 for axis in range(self.numAxes)]
+    
+    def next_points(self, numRunning):
+        """
+        Choose the points to submit now, at most batchSize - numRunning
+        
+        numRunning: int, number of points submitted and not finished
+        
+        returns: list of points, in the order they should be submitted
+        """
+        free = self.batchSize - numRunning
+        if self._converged or free <= 0:
+            return []
+        
+        needed = [point for point in self.needed() \
+                  if point not in self._submitted]
+        for point in needed:
+            if not self.valid(point):
+                raise Exception('Convergence needs a point that cannot ' + \
+                                'be run: ' + str(point))
+        needed.sort(key=self.cost)
+        
+        # speculate along each axis from the current point
+        speculative = []
+        for steps in range(2, self.batchSize + 1):
+            for axis in range(self.numAxes):
+                point = self.shift(self.current, axis, steps)
+                if point not in self._submitted and self.valid(point):
+                    speculative.append(point)
+        speculative.sort(key=self.cost)
+        
+        chosen = (needed + speculative)[:free]
+        self._submitted.update(chosen)
+        return chosen
+    
+    def add_result(self, point, energy):
+        """
+        Record the energy of a finished point and move the current point
+        along every axis that is not converged
+        
+        point: tuple, finished point
+        energy: float, energy of the point
+        """
+        self._energies[point] = float(energy)
+        self._submitted.add(point)
+        
+        while not self._converged:
+            if any(p not in self._energies for p in self.needed()):
+                return
+            energy0 = self._energies[self.current]
+            moved = list(self.current)
+            for axis in range(self.numAxes):
+                neighbour = self.shift(self.current, axis)
+                if abs(self._energies[neighbour] - energy0) > self.tolerance:
+                    moved[axis] += self.jump(axis)
+            if tuple(moved) == self.current:
+                self._converged = True
+            else:
+                self.current = tuple(moved)
+    
+    def jump(self, axis):
+        """
+        Number of steps the current point moves along an axis that is not 
+        converged: 1, or in adaptive mode the predicted distance to the 
+        converged index
+        
+        axis: int, axis along which the current point moves
+        
+        returns: int, number of steps
+        """
+        if not self.adaptive:
+            return 1
+        
+        # points on the line through the current point along axis
+        line = sorted(point for point in self._energies \
+                      if all(point[other] == self.current[other] \
+                             for other in range(self.numAxes) \
+                             if other != axis))
+        indices = [point[axis] for point in line]
+        energies = [self._energies[point] for point in line]
+        measure = None
+        if self.measure is not None:
+            measure = lambda index: self.measure(axis, index)
+        
+        predicted = predict_index(indices, energies, self.tolerance, measure)
+        if predicted is None:
+            return 1
+        steps = max(1, min(predicted - self.current[axis], self.maxJump))
+        # stop short of the points that cannot be run
+        while steps > 1 and \
+              not self.valid(self.shift(self.current, axis, steps)):
+            steps -= 1
+        return steps
+    
+    def obsolete(self, points):
+        """
+        Find points that can no longer be needed because the current point
+        moved past them along some axis
+        
+        points: list of points, eg. the ones still running
+        
+        returns: list of points
+        """
+        return [point for point in points \
+                if any(point[axis] < self.current[axis] \
+                       for axis in range(self.numAxes))]
+    
+    def is_converged(self):
+        """
+        Returns True once the current point is converged (bool)
+        """
+        return self._converged
+    
+    def converged_point(self):
+        """
+        Returns point needed for convergence, one step beyond the current
+        point along every axis, as both ends of each converged step were
+        run (tuple)
+        """
+        return tuple(index + 1 for index in self.current)
@@ -5,16 +5,32 @@ Read QE input file and return all the lines as a list
 
 @author: abishekk
 """
+import re
 import sys
 
+# cards of a QE input
+_qeCards = ('ATOMIC_SPECIES', 'ATOMIC_POSITIONS', 'K_POINTS', \
+            'ADDITIONAL_K_POINTS', 'CELL_PARAMETERS', 'CONSTRAINTS', \
+            'OCCUPATIONS', 'ATOMIC_VELOCITIES', 'ATOMIC_FORCES', \
+            'SOLVENTS', 'HUBBARD')
+
+# 'key =' inside a namelist, key may be indexed eg. celldm(1)
+_paramPattern = re.compile(r'([A-Za-z_][\w]*(?:\(\s*[\d,\s]+\))?)\s*=')
+
 class InputReader(object):
     """
-    Class to read sample input file and store it as a list. 
+    Class to read sample input file and store it as a list. The namelists
+    (&control, &system, ...) and cards (K_POINTS, ATOMIC_POSITIONS, ...)
+    are indexed once when the file is read, so parameters and cards are
+    looked up and changed without scanning the lines.
     
     Usage: 
         ipp = InputReader('in.pw.si','qe')
         ipp.read_file()
         lineNum = ipp.find_line_number('kpoints')
+        ipp.get_parameter('ecutwfc')
+        ipp.set_parameter('ecutwfc', '30.0')
+        ipp.set_card('K_POINTS', 'automatic', ['4 4 4 0 0 0\n'])
         lineList = ipp.get_lines_file()
     """
     
@@ -25,20 +41,30 @@ class InputReader(object):
         filename: string, input file name
         dftName: string, name of DFT code being used eg. 'qe', 'vasp'
         
-        Has 4  attributes:
+        Has 7 attributes:
             self.inFile: string, from filename
             self.dftCode: string, from dftName
             self._lines: list of strings, stores lines in input file
             self._qeDict: dictionary, translate generic keyword to code key
+            self._namelists: dictionary, namelist name -> line numbers of
+                             its first and last ('/') lines
+            self._params: dictionary, parameter name -> [namelist, line
+                          number] of every namelist parameter
+            self._cards: dictionary, card name -> [line number, option]
         """
         
         self.inFile = filename
         self.dftCode = dftName
         self._lines = []
+        self._namelists = {}
+        self._params = {}
+        self._cards = {}
         # Dictionary for each DFT code
         # dictionary for QE: translate input strings to match QE format
         self._qeDict = { 'kpoints'               : 'K_POINTS', 
-                         'kinetic energy cutoff' : 'ecutwfc'}
+                         'kinetic energy cutoff' : 'ecutwfc',
+                         'charge density cutoff' : 'ecutrho',
+                         'smearing'              : 'degauss'}
         
         # check if inFile exists
         try:
@@ -51,34 +77,176 @@ class InputReader(object):
             
     def read_file(self):
         """ 
-        Read all the lines from a file and store them in a list
+        Read all the lines from a file, store them in a list and index the
+        namelists and cards
         """
         with open(self.inFile, 'r') as fileptr:
             self._lines = fileptr.readlines()
+        self.index_lines()
+    
+    def index_lines(self):
+        """
+        Build the index of namelists, parameters and cards in one pass over
+        the lines. Called again only when lines are inserted or removed.
+        """
+        self._namelists = {}
+        self._params = {}
+        self._cards = {}
+        namelist = None
+        
+        for lineNum, line in enumerate(self._lines):
+            stripped = line.split('!')[0].strip()
+            if not stripped:
+                continue
+            
+            if namelist is None and stripped.startswith('&'):
+                namelist = stripped[1:].split()[0].lower()
+                self._namelists[namelist] = [lineNum, None]
+            elif namelist is not None:
+                if stripped.startswith('/'):
+                    self._namelists[namelist][1] = lineNum
+                    namelist = None
+                else:
+                    for match in _paramPattern.finditer(stripped):
+                        key = match.group(1).replace(' ', '').lower()
+                        self._params[key] = [namelist, lineNum]
+            else:
+                words = stripped.split()
+                if words[0].upper() in _qeCards:
+                    option = ''
+                    if len(words) > 1:
+                        option = words[1].strip('{}()').lower()
+                    self._cards[words[0].upper()] = [lineNum, option]
             
     def find_line_number(self,findString):
         """
         Find the line number in which an input string occurs
         
-        findString: string, search for the string in input file
+        findString: string, generic keyword eg. 'kpoints', or the name of a
+                    parameter, namelist ('&system') or card of the code
         
         returns: int, line number of search string and None if not found
         """
-        #  TO DO: check if findString is valid input
-        stringLineNum = None
-        
         if self.dftCode == 'qe':
             codeDict = self._qeDict
         else:
             print("Support for other codes yet to be implemented")
+            return None
                
-        # find the line number in which the string occurs
-        searchStr = codeDict[findString]
-        for line in self._lines:
-            if searchStr in line:
-                stringLineNum = self._lines.index(line)
+        searchStr = codeDict.get(findString, findString)
+        if searchStr.upper() in self._cards:
+            return self._cards[searchStr.upper()][0]
+        if searchStr.startswith('&'):
+            return self._namelists.get(searchStr[1:].lower(), [None])[0]
+        if searchStr.lower() in self._params:
+            return self._params[searchStr.lower()][1]
+        return None
                 
-        return stringLineNum
+    def get_parameter(self, key):
+        """
+        Returns value of a namelist parameter as written in the input
+        (string), None if it is not set
+        
+        key: string, parameter name eg. 'ecutwfc', 'celldm(1)'
+        """
+        key = self._qeDict.get(key, key).lower()
+        if key not in self._params:
+            return None
+        line = self._lines[self._params[key][1]]
+        match = re.search(r'(?:^|[\s,])' + re.escape(key) + \
+                          r'\s*=\s*([^,\s]+)', line, re.I)
+        return match.group(1) if match else None
+    
+    def set_parameter(self, key, value, namelist='system'):
+        """
+        Change the value of a namelist parameter in place, or add it to
+        namelist if it is not set
+        
+        key: string, parameter name eg. 'ecutwfc'
+        value: string, new value as it should be written eg. '30.0',
+               "'file'"
+        namelist: string, namelist to which a missing parameter is added
+        """
+        key = self._qeDict.get(key, key).lower()
+        if key in self._params:
+            lineNum = self._params[key][1]
+            self._lines[lineNum] = self.replace_value(self._lines[lineNum], \
+                                                      key, value)
+            return
+        
+        if namelist not in self._namelists:
+            raise Exception('Sample input has no &' + namelist + ' namelist')
+        lineNum = self._namelists[namelist][0] + 1
+        self._lines.insert(lineNum, '    ' + key + ' = ' + str(value) + '\n')
+        self.index_lines()
+    
+    @staticmethod
+    def replace_value(line, key, value):
+        """
+        Returns line with the value of parameter key replaced by value
+        (string)
+        """
+        return re.sub(r'((?:^|[\s,])' + re.escape(key) + r'\s*=\s*)[^,\s]+', \
+                      lambda match: match.group(1) + str(value), line, \
+                      flags=re.I)
+    
+    def get_card(self, name):
+        """
+        Returns option and list of lines of the body of a card, None if the
+        card is not present
+        
+        name: string, card name eg. 'K_POINTS', 'ATOMIC_POSITIONS'
+        """
+        name = name.upper()
+        if name not in self._cards:
+            return None
+        start, end = self.card_range(name)
+        return [self._cards[name][1], self._lines[start+1:end]]
+    
+    def set_card(self, name, option, bodyLines):
+        """
+        Replace the option and the body of a card, or add the card at the
+        end of the input if it is not present
+        
+        name: string, card name eg. 'K_POINTS'
+        option: string, card option eg. 'automatic', 'crystal'
+        bodyLines: list of strings, lines of the card with '\n' included
+        """
+        name = name.upper()
+        header = name + (' ' + option if option else '') + '\n'
+        if name not in self._cards:
+            if self._lines and not self._lines[-1].endswith('\n'):
+                self._lines[-1] += '\n'
+            self._lines += [header] + list(bodyLines)
+            self.index_lines()
+            return
+        
+        start, end = self.card_range(name)
+        self._lines[start] = header
+        self._cards[name][1] = option.lower()
+        if (end - start - 1 == len(bodyLines)):
+            # same size, no line moves
+            self._lines[start+1:end] = bodyLines
+        else:
+            self._lines[start+1:end] = bodyLines
+            self.index_lines()
+    
+    def card_range(self, name):
+        """
+        Returns line number of the header of a card and of the line after
+        its body (list of 2 ints)
+        
+        name: string, card name eg. 'K_POINTS'
+        """
+        start = self._cards[name.upper()][0]
+        end = len(self._lines)
+        for lineNum, option in self._cards.values():
+            if start < lineNum < end:
+                end = lineNum
+        # trailing blank lines do not belong to the body
+        while end - 1 > start and not self._lines[end-1].strip():
+            end -= 1
+        return [start, end]
             
     def get_lines_file(self):
         """
@@ -5,6 +5,9 @@ Write QE input file from a list of lines
 
 @author: abishekk
 """
+import io
+import tarfile
+import zipfile
 
 class InputWriter(object):
     """
@@ -34,4 +37,103 @@ class InputWriter(object):
         Write all the lines from a list and store them in a file
         """
         with open(self.outFile, 'w') as fileptr:
-            fileptr.writelines("%s" % line for line in self.lines)
\ No newline at end of file
+            fileptr.write(''.join(self.lines))
+
+class InputTemplate(object):
+    """
+    Class to write many variants of one input that differ only in a few 
+    lines. The lines that never change are joined once, so a variant is 
+    built from a handful of strings however large the structure is.
+    
+    Usage:
+        template = InputTemplate(listLines, {'ecutwfc': 11})
+        text = template.fill({'ecutwfc': '    ecutwfc = 30\n'})
+        template.write_batch([['in.1', values1], ['in.2', values2]])
+        template.write_batch(variants, bundle='inputs.tar.gz')
+    """
+    
+    def __init__(self, linesList, slots):
+        """
+        Initialize InputTemplate with the lines of the input and the lines 
+        that change between variants
+        
+        linesList: list of strings, lines of the input with '\n' included
+        slots: dictionary, slot name -> line number of a line that changes.
+               Several slots may share a line eg. 'ecutwfc = 30, ecutrho =
+               240,', the line is then written once
+        
+        Has 4 attributes:
+            self.lines: list of strings, from linesList
+            self.slots: dictionary, from slots
+            self._order: list of [line number, slot names on that line] of
+                         every slot line, by line number
+            self._chunks: list of strings, invariant text before, between 
+                          and after the slot lines
+        """
+        self.lines = linesList
+        self.slots = dict(slots)
+        self._order = []
+        for name in sorted(self.slots, key=self.slots.get):
+            if self._order and self._order[-1][0] == self.slots[name]:
+                self._order[-1][1].append(name)
+            else:
+                self._order.append([self.slots[name], [name]])
+        
+        self._chunks = []
+        start = 0
+        for lineNum, names in self._order:
+            self._chunks.append(''.join(linesList[start:lineNum]))
+            start = lineNum + 1
+        self._chunks.append(''.join(linesList[start:]))
+    
+    def fill(self, values):
+        """
+        Returns text of one variant (string)
+        
+        values: dictionary, slot name -> line written in that slot with 
+                '\n' included, slots not given keep the line of the template.
+                Slots that share a line take the line given for any of
+                them, with all their changes made in it.
+        """
+        parts = [self._chunks[0]]
+        for [lineNum, names], chunk in zip(self._order, self._chunks[1:]):
+            line = self.lines[lineNum]
+            for name in names:
+                line = values.get(name, line)
+            parts.append(line)
+            parts.append(chunk)
+        return ''.join(parts)
+    
+    def write_batch(self, variants, bundle=None):
+        """
+        Write many variants, each to its own file or all into one archive
+        
+        variants: list of [filename, values], values as in fill
+        bundle: string, name of a .zip, .tar, .tar.gz or .tgz archive in 
+                which filename is the name of each member, files are 
+                written directly if None
+        
+        returns: list of strings, text of each variant
+        """
+        texts = [self.fill(values) for filename, values in variants]
+        
+        if bundle is None:
+            for [filename, values], text in zip(variants, texts):
+                with open(filename, 'w', buffering=1<<16) as fileptr:
+                    fileptr.write(text)
+        elif bundle.endswith('.zip'):
+            with zipfile.ZipFile(bundle, 'w', zipfile.ZIP_DEFLATED) as arch:
+                for [filename, values], text in zip(variants, texts):
+                    arch.writestr(filename, text)
+        elif bundle.endswith(('.tar', '.tar.gz', '.tgz')):
+            mode = 'w' if bundle.endswith('.tar') else 'w:gz'
+            with tarfile.open(bundle, mode) as arch:
+                for [filename, values], text in zip(variants, texts):
+                    data = text.encode()
+                    info = tarfile.TarInfo(filename)
+                    info.size = len(data)
+                    arch.addfile(info, io.BytesIO(data))
+        else:
+            raise Exception('Bundle must be a .zip, .tar, .tar.gz or .tgz')
+        
+        return texts
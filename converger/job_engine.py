@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Submit jobs through a backend and monitor all of them with a single poller
+
+@author: abishekk
+"""
+import asyncio
+import os
+import sys
+
+from backends import PBSBackend
+
+class JobHandle(object):
+    """
+    Awaitable handle for a job submitted through JobEngine. Awaiting it
+    returns the job id once the job has left the queue.
+    """
+    
+    def __init__(self, jobId, future):
+        """
+        jobId: string, job id returned by the queue manager
+        future: asyncio.Future, resolved by the poller when the job finishes
+        
+        Has 2 attributes:
+            self.jobId: string, determined by jobId
+            self._future: asyncio.Future, determined by future
+        """
+        self.jobId = jobId
+        self._future = future
+    
+    def __await__(self):
+        return self._future.__await__()
+    
+    def done(self):
+        """
+        Returns True if the job has left the queue (bool)
+        """
+        return self._future.done()
+
+class JobEngine(object):
+    """
+    Class to launch many jobs through an execution backend and wait for them
+    without blocking. One poller queries all outstanding jobs with a single
+    status call and backs off while nothing changes.
+    
+    The number of jobs and of cores in the queue can be limited. A submit
+    beyond the limits waits for a free slot; slots go first to the owner
+    (eg. a study of a campaign) with the fewest jobs in the queue, so that
+    many studies sharing the engine progress at the same pace.
+    
+    Usage:
+        async def study():
+            engine = JobEngine(PBSBackend(coresPerJob=16))
+            handle = await engine.submit('mpirun -np 16 pw.x', 'in.pw.si',
+                                         'out.pw.si')
+            await handle
+        asyncio.run(study())
+    """
+    
+    def __init__(self, backend=None, minInterval=2.0, maxInterval=60.0, \
+                 backoff=1.5, maxJobs=None, maxCores=None, maxFailures=5):
+        """
+        Initializes an engine to launch and monitor jobs
+        
+        backend: Backend, used to submit, query and cancel jobs, default is
+                 PBSBackend
+        minInterval: float, shortest time between two status queries in s
+        maxInterval: float, longest time between two status queries in s
+        backoff: float, factor by which the interval grows when no job has
+                 finished since the last query
+        maxJobs: int, largest number of jobs in the queue, no limit if None
+        maxCores: int, largest number of cores used by the jobs in the
+                  queue, no limit if None
+        maxFailures: int, number of status queries in a row that may fail
+                     before the outstanding jobs are failed
+        
+        Has 13 attributes:
+            self.backend: Backend, determined by backend
+            self.minInterval: float, determined by minInterval
+            self.maxInterval: float, determined by maxInterval
+            self.backoff: float, determined by backoff
+            self.maxJobs: int, determined by maxJobs
+            self.maxCores: int, determined by maxCores
+            self.maxFailures: int, determined by maxFailures
+            self.statusCalls: int, number of status queries made
+            self._jobs: dictionary, job id -> future of outstanding jobs
+            self._poller: asyncio.Task, poller running while jobs are queued
+            self._owners: dictionary, job id -> [owner, cores] of
+                          outstanding jobs
+            self._waiting: list, [owner, cores, future] of submits waiting
+                           for a slot, oldest first
+            self._reserved: list, [owner, cores] of slots held by submits
+                            that have not reached the backend yet
+        """
+        self.backend = backend
+        self.minInterval = float(minInterval)
+        self.maxInterval = float(maxInterval)
+        self.backoff = float(backoff)
+        self.maxJobs = maxJobs
+        self.maxCores = maxCores
+        self.maxFailures = int(maxFailures)
+        self.statusCalls = 0
+        self._jobs = {}
+        self._poller = None
+        self._owners = {}
+        self._waiting = []
+        self._reserved = []
+        
+        if self.backend == None:
+            self.backend = PBSBackend()
+        if (self.minInterval <= 0 or self.maxInterval < self.minInterval):
+            raise Exception('Polling intervals must satisfy 0 < min <= max')
+    
+    async def submit(self, cmd, inputFile, outputFile, workDir=None, \
+                     owner=None, cores=None, params=None):
+        """
+        Submit job to the backend and return without waiting for it to finish
+        
+        cmd: string, mpirun, options, and executable
+             eg. mpirun -np 16 pw.x
+        inputFile: string, name of the input file inside workDir
+        outputFile: string, name of the output file inside workDir
+        workDir: string, directory in which the job runs, default is the
+                 directory of inputFile
+        owner: object, whoever submits the job, used to share the slots
+               fairly when the queue is full
+        cores: int, cores used by the job, default is backend.coresPerJob
+        params: string, options passed to the queue manager for this job,
+                default is backend.params
+        
+        returns: JobHandle, awaitable that resolves when the job finishes
+        """
+        if workDir is None:
+            workDir = os.path.dirname(os.path.abspath(inputFile))
+            inputFile = os.path.basename(inputFile)
+        workDir = os.path.abspath(workDir)
+        
+        try:
+            fileptr = open(os.path.join(workDir, inputFile),'r')
+        except OSError:
+            print('Cannot open: ', inputFile)
+            sys.exit(1)
+        else:
+            fileptr.close()
+        
+        if cores is None:
+            cores = self.backend.coresPerJob
+        await self._acquire(owner, cores)
+        
+        # backends block on the queue manager, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        jobId = None
+        try:
+            jobId = await loop.run_in_executor(None, self.backend.submit, \
+                                               cmd, inputFile, outputFile, \
+                                               workDir, params)
+        finally:
+            self._reserved.remove([owner, cores])
+            if jobId:
+                self._owners[jobId] = [owner, cores]
+            else:
+                # the slot of a failed submit goes to the next waiter
+                self._grant()
+        # a failed qsub prints no job id
+        if not jobId:
+            raise Exception('Job submission failed: ' + \
+                            os.path.join(workDir, inputFile))
+        
+        future = loop.create_future()
+        self._jobs[jobId] = future
+        
+        # start the shared poller if it is not running
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        
+        return JobHandle(jobId, future)
+    
+    async def attach(self, jobId, owner=None, cores=None):
+        """
+        Follow a job submitted before, eg. by a process that has died. The
+        job counts towards the limits but never waits for a slot.
+        
+        jobId: string, job id returned by the backend
+        owner: object, see submit
+        cores: int, see submit
+        
+        returns: JobHandle, None if the job is no longer queued
+        """
+        loop = asyncio.get_running_loop()
+        queued = await loop.run_in_executor(None, self.backend.status, \
+                                            [jobId])
+        self.statusCalls += 1
+        if jobId not in queued:
+            return None
+        
+        future = loop.create_future()
+        self._jobs[jobId] = future
+        if cores is None:
+            cores = self.backend.coresPerJob
+        self._owners[jobId] = [owner, cores]
+        
+        # start the shared poller if it is not running
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        
+        return JobHandle(jobId, future)
+    
+    async def cancel(self, handle):
+        """
+        Remove a submitted job from the queue and resolve its handle
+        
+        handle: JobHandle, returned by submit
+        """
+        if handle.done():
+            return
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.backend.cancel, handle.jobId)
+        
+        future = self._jobs.pop(handle.jobId, None)
+        if future is not None and not future.done():
+            future.set_result(handle.jobId)
+        self._release(handle.jobId)
+    
+    async def _poll(self):
+        """
+        Query the status of all outstanding jobs in one call until the queue
+        is empty. The interval is reset whenever a job finishes and grows by
+        self.backoff otherwise.
+        
+        A failed query is retried at the next interval. After
+        self.maxFailures failures in a row the handles of the outstanding
+        jobs raise the error of the last query.
+        """
+        loop = asyncio.get_running_loop()
+        interval = self.minInterval
+        failures = 0
+        while self._jobs:
+            await asyncio.sleep(interval)
+            
+            jobIds = list(self._jobs)
+            try:
+                queued = await loop.run_in_executor(None, \
+                                                    self.backend.status, \
+                                                    jobIds)
+            except Exception as error:
+                # nothing is known about the jobs, ask again later
+                self.statusCalls += 1
+                failures += 1
+                if failures >= self.maxFailures:
+                    for jobId in jobIds:
+                        future = self._jobs.pop(jobId, None)
+                        if future is not None and not future.done():
+                            future.set_exception(error)
+                        self._release(jobId)
+                    failures = 0
+                interval = min(interval*self.backoff, self.maxInterval)
+                continue
+            self.statusCalls += 1
+            failures = 0
+            
+            finished = [jobId for jobId in jobIds if jobId not in queued]
+            for jobId in finished:
+                future = self._jobs.pop(jobId, None)
+                if future is not None and not future.done():
+                    future.set_result(jobId)
+                self._release(jobId)
+            
+            if finished:
+                interval = self.minInterval
+            else:
+                interval = min(interval*self.backoff, self.maxInterval)
+    
+    def in_queue(self, owner=None):
+        """
+        Returns number of outstanding jobs of owner, of all owners if None
+        (int)
+        """
+        if owner is None:
+            return len(self._owners)
+        return sum(1 for jobOwner, cores in self._owners.values() \
+                   if jobOwner is owner)
+    
+    def _has_room(self, cores):
+        """
+        Returns True if one more job using cores fits in the limits (bool)
+        """
+        slots = list(self._owners.values()) + self._reserved
+        if self.maxJobs is not None and len(slots) >= self.maxJobs:
+            return False
+        if self.maxCores is not None and \
+           sum(slot[1] for slot in slots) + cores > self.maxCores:
+            return False
+        return True
+    
+    async def _acquire(self, owner, cores):
+        """
+        Wait until a job of owner using cores fits in the limits and
+        reserve its slot
+        """
+        if self.maxCores is not None and cores > self.maxCores:
+            raise Exception('Job needs more cores than maxCores')
+        if not self._waiting and self._has_room(cores):
+            self._reserved.append([owner, cores])
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        waiter = [owner, cores, future]
+        self._waiting.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif future.done() and not future.cancelled():
+                # the slot was granted, give it to the next waiter
+                self._reserved.remove([owner, cores])
+                self._grant()
+            raise
+    
+    def _release(self, jobId):
+        """
+        Free the slot of a job that left the queue
+        """
+        if self._owners.pop(jobId, None) is not None:
+            self._grant()
+    
+    def _grant(self):
+        """
+        Give free slots to waiting submits, the owner with the fewest jobs
+        in the queue first, then the oldest
+        """
+        while self._waiting:
+            waiter = min(self._waiting, key=lambda waiter: \
+                         self.in_queue(waiter[0]) + \
+                         sum(1 for slot in self._reserved \
+                             if slot[0] is waiter[0]))
+            if not self._has_room(waiter[1]):
+                return
+            self._waiting.remove(waiter)
+            self._reserved.append(waiter[:2])
+            waiter[2].set_result(None)
@@ -7,94 +7,282 @@ Created on Tue Apr 17 11:51:44 2018
 """
 
 import os
+import re
 import sys
-import subprocess
 import time
 
+from backends import PBSBackend, SlurmBackend
+from cost_model import input_features, set_cores
+from input_reader import InputReader
+from input_writer import InputWriter
+from output_parser import OutputParser
+from retry_policy import OK, SUBMIT_FAILED, classify_outcome, \
+                         read_scheduler_errors, set_walltime
+
 class JobLauncher(object):
     """
-    Class to launch and monitor jobs on a cluster
+    Class to launch and monitor a single job through an execution backend
     
     Usage:
         jobMgr= JobLauncher('mpirun -np 16  pw.x','in.pw.si','out.pw.si')
         jobMgr.job_run()
+    
+    or, to run in a given directory whatever the current directory is:
+        jobMgr= JobLauncher('pw.x','in.pw.si','out.pw.si',
+                            workDir='/path/to/job')
+    
+    or, to submit without blocking:
+        jobMgr.job_submit()
+        ...
+        jobMgr.job_wait()
+    
+    or, to submit a failed job again with adjusted parameters:
+        jobMgr= JobLauncher('mpirun -np 16  pw.x','in.pw.si','out.pw.si',
+                            retry=RetryPolicy(maxRetries=2))
+        if jobMgr.job_run() != 'ok':
+            ...
+    
+    or, to ask for the time limit and cores that past runs predict, and
+    learn from this run:
+        jobMgr= JobLauncher('mpirun -np 16  pw.x','in.pw.si','out.pw.si',
+                            '-l nodes=1:ppn=16 -l walltime=24:00:00',
+                            costModel=CostModel('cost.json', maxTime=3600),
+                            coreOptions=[4, 8, 16])
+        jobMgr.job_run()
     """
-    def __init__(self, cmd, inputFile, outputFile, pbsParams=None):
+    def __init__(self, cmd, inputFile, outputFile, pbsParams=None, \
+                 backend=None, workDir=None, retry=None, costModel=None, \
+                 coreOptions=None):
         """
         Initializes an object to launch and monitor jobs
         
         cmd: string, mpirun, options, and executable
              eg. mpirun -np 16 pw.x
-        inputFile: string, path and name of the input file to be used
+        inputFile: string, path and name of the input file to be used,
+                   relative to workDir
         outputFile: string, path and name for the output file that will be 
-                    generated by the run
-        pbsParams: string, PBS options for running the job
+                    generated by the run, relative to workDir
+        pbsParams: string, queue options of the job, passed to the
+                   backend with every submission, default is the params
+                   of backend
+        backend: Backend, used to submit and monitor the job, default is 
+                 PBSBackend with pbsParams
+        workDir: string, directory in which the job runs, default is the
+                 directory of inputFile
+        retry: RetryPolicy, which failed jobs job_run submits again, no
+               retries if None
+        costModel: CostModel, sets the time limit in the queue options
+                   from the predicted wall time before the first
+                   submission, and learns from the finished run, not used
+                   if None
+        coreOptions: list of ints, core counts costModel may choose from,
+                     the cores are not changed if None
         
-        Has 6 attributes:
+        Has 13 attributes:
             self.cmdStr: string, determined by cmd
             self.inFile: string, determined by inputFile
             self.outFile: string, determined by outputFile
             self.pbsParams: string, determined by pbsParams
-            self._jobId: integer, job id returned by the queue manager
-            self._workDir: string, path of the current working directory
+            self.backend: Backend, determined by backend
+            self.workDir: string, absolute path of the job directory
+            self.retry: RetryPolicy, determined by retry
+            self.costModel: CostModel, determined by costModel
+            self.coreOptions: list of ints, determined by coreOptions
+            self.cores: int, cores of the job, coresPerJob of backend
+                        until costModel chooses others
+            self.outcome: string, how the last run ended, see
+                          retry_policy.classify_outcome
+            self.attempts: int, number of times the job was submitted again
+            self._jobId: string, job id returned by the queue manager
         """
         
         self.cmdStr = cmd
         self.inFile = inputFile
         self.outFile = outputFile
         self.pbsParams = pbsParams
+        self.backend = backend
+        self.workDir = workDir
+        self.retry = retry
+        self.costModel = costModel
+        self.coreOptions = coreOptions
+        self.cores = None
+        self.outcome = None
+        self.attempts = 0
         self._jobId = None
-        self._workDir = os.getcwd()
+        
+        # paths are resolved once so that the job does not depend on the
+        # current directory of the process when it is submitted
+        if self.workDir == None:
+            self.workDir = os.path.dirname(os.path.abspath(self.inFile))
+            self.inFile = os.path.basename(self.inFile)
+        self.workDir = os.path.abspath(self.workDir)
                 
         try:
-            fileptr = open(self.inFile,'r')
+            fileptr = open(os.path.join(self.workDir, self.inFile),'r')
         except OSError:
             print('Cannot open: ', self.inFile)
             sys.exit(1)
         else:
             fileptr.close()
             
+        if self.backend == None:
+            self.backend = PBSBackend(params=self.pbsParams)
+        # the options of this job only, a backend shared by other jobs
+        # keeps its own
         if self.pbsParams == None:
-            self.pbsParams = ''
+            self.pbsParams = self.backend.params
+        self.cores = self.backend.coresPerJob
 
-    def job_run(self):
+    def job_run(self, interval=10.0):
+        """
+        Submit job to the queue and wait for the job to finish. A job that
+        failed is submitted again as long as self.retry allows it.
+        
+        interval: float, time in s between two status queries
+        
+        returns: string, outcome of the last run, see
+                 retry_policy.classify_outcome
         """
-        Submit job to the queue using PBS and wait for the job to finish
+        while True:
+            self.job_submit()
+        
+            # wait for job to finish
+            self.job_wait(interval)
+            
+            self.outcome = self.job_outcome()
+            if self.outcome == OK and self.costModel is not None:
+                self.costModel.add_output(os.path.join(self.workDir, \
+                                                       self.outFile))
+                self.costModel.save()
+            if self.outcome == OK or self.retry is None or \
+               not self.retry.should_retry(self.outcome, self.attempts):
+                return self.outcome
+            time.sleep(self.retry.delay_for(self.attempts))
+            self.attempts += 1
+            self.prepare_retry(self.outcome)
+    
+    def job_submit(self):
         """
-        # process commands for running the job
-        self.cmdStr = self.cmdStr + ' < ' + self.inFile + \
-                       ' > ' + self.outFile
-                       
-        # submit job to the queue
-        # TO DO: Launch from PBS script
-        submitCmd = "echo '" + self.cmdStr + "' | " + "qsub -V -d " + \
-                     self._workDir + " " + self.pbsParams + " -"
+        Submit job to the queue without waiting for it to finish
         
-        # TO DO: Error checking to make sure job launches and runs            
-        jobSubmit = subprocess.Popen(submitCmd, shell=True, \
-                                     stdout=subprocess.PIPE)
+        returns: string, job id returned by the backend, None if the
+                 submission failed
+        """
+        if self.costModel is not None and self.attempts == 0:
+            self.size_request()
         
-        # qsub returns job ID to stdout
-        self._jobId = jobSubmit.communicate()[0].rstrip()
+        # a failed qsub prints no job id, there is nothing to wait for
+        self._jobId = self.backend.submit(self.cmdStr, self.inFile, \
+                                          self.outFile, self.workDir, \
+                                          self.pbsParams)
+        if not self._jobId:
+            self._jobId = None
         
-        # wait for job to finish 
-        self.job_wait()
+        return self._jobId
     
-    def job_wait(self):
+    def size_request(self):
+        """
+        Set the cores and the time limit of the job from the wall time
+        predicted by self.costModel for its input. Nothing changes until
+        the model has learnt from a run. The command, self.cores and
+        self.pbsParams change, the backend, which other jobs may share,
+        does not.
+        
+        returns: float, time limit asked for in s, None if not predicted
+        """
+        inReader = InputReader(os.path.join(self.workDir, self.inFile))
+        inReader.read_file()
+        features = input_features(inReader)
+        
+        cores = self.cores
+        if self.coreOptions:
+            chosen = self.costModel.choose_cores(features, self.coreOptions)
+            if chosen is not None and chosen != cores:
+                cores = chosen
+                self.cores = cores
+                params = set_cores(self.pbsParams, cores)
+                # sbatch takes the last --ntasks, after that of the backend
+                if params == self.pbsParams and \
+                   isinstance(self.backend, SlurmBackend):
+                    params = (params + ' --ntasks=' + str(cores)).strip()
+                self.pbsParams = params
+                # the number of ranks follows the launcher eg. mpirun -np
+                self.cmdStr = re.sub(r'^(' + \
+                                     re.escape(self.backend.mpiCmd) + \
+                                     r'\s+)\d+', r'\g<1>' + str(cores), \
+                                     self.cmdStr)
+        
+        seconds = self.costModel.request_time(features, cores)
+        if seconds is not None:
+            option = '--time=' if isinstance(self.backend, SlurmBackend) \
+                     else '-l walltime='
+            self.pbsParams = set_walltime(self.pbsParams, seconds, option)
+        return seconds
+    
+    def job_done(self):
+        """
+        Query the backend once and check if the submitted job finished
+        
+        returns: bool, True if the job is no longer in the queue
+        """
+        return self._jobId not in self.backend.status([self._jobId])
+    
+    def job_wait(self, interval=10.0):
         """
         Waits for submitted job to finish execution. Uses self._jobId. 
+        Returns at once if the submission failed.
+        
+        interval: float, time in s between two status queries
         """
-        # TO DO: check if job runs properly
-        while True:
-            jobStatus = subprocess.Popen('qstat -j ' + self._jobId, \
-                                         shell=True, stdout=subprocess.PIPE)
-            qstatMsg = jobStatus.communicate()[0]
+        if self._jobId is None:
+            return
+        while not self.job_done():
+            # sleep and requery the queue
+            time.sleep(interval)
+    
+    def job_outcome(self):
+        """
+        Find how the job ended from its output and from the error file of
+        the queue manager
+        
+        returns: string, see retry_policy.classify_outcome
+        """
+        if self._jobId is None:
+            return SUBMIT_FAILED
+        record = {}
+        outPath = os.path.join(self.workDir, self.outFile)
+        if os.path.exists(outPath):
+            readOut = OutputParser('qe')
+            readOut.parse_op_file(outPath)
+            record = readOut.get_record()
+        return classify_outcome(record, read_scheduler_errors(self.workDir, \
+                                                              self._jobId))
+    
+    def prepare_retry(self, outcome):
+        """
+        Keep the output of a failed run as <output>.failed<attempt> and
+        change the input and the queue options as self.retry asks
+        
+        outcome: string, how the failed run ended
+        """
+        outPath = os.path.join(self.workDir, self.outFile)
+        if os.path.exists(outPath):
+            os.replace(outPath, outPath + '.failed' + str(self.attempts))
+        
+        inPath = os.path.join(self.workDir, self.inFile)
+        inReader = InputReader(inPath)
+        inReader.read_file()
+        if self.retry.adjust_input(inReader, outcome):
+            InputWriter(inPath, inReader.get_lines_file()). \
+                write_lines_to_file()
+        option = '--time=' if isinstance(self.backend, SlurmBackend) \
+                 else '-l walltime='
+        self.pbsParams = self.retry.adjust_params(self.pbsParams, outcome, \
+                                                  option)
             
-            # If job has completed, qstat outputs 'Following jobs do not exist'
-            if "not exist" in qstatMsg:
-                break
-            else: 
-                # sleep and requery qstat
-                time.sleep(10) # wait for 10 s
-                
-  
\ No newline at end of file
+    def job_cancel(self):
+        """
+        Remove the submitted job from the queue if it is queued or running
+        """
+        if self._jobId:
+            self.backend.cancel(self._jobId)
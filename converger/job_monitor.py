@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Follow the outputs of many running jobs and flag diverging SCF cycles
+
+@author: abishekk
+"""
+from output_parser import OutputParser
+
+class JobMonitor(object):
+    """
+    Class to follow the output files of running jobs. Each call to update
+    reads only the bytes written since the previous call.
+    
+    Usage:
+        monitor = JobMonitor('qe', window=5, factor=10.0)
+        monitor.follow('kpoints_4_4_4/out.kpoints_4_4_4')
+        monitor.update()
+        print(monitor.report())
+        for outFile in monitor.diverging():
+            ...
+    """
+    
+    def __init__(self, dftCode='qe', window=5, factor=10.0, interval=60.0):
+        """
+        Initializes a monitor
+        
+        dftCode: string, program name eg. 'qe'
+        window: int, iterations checked for divergence, see
+                OutputParser.scf_diverging
+        factor: float, growth of the scf accuracy over the best value that
+                counts as divergence
+        interval: float, time in s between two updates when the monitor is
+                  driven by Converger
+        
+        Has 5 attributes:
+            self.dftName: string, determined by dftCode
+            self.window: int, determined by window
+            self.factor: float, determined by factor
+            self.interval: float, determined by interval
+            self._parsers: dictionary, output file -> OutputParser
+        """
+        self.dftName = dftCode
+        self.window = int(window)
+        self.factor = float(factor)
+        self.interval = float(interval)
+        self._parsers = {}
+        
+        if self.dftName != 'qe':
+            raise Exception('Currently, only \'qe\' outputs can be followed')
+    
+    def follow(self, outFile):
+        """
+        Start following an output file, nothing is done if already followed
+        
+        outFile: string, path to output file of a running job
+        """
+        if outFile not in self._parsers:
+            self._parsers[outFile] = OutputParser(self.dftName)
+    
+    def forget(self, outFile):
+        """
+        Stop following an output file
+        
+        outFile: string, path to output file
+        """
+        self._parsers.pop(outFile, None)
+    
+    def update(self):
+        """
+        Read what was appended to every followed output
+        
+        returns: dictionary, output file -> list of estimated scf accuracies
+                 of the new iterations
+        """
+        return {outFile: parser.parse_qe_increment(outFile) \
+                for outFile, parser in self._parsers.items()}
+    
+    def diverging(self):
+        """
+        Returns list of output files whose SCF cycle is diverging
+        """
+        return [outFile for outFile, parser in self._parsers.items() \
+                if parser.scf_diverging(self.window, self.factor)]
+    
+    def report(self):
+        """
+        Returns one line per followed output with its latest SCF iteration
+        and estimated scf accuracy (string)
+        """
+        lines = []
+        for outFile, parser in self._parsers.items():
+            record = parser.get_record()
+            accuracy = record.get('scf accuracy')
+            if accuracy is None:
+                status = 'no SCF iteration yet'
+            else:
+                numIterations = len(parser.get_scf_history())
+                status = 'iteration ' + str(numIterations) + \
+                         ', scf accuracy ' + '%.3e' % accuracy + ' Ry'
+            if parser.scf_diverging(self.window, self.factor):
+                status += ', diverging'
+            lines.append(outFile + ': ' + status)
+        return '\n'.join(lines)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Plan k-point grids of equal spacing along every reciprocal lattice vector,
+from the cell of a QE input
+
+@author: abishekk
+"""
+import itertools
+import math
+import numpy as np
+
+# bohr radius in angstrom
+_bohr = 0.52917721067
+
+def _celldm(qeInput, num):
+    """
+    Returns celldm(num) of the input (float), 0 if it is not set
+    """
+    value = qeInput.get_parameter('celldm(%d)' % num)
+    if value is None:
+        return 0.0
+    return float(value.lower().replace('d', 'e'))
+
+def _abc_celldm(qeInput, ibrav):
+    """
+    Returns celldm(1..6) (list of floats) from A, B, C and the cosines
+    cosAB, cosAC, cosBC when the cell is given in angstrom
+    """
+    values = {}
+    for key in ('a', 'b', 'c', 'cosab', 'cosac', 'cosbc'):
+        value = qeInput.get_parameter(key)
+        values[key] = 0.0 if value is None else \
+                      float(value.lower().replace('d', 'e'))
+    a = values['a']
+    celldm = [a/_bohr, values['b']/a, values['c']/a, 0.0, 0.0, 0.0]
+    if ibrav == 14:
+        celldm[3:] = [values['cosbc'], values['cosac'], values['cosab']]
+    elif ibrav == 5:
+        celldm[3] = values['cosbc'] or values['cosab']
+    else:
+        celldm[3] = values['cosab']
+    return celldm
+
+def bravais_cell(ibrav, celldm):
+    """
+    Returns lattice vectors in bohr, one per row (3x3 array), of a Bravais
+    lattice in the conventions of pw.x
+    
+    ibrav: int, Bravais lattice index, 1 to 14 except 13
+    celldm: list of 6 floats, celldm(1..6) of the input
+    """
+    a = celldm[0]
+    b = celldm[1]*a
+    c = celldm[2]*a
+    if ibrav == 1:
+        vectors = [[a, 0, 0], [0, a, 0], [0, 0, a]]
+    elif ibrav == 2:
+        vectors = [[-a/2, 0, a/2], [0, a/2, a/2], [-a/2, a/2, 0]]
+    elif ibrav == 3:
+        vectors = [[a/2, a/2, a/2], [-a/2, a/2, a/2], [-a/2, -a/2, a/2]]
+    elif ibrav == -3:
+        vectors = [[-a/2, a/2, a/2], [a/2, -a/2, a/2], [a/2, a/2, -a/2]]
+    elif ibrav == 4:
+        vectors = [[a, 0, 0], [-a/2, a*math.sqrt(3)/2, 0], [0, 0, c]]
+    elif ibrav == 5:
+        cosGamma = celldm[3]
+        tx = math.sqrt((1 - cosGamma)/2)
+        ty = math.sqrt((1 - cosGamma)/6)
+        tz = math.sqrt((1 + 2*cosGamma)/3)
+        vectors = [[a*tx, -a*ty, a*tz], [0, 2*a*ty, a*tz], \
+                   [-a*tx, -a*ty, a*tz]]
+    elif ibrav == 6:
+        vectors = [[a, 0, 0], [0, a, 0], [0, 0, c]]
+    elif ibrav == 7:
+        vectors = [[a/2, -a/2, c/2], [a/2, a/2, c/2], [-a/2, -a/2, c/2]]
+    elif ibrav == 8:
+        vectors = [[a, 0, 0], [0, b, 0], [0, 0, c]]
+    elif ibrav == 9:
+        vectors = [[a/2, b/2, 0], [-a/2, b/2, 0], [0, 0, c]]
+    elif ibrav == 10:
+        vectors = [[a/2, 0, c/2], [a/2, b/2, 0], [0, b/2, c/2]]
+    elif ibrav == 11:
+        vectors = [[a/2, b/2, c/2], [-a/2, b/2, c/2], [-a/2, -b/2, c/2]]
+    elif ibrav == 12:
+        cosGamma = celldm[3]
+        sinGamma = math.sqrt(1 - cosGamma**2)
+        vectors = [[a, 0, 0], [b*cosGamma, b*sinGamma, 0], [0, 0, c]]
+    elif ibrav == 14:
+        cosAlpha, cosBeta, cosGamma = celldm[3:6]
+        sinGamma = math.sqrt(1 - cosGamma**2)
+        vectors = [[a, 0, 0], [b*cosGamma, b*sinGamma, 0], \
+                   [c*cosBeta, c*(cosAlpha - cosBeta*cosGamma)/sinGamma, \
+                    c*math.sqrt(1 + 2*cosAlpha*cosBeta*cosGamma - \
+                                cosAlpha**2 - cosBeta**2 - \
+                                cosGamma**2)/sinGamma]]
+    else:
+        raise Exception('k-point planning does not support ibrav = ' + \
+                        str(ibrav))
+    return np.array(vectors, dtype=float)
+
+def cell_from_input(qeInput):
+    """
+    Returns lattice vectors of the cell in bohr, one per row (3x3 array),
+    read from ibrav and celldm (or A, B, C), or from the CELL_PARAMETERS
+    card when ibrav = 0
+    
+    qeInput: InputReader, input read with read_file
+    """
+    ibrav = qeInput.get_parameter('ibrav')
+    if ibrav is None:
+        raise Exception('Sample input has no ibrav')
+    ibrav = int(ibrav)
+    
+    if qeInput.get_parameter('celldm(1)') is not None:
+        celldm = [_celldm(qeInput, num) for num in range(1, 7)]
+    elif qeInput.get_parameter('A') is not None:
+        celldm = _abc_celldm(qeInput, ibrav)
+    else:
+        celldm = [0.0]*6
+    if ibrav != 0:
+        return bravais_cell(ibrav, celldm)
+    
+    card = qeInput.get_card('CELL_PARAMETERS')
+    if card is None:
+        raise Exception('Sample input with ibrav = 0 has no CELL_PARAMETERS')
+    option, lines = card
+    rows = [line.split()[:3] for line in lines if line.split() and \
+            not line.strip().startswith(('!', '#'))]
+    vectors = np.array([[float(word.lower().replace('d', 'e')) \
+                         for word in row] for row in rows[:3]], dtype=float)
+    if vectors.shape != (3, 3):
+        raise Exception('CELL_PARAMETERS needs 3 lattice vectors')
+    if option == 'angstrom':
+        return vectors/_bohr
+    if option == 'alat' or (option == '' and celldm[0] > 0):
+        if celldm[0] <= 0:
+            raise Exception('CELL_PARAMETERS alat needs celldm(1) or A')
+        return vectors*celldm[0]
+    return vectors
+
+def reciprocal_lengths(cell):
+    """
+    Returns length of each reciprocal lattice vector in 1/bohr (array),
+    2*pi included
+    
+    cell: 3x3 array, lattice vectors in bohr, one per row
+    """
+    return 2*math.pi*np.linalg.norm(np.linalg.inv(cell), axis=0)
+
+def lattice_symmetries(cell, tol=1e-5):
+    """
+    Returns the rotations of the lattice as integer matrices acting on
+    fractional coordinates (array of shape (n, 3, 3)), the ones with
+    entries -1, 0 and 1 that keep the metric of the cell. They always
+    include the inversion, which is also time reversal for k-points.
+    
+    The atoms are not looked at, so the rotations are those of the holohedry
+    of the lattice: the symmetry of a crystal with a basis may be lower.
+    
+    cell: 3x3 array, lattice vectors one per row
+    tol: float, relative tolerance on the metric
+    """
+    metric = np.dot(cell, cell.T)
+    candidates = np.array(list(itertools.product((-1, 0, 1), repeat=9)), \
+                          dtype=int).reshape(-1, 3, 3)
+    candidates = candidates[np.abs(np.round(np.linalg.det(candidates))) == 1]
+    rotated = np.einsum('nij,jk,nlk->nil', candidates, metric, candidates)
+    keep = np.all(np.abs(rotated - metric) <= tol*np.abs(metric).max(), \
+                  axis=(1, 2))
+    return candidates[keep]
+
+def irreducible_count(grid, rotations, shift=(0, 0, 0)):
+    """
+    Estimate the number of irreducible k-points of a Monkhorst-Pack grid,
+    the orbits of its points under the rotations that map the grid onto
+    itself
+    
+    grid: list of 3 ints, divisions along each reciprocal lattice vector
+    rotations: array of shape (n, 3, 3), see lattice_symmetries
+    shift: list of 3 ints, 0 or 1, offset of half a division as in the
+           K_POINTS automatic card
+    
+    returns: int, number of irreducible k-points
+    """
+    grid = np.array(grid, dtype=int)
+    shift = np.array(shift, dtype=float)/2
+    indices = np.array(list(itertools.product(*[range(n) for n in grid])), \
+                       dtype=int)
+    kpoints = (indices + shift)/grid
+    strides = np.array([grid[1]*grid[2], grid[2], 1])
+    
+    labels = np.dot(indices, strides)
+    for rotation in rotations:
+        mapped = np.dot(kpoints, rotation.T)*grid - shift
+        rounded = np.round(mapped)
+        # rotations that move points off the grid are not symmetries of it
+        if np.abs(mapped - rounded).max() > 1e-6:
+            continue
+        labels = np.minimum(labels, np.dot(rounded.astype(int) % grid, \
+                                           strides))
+    return int(len(np.unique(labels)))
+
+class KGridPlanner(object):
+    """
+    Class to list k-point grids of decreasing spacing. Each grid has about
+    the same spacing along every reciprocal lattice vector, divisions
+    n_i = ceil(|b_i|/spacing), so anisotropic cells get proportionally
+    more k-points along their short axes. Grids are ordered by k-point
+    density and every distinct grid is kept: a denser grid samples
+    points the one before it does not, even when both have as many
+    irreducible k-points (2x2x2 and 3x3x3 of a simple cubic cell), and
+    the counts only estimate the symmetry of the crystal.
+    
+    Usage:
+        qeInput = InputReader('in.pw.si')
+        qeInput.read_file()
+        planner = KGridPlanner(cell_from_input(qeInput), start=[4,4,4])
+        planner.grid(0), planner.grid(1), planner.count(1)
+    """
+    
+    def __init__(self, cell, start=None, shift=(0, 0, 0), maxDivisions=16):
+        """
+        Initializes a planner for a cell
+        
+        cell: 3x3 array, lattice vectors in bohr, one per row, see
+              cell_from_input
+        start: list of 3 ints, the first grid is the coarsest one at least
+               as dense as start along every vector, [1,1,1] if None
+        shift: list of 3 ints, offset of the grids, see irreducible_count
+        maxDivisions: int, divisions along the longest reciprocal vector
+                      planned at first, doubled whenever more grids are
+                      needed
+        
+        Has 8 attributes:
+            self.cell: array, determined by cell
+            self.shift: tuple, determined by shift
+            self.lengths: array, length of each reciprocal lattice vector
+            self.rotations: array, see lattice_symmetries
+            self.startSpacing: float, largest spacing of a planned grid
+            self.maxDivisions: int, determined by maxDivisions
+            self._grids: list of arrays, planned grids
+            self._counts: list of ints, irreducible k-points of each grid
+        """
+        self.cell = np.array(cell, dtype=float)
+        self.shift = tuple(int(i) for i in shift)
+        self.lengths = reciprocal_lengths(self.cell)
+        self.rotations = lattice_symmetries(self.cell)
+        self.maxDivisions = int(maxDivisions)
+        self._grids = []
+        self._counts = []
+        
+        if start is None:
+            start = [1, 1, 1]
+        start = np.array(start, dtype=int)
+        if (len(start) != 3 or any(i < 1 for i in start)):
+            raise Exception('k-point grid is input as [x,y,z], x,y,z > 0')
+        self.startSpacing = self.spacing(start)
+        self.plan()
+    
+    def spacing(self, grid):
+        """
+        Returns largest distance between k-points of a grid along the
+        reciprocal lattice vectors in 1/bohr (float)
+        
+        grid: list of 3 ints, divisions along each vector
+        """
+        return float(np.max(self.lengths/np.array(grid, dtype=float)))
+    
+    def plan(self):
+        """
+        List the grids with spacing down to |b_max|/maxDivisions. The grid
+        changes only at spacings |b_i|/n, which are taken in decreasing
+        order, so the list is the same up to where a smaller maxDivisions
+        stopped.
+        """
+        lowest = self.lengths.max()/self.maxDivisions*(1 - 1e-9)
+        highest = self.startSpacing*(1 + 1e-9)
+        spacings = set()
+        for length in self.lengths:
+            for n in range(1, int(length/lowest) + 2):
+                spacing = length/n
+                if lowest <= spacing <= highest:
+                    spacings.add(round(spacing, 12))
+        
+        grids = []
+        counts = []
+        for spacing in sorted(spacings, reverse=True):
+            grid = np.maximum(1, np.ceil(self.lengths/spacing - 1e-9))
+            grid = grid.astype(int)
+            if grids and np.array_equal(grid, grids[-1]):
+                continue
+            grids.append(grid)
+            counts.append(irreducible_count(grid, self.rotations, \
+                                            self.shift))
+        self._grids = grids
+        self._counts = counts
+    
+    def grid(self, index):
+        """
+        Returns divisions of the index-th planned grid (array of 3 ints)
+        
+        index: int, 0 for the first grid
+        """
+        while index >= len(self._grids):
+            self.maxDivisions *= 2
+            self.plan()
+        return self._grids[index]
+    
+    def count(self, index):
+        """
+        Returns estimated number of irreducible k-points of the index-th
+        planned grid (int), see irreducible_count
+        """
+        self.grid(index)
+        return self._counts[index]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timings and counters of a convergence study, exported as JSON or in the
+Prometheus text format
+
+@author: abishekk
+"""
+import contextlib
+import cProfile
+import json
+import re
+import time
+
+class Metrics(object):
+    """
+    Class to record where the time of a study goes. Every point has spans
+    (input generation, submission, queue wait, run, parsing) in seconds,
+    and the study has counters such as the number of status queries.
+    
+    Usage:
+        metrics = Metrics(profileFile='study.prof')
+        with metrics.span('/path/to/out.pw.si', 'parse'):
+            ...
+        metrics.count('status calls', 3)
+        metrics.write_json('metrics.json')
+        print(metrics.to_prometheus())
+    """
+    
+    def __init__(self, profileFile=None):
+        """
+        Initializes empty metrics
+        
+        profileFile: string, file to which profile() writes cProfile stats,
+                     no profiling if None
+        
+        Has 4 attributes:
+            self.profileFile: string, determined by profileFile
+            self.counters: dictionary, counter name -> value
+            self._spans: dictionary, point -> dictionary, span name -> s
+            self._started: dictionary, (point, span name) -> start time of
+                           spans opened with start
+        """
+        self.profileFile = profileFile
+        self.counters = {}
+        self._spans = {}
+        self._started = {}
+    
+    @contextlib.contextmanager
+    def span(self, point, name):
+        """
+        Time the body of a with statement and add it to a span of a point
+        
+        point: string, identifies the point eg. its output file
+        name: string, span name eg. 'parse'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(point, name, time.perf_counter() - start)
+    
+    def start(self, point, name):
+        """
+        Open a span that ends in another part of the code, see stop
+        
+        point: string, identifies the point
+        name: string, span name eg. 'turnaround'
+        """
+        self._started[(point, name)] = time.perf_counter()
+    
+    def stop(self, point, name):
+        """
+        Close a span opened with start and add it to the point
+        
+        returns: float, duration of the span in s, None if it was not
+                 started
+        """
+        start = self._started.pop((point, name), None)
+        if start is None:
+            return None
+        seconds = time.perf_counter() - start
+        self.record(point, name, seconds)
+        return seconds
+    
+    def record(self, point, name, seconds):
+        """
+        Add a duration to a span of a point
+        
+        point: string, identifies the point
+        name: string, span name eg. 'queue wait'
+        seconds: float, duration
+        """
+        spans = self._spans.setdefault(point, {})
+        spans[name] = spans.get(name, 0.0) + float(seconds)
+    
+    def count(self, name, value=1):
+        """
+        Add value to a counter
+        
+        name: string, counter name eg. 'status calls'
+        value: int or float, increment
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def get_spans(self, point):
+        """
+        Returns dictionary, span name -> seconds, of a point
+        """
+        return dict(self._spans.get(point, {}))
+    
+    def totals(self):
+        """
+        Returns dictionary, span name -> seconds summed over all the points
+        """
+        totals = {}
+        for spans in self._spans.values():
+            for name, seconds in spans.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+    
+    def to_dict(self):
+        """
+        Returns dictionary with the 'points', 'totals' and 'counters'
+        """
+        return {'points': {point: dict(spans) for point, spans in \
+                           self._spans.items()}, \
+                'totals': self.totals(), \
+                'counters': dict(self.counters)}
+    
+    def write_json(self, filename):
+        """
+        Write the metrics to a JSON file
+        
+        filename: string, name of the file
+        """
+        with open(filename, 'w') as fileptr:
+            json.dump(self.to_dict(), fileptr, indent=2, sort_keys=True)
+    
+    def to_prometheus(self, prefix='qetools'):
+        """
+        Returns metrics in the Prometheus text exposition format (string)
+        
+        prefix: string, prepended to every metric name
+        """
+        lines = ['# TYPE ' + prefix + '_span_seconds gauge']
+        for point in sorted(self._spans):
+            for name, seconds in sorted(self._spans[point].items()):
+                lines.append('%s_span_seconds{point="%s",span="%s"} %r' % \
+                             (prefix, self._label(point), self._label(name), \
+                              seconds))
+        lines.append('# TYPE ' + prefix + '_span_seconds_total counter')
+        for name, seconds in sorted(self.totals().items()):
+            lines.append('%s_span_seconds_total{span="%s"} %r' % \
+                         (prefix, self._label(name), seconds))
+        for name, value in sorted(self.counters.items()):
+            metric = prefix + '_' + re.sub(r'\W+', '_', name).strip('_') + \
+                     '_total'
+            lines.append('# TYPE ' + metric + ' counter')
+            lines.append('%s %r' % (metric, value))
+        return '\n'.join(lines) + '\n'
+    
+    @staticmethod
+    def _label(value):
+        """
+        Returns value escaped for a Prometheus label (string)
+        """
+        return value.replace('\\', '\\\\').replace('"', '\\"'). \
+                     replace('\n', '\\n')
+    
+    @contextlib.contextmanager
+    def profile(self):
+        """
+        Run the body of a with statement under cProfile and write the stats
+        to self.profileFile, nothing is done if profileFile is None
+        """
+        if self.profileFile is None:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profileFile)
@@ -5,8 +5,132 @@ Parse QE output files and return the results
 
 @author: abishekk
 """
+import heapq
+import mmap
+import re
 import sys
 
+# every quantity of a QE output is printed on a line with a fixed marker:
+# the markers are found with bytes.find, and the pattern of a marker, with a
+# single named group telling which quantity was found, is only matched on
+# the lines that have it
+_qeLines = [(marker, re.compile(pattern, re.MULTILINE)) \
+            for marker, pattern in (
+    (b'!', rb'^!\s*total energy\s*=\s*(?P<totenergy>\S+)'),
+    (b'number of k points=', rb'number of k points=\s*(?P<kpoints>\d+)'),
+    (b'the Fermi energy is', rb'the Fermi energy is\s+(?P<fermienergy>\S+)'),
+    (b'highest occupied', rb'highest occupied(?:, lowest unoccupied)? ' + \
+                          rb'level \(ev\):\s*(?P<homo>\S+)'),
+    (b'iteration #', rb'iteration #\s*(?P<iteration>\d+)'),
+    (b'estimated scf accuracy', \
+     rb'estimated scf accuracy\s+<\s*(?P<scfaccuracy>\S+)'),
+    (b'convergence has been achieved', \
+     rb'convergence has been achieved in\s+(?P<scfconv>\d+)'),
+    (b'convergence NOT achieved', \
+     rb'convergence NOT achieved after\s+(?P<scfnotconv>\d+)'),
+    (b'Forces acting on atoms', rb'(?P<forces>Forces acting on atoms)'),
+    (b'(Ry/bohr**3)', rb'(?P<stress>total\s+stress\s+\(Ry/bohr\*\*3\))'),
+    (b'PWSCF', rb'PWSCF\s+:.*?CPU\s+(?P<walltime>.+?)\s+WALL'),
+    (b'Error in routine', rb'Error in routine\s+(?P<error>.+)'),
+    (b'Maximum CPU time exceeded', \
+     rb'(?P<timeexceeded>Maximum CPU time exceeded)'),
+    (b'number of atoms/cell', \
+     rb'number of atoms/cell\s*=\s*(?P<atoms>\d+)'),
+    (b'kinetic-energy cutoff', \
+     rb'kinetic-energy cutoff\s*=\s*(?P<ecutwfc>\S+)'),
+    (b'running on', rb'running on\s+(?P<processors>\d+) processors'),
+    (b'Number of MPI processes', \
+     rb'Number of MPI processes:\s*(?P<mpiprocesses>\d+)'),
+    (b'dynamical RAM', rb'Estimated total (?:allocated )?dynamical RAM' + \
+                       rb'\s*>\s*(?P<memory>[\d.]+\s*[KMGkmg][Bb])'))]
+
+def _find_qe_lines(data, groups=None):
+    """
+    Yield the matches of the patterns of _qeLines in data, in the order of
+    the lines they are on
+    
+    data: bytes or mmap, contents of a QE output
+    groups: set of strings, only the patterns with one of these groups are
+            matched, all if None
+    """
+    heap = []
+    for num, (marker, pattern) in enumerate(_qeLines):
+        if groups is None or not groups.isdisjoint(pattern.groupindex):
+            pos = data.find(marker)
+            if pos >= 0:
+                heap.append((pos, num))
+    heapq.heapify(heap)
+    
+    while heap:
+        pos, num = heap[0]
+        marker, pattern = _qeLines[num]
+        lineStart = data.rfind(b'\n', 0, pos) + 1
+        lineEnd = data.find(b'\n', pos)
+        if lineEnd < 0:
+            lineEnd = len(data)
+        
+        # the next line with the marker
+        pos = data.find(marker, lineEnd)
+        if pos >= 0:
+            heapq.heapreplace(heap, (pos, num))
+        else:
+            heapq.heappop(heap)
+        
+        match = pattern.search(data, lineStart, lineEnd)
+        if match:
+            yield match
+
+_forcePattern = re.compile(rb"atom\s+\d+\s+type\s+\d+\s+force\s+=" + \
+                           rb"\s+(\S+)\s+(\S+)\s+(\S+)")
+
+# properties that can be requested from parse_qe_op_file and the groups of
+# _qeLines that provide them
+_qeProps = {'total energy'   : ('totenergy',),
+            'kpoints'        : ('kpoints',),
+            'fermi energy'   : ('fermienergy', 'homo'),
+            'scf iterations' : ('scfconv', 'scfnotconv'),
+            'scf accuracy'   : ('scfaccuracy',),
+            'converged'      : ('scfconv', 'scfnotconv'),
+            'forces'         : ('forces',),
+            'stress'         : ('stress',),
+            'wall time'      : ('walltime',),
+            'error'          : ('error',),
+            'time exceeded'  : ('timeexceeded',),
+            'atoms'          : ('atoms',),
+            'ecutwfc'        : ('ecutwfc',),
+            'processors'     : ('processors', 'mpiprocesses'),
+            'memory'         : ('memory',)}
+
+# properties printed once in a run, parsing may stop when they are found;
+# the others are printed again at every SCF cycle or ionic step and the
+# last value is kept
+_qeOnceProps = set(['kpoints', 'wall time', 'error', 'time exceeded', \
+                    'atoms', 'ecutwfc', 'processors', 'memory'])
+
+def qe_time_to_seconds(timeStr):
+    """
+    Convert a QE timing string eg. '0.27s', '1m30.00s', '2h 5m' to seconds
+    
+    timeStr: string, time as printed by QE
+    
+    returns: float, time in seconds
+    """
+    seconds = 0.0
+    for value, unit in re.findall(r'([\d.]+)\s*([hms])', timeStr):
+        seconds += float(value) * {'h': 3600.0, 'm': 60.0, 's': 1.0}[unit]
+    return seconds
+
+def qe_memory_to_mb(memoryStr):
+    """
+    Convert a QE memory estimate eg. '0.48Mb', '1.92 GB' to MB
+    
+    memoryStr: string, memory as printed by QE
+    
+    returns: float, memory in MB
+    """
+    value, unit = re.match(r'([\d.]+)\s*([KMG])', memoryStr.upper()).groups()
+    return float(value) * {'K': 1.0/1024, 'M': 1.0, 'G': 1024.0}[unit]
+
 class OutputParser(object):
     
     """
@@ -17,6 +141,14 @@ class OutputParser(object):
        opp.parse_op_file('si.scf.cg.out')
        opp.get_totenergy()
        opp.get_kpoints()
+    
+    To read only some properties, stopping as soon as they are found if
+    they are printed once in a run:
+       opp.parse_op_file('si.scf.cg.out', ['kpoints', 'wall time'])
+    
+    To follow the output of a running job, call repeatedly:
+       opp.parse_qe_increment('out.pw.si')
+       opp.scf_diverging()
     """
     
     def __init__(self, dftCode='qe'):
@@ -25,55 +157,274 @@ class OutputParser(object):
         
         dftCode: string, program name eg. 'qe', 'vasp'
         
-        Has 5 attributes:
+        Has 7 attributes:
             self.dftName: string, determined by dftCode
             self._totEnergy: float, stores total energy of the system
             self._kpoints: int, stores k-points used by the system
-            self._qeDict: dictionary, translate generic keyword to QE keyword
+            self._record: dictionary, all the properties read from output
+            self._offset: int, bytes of the output read in incremental mode
+            self._scfHistory: list of floats, estimated scf accuracy of each
+                              iteration of the current SCF cycle
             self.rydtoev: float, convert energies from Ry to eV 
         """
         self.dftName = dftCode
         self._totEnergy = 0.0
         self._kpoints = 0 
-        # to parse QE output files
-        self._qeDict = {'total energy':'!', 'kpoints': 'number of k points'}
+        self._record = {}
+        self._offset = 0
+        self._scfHistory = []
         # TO DO: Include option to choose units
         self.rydtoev = 13.605698065894
         
-    def parse_op_file(self,filename):
+    def parse_op_file(self, filename, props=None):
         """
         Function that passes control to DFT code-based parser
         
         filename: string, path to output file
+        props: list of strings, properties to read, all if None
         """
         if self.dftName == 'qe':
-            self.parse_qe_op_file(filename)
+            self.parse_qe_op_file(filename, props)
         elif self.dftName == 'vasp':
             print('VASP support not yet implemented')
         else:
             print('DFT program name is not recognized. Check input!')
         
-    def parse_qe_op_file(self,filename):
+    def parse_qe_op_file(self, filename, props=None):
         """
         Parse QE output files and store the results
+        
+        The file is memory-mapped and scanned once for all the properties,
+        and the last value in the file is kept. When props is given, only
+        those are read, and parsing stops as soon as each of them has been
+        found if they are all printed once in a run eg. kpoints, wall time.
+        
+        filename: string, path to output file
+        props: list of strings, keys of the record to read eg. 
+               ['total energy', 'kpoints'], all if None
         """
+        if props is None:
+            wanted = None
+        else:
+            for prop in props:
+                if prop not in _qeProps:
+                    raise Exception('Unknown property: ' + str(prop))
+            wanted = set(props)
+        
+        record = self._empty_record()
+        
         # open output file in read-only mode
         try:
-            fileptr = open(filename,'r')
-            # search file for keywords and extract values
-            for line in fileptr:                
-                # total energy in eV
-                if self._qeDict['total energy'] in line:
-                    self._totEnergy = float(line.split()[4])*self.rydtoev
-                    
-                # total number of k-points
-                if self._qeDict['kpoints'] in line:
-                    self._kpoints = int(line.split()[4])
-            # close file   
-            fileptr.close() 
+            with open(filename, 'rb') as fileptr:
+                try:
+                    data = mmap.mmap(fileptr.fileno(), 0, \
+                                     access=mmap.ACCESS_READ)
+                except ValueError:
+                    # empty files cannot be mapped
+                    data = b''
+                try:
+                    self._scan_qe_output(data, record, wanted)
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
         except OSError:
             print('Cannot open: ', filename)
             sys.exit(1)
+        
+        self._record = record
+        self._totEnergy = record['total energy']
+        self._kpoints = record['kpoints']
+    
+    def parse_qe_increment(self, filename):
+        """
+        Parse only the bytes appended to a QE output since the last call
+        
+        Only complete lines are read, and a forces or stress block is read 
+        once all of it has been written, so the job can still be writing to 
+        the file. The record keeps the latest value of every property.
+        
+        filename: string, path to output file of a running job
+        
+        returns: list of floats, estimated scf accuracy of the iterations 
+                 read in this call
+        """
+        if not self._record:
+            self._record = self._empty_record()
+        
+        try:
+            with open(filename, 'rb') as fileptr:
+                fileptr.seek(self._offset)
+                data = fileptr.read()
+        except OSError:
+            # the job has not started writing yet
+            return []
+        
+        # stop at the last complete line and before an unfinished block
+        end = data.rfind(b'\n') + 1
+        forcesStart = data.rfind(b'Forces acting on atoms', 0, end)
+        if forcesStart >= 0 and data.find(b'Total force', forcesStart, \
+                                          end) < 0:
+            end = data.rfind(b'\n', 0, forcesStart) + 1
+        stressStart = data.rfind(b'total   stress', 0, end)
+        if stressStart >= 0 and data.count(b'\n', stressStart, end) < 4:
+            end = data.rfind(b'\n', 0, stressStart) + 1
+        
+        newAccuracy = self._scan_qe_output(data[:end], self._record, None, \
+                                           self._scfHistory)
+        self._offset += end
+        
+        self._totEnergy = self._record['total energy']
+        self._kpoints = self._record['kpoints']
+        
+        return newAccuracy
+    
+    def scf_diverging(self, window=5, factor=10.0):
+        """
+        Check if the SCF cycle being followed in incremental mode diverges
+        
+        window: int, number of latest iterations that are checked
+        factor: float, the cycle diverges if the estimated scf accuracy of
+                each of the latest window iterations is worse than factor 
+                times the best accuracy reached in the cycle
+        
+        returns: bool, True if the SCF cycle diverges
+        """
+        if len(self._scfHistory) <= window:
+            return False
+        best = min(self._scfHistory[:-window])
+        return all(accuracy > factor*best \
+                   for accuracy in self._scfHistory[-window:])
+    
+    @staticmethod
+    def _empty_record():
+        """
+        Returns record with the value of each property before it is read 
+        (dictionary)
+        """
+        return {'total energy'   : 0.0,
+                'kpoints'        : 0,
+                'fermi energy'   : None,
+                'scf iterations' : 0,
+                'scf accuracy'   : None,
+                'converged'      : False,
+                'forces'         : None,
+                'stress'         : None,
+                'wall time'      : None,
+                'error'          : None,
+                'time exceeded'  : False,
+                'atoms'          : None,
+                'ecutwfc'        : None,
+                'processors'     : None,
+                'memory'         : None}
+    
+    def _scan_qe_output(self, data, record, wanted, history=None):
+        """
+        Fill record from the bytes of a QE output, stopping early once every
+        property in wanted is found if they are all printed once in a run
+        
+        data: bytes or mmap, contents of the output file
+        record: dictionary, updated in place
+        wanted: set of strings, properties still needed, all if None
+        history: list of floats, estimated scf accuracy of the current SCF 
+                 cycle, updated in place if given
+        
+        returns: list of floats, estimated scf accuracy of the iterations 
+                 found in data
+        """
+        groups = None
+        if wanted is not None:
+            groups = set(group for prop in wanted for group in _qeProps[prop])
+        
+        newAccuracy = []
+        for match in _find_qe_lines(data, groups):
+            group = match.lastgroup
+            value = match.group(group)
+            
+            if group == 'iteration':
+                # the first iteration starts a new SCF cycle
+                if history is not None and int(value) == 1:
+                    del history[:]
+            elif group == 'scfaccuracy':
+                record['scf accuracy'] = float(value)
+                newAccuracy.append(record['scf accuracy'])
+                if history is not None:
+                    history.append(record['scf accuracy'])
+            elif group == 'totenergy':
+                # total energy in eV
+                record['total energy'] = float(value)*self.rydtoev
+            elif group == 'kpoints':
+                # total number of k-points
+                record['kpoints'] = int(value)
+            elif group in ('fermienergy', 'homo'):
+                # printed in eV
+                record['fermi energy'] = float(value)
+            elif group in ('scfconv', 'scfnotconv'):
+                record['scf iterations'] = int(value)
+                record['converged'] = (group == 'scfconv')
+            elif group == 'forces':
+                record['forces'] = self._read_forces(data, match.end())
+            elif group == 'stress':
+                record['stress'] = self._read_stress(data, match.end())
+            elif group == 'walltime':
+                record['wall time'] = qe_time_to_seconds(value.decode())
+            elif group == 'error':
+                # routine and error code, the message is on the next line
+                end = data.find(b'\n', match.end() + 1)
+                record['error'] = ' '.join(data[match.start(group):end if \
+                                                end >= 0 else len(data)]. \
+                                           decode(errors='replace').split())
+            elif group == 'timeexceeded':
+                record['time exceeded'] = True
+            elif group == 'atoms':
+                record['atoms'] = int(value)
+            elif group == 'ecutwfc':
+                # in Ry
+                record['ecutwfc'] = float(value)
+            elif group in ('processors', 'mpiprocesses'):
+                record['processors'] = int(value)
+            elif group == 'memory':
+                # estimate of pw.x summed over the processes, in MB
+                record['memory'] = qe_memory_to_mb(value.decode())
+            
+            if wanted is not None and group != 'iteration':
+                wanted = set(prop for prop in wanted \
+                             if prop not in _qeOnceProps or \
+                                group not in _qeProps[prop])
+                if not wanted:
+                    break
+        
+        return newAccuracy
+    
+    @staticmethod
+    def _read_forces(data, start):
+        """
+        Read the total force on each atom following the 'Forces acting on 
+        atoms' header
+        
+        returns: list of [fx, fy, fz] in Ry/au
+        """
+        end = data.find(b'Total force', start)
+        if end < 0:
+            end = len(data)
+        forces = []
+        for line in data[start:end].splitlines()[1:]:
+            match = _forcePattern.search(line)
+            if match:
+                forces.append([float(f) for f in match.groups()])
+            elif forces and line.strip():
+                # verbose outputs list the contributions after the total
+                break
+        return forces
+    
+    @staticmethod
+    def _read_stress(data, start):
+        """
+        Read the stress tensor following the 'total stress' header
+        
+        returns: list of 3 rows of the stress tensor in kbar
+        """
+        lines = data[start:start+512].splitlines()[1:4]
+        return [[float(s) for s in line.split()[3:6]] for line in lines]
                       
     def get_totenergy(self):
         """
@@ -86,4 +437,55 @@ class OutputParser(object):
         Returns the total number of k-points used for DFT calculation (int)
         """
         return self._kpoints
-    
\ No newline at end of file
+    
+    def get_fermienergy(self):
+        """
+        Returns Fermi energy, or highest occupied level for insulators, in eV
+        (float), None if not found
+        """
+        return self._record.get('fermi energy')
+    
+    def get_forces(self):
+        """
+        Returns forces on the atoms in Ry/au (list of [fx, fy, fz]), None if 
+        not found
+        """
+        return self._record.get('forces')
+    
+    def get_stress(self):
+        """
+        Returns stress tensor in kbar (3x3 list), None if not found
+        """
+        return self._record.get('stress')
+    
+    def get_scf_iterations(self):
+        """
+        Returns number of iterations of the last SCF cycle (int)
+        """
+        return self._record.get('scf iterations', 0)
+    
+    def get_walltime(self):
+        """
+        Returns wall time of the run in seconds (float), None if not found
+        """
+        return self._record.get('wall time')
+    
+    def get_converged(self):
+        """
+        Returns True if the last SCF cycle converged (bool)
+        """
+        return self._record.get('converged', False)
+    
+    def get_scf_history(self):
+        """
+        Returns estimated scf accuracy of each iteration of the current SCF 
+        cycle read in incremental mode (list of floats)
+        """
+        return self._scfHistory.copy()
+    
+    def get_record(self):
+        """
+        Returns copy of all the properties read from output (dictionary)
+        """
+        return self._record.copy()
+
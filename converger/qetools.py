@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point of the converger
+
+Usage:
+    qetools.py run in.pw.si -p ecutwfc 20 5 -p kpoints 4,4,4 1,1,1
+               --tol 1e-4 --backend pbs --cores 16 --work-dir si
+    qetools.py resume si
+    qetools.py status si
+    qetools.py parse 'si/*/out.*' --json
+    qetools.py report --store results --html report.html
+
+NumPy and matplotlib are only imported by the subcommands that need them
+(run, resume and report), so status and parse start quickly enough to be
+called from scheduler epilogue scripts and cron.
+
+@author: abishekk
+"""
+import argparse
+import json
+import os
+import sys
+
+# file in the work directory of a study with the arguments of run, read by
+# resume, and the journal of the study
+_specFile = 'qetools.json'
+_journalFile = 'study.jsonl'
+
+# columns printed by parse for every output
+_parseColumns = ('total energy', 'kpoints', 'scf iterations', 'converged', \
+                 'wall time')
+
+def make_parser():
+    """
+    Returns argparse.ArgumentParser with every subcommand
+    """
+    parser = argparse.ArgumentParser(prog='qetools', \
+                 description='Convergence studies of QE calculations')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    run = commands.add_parser('run', help='start a convergence study')
+    run.add_argument('input', help='sample QE input file')
+    run.add_argument('-p', '--param', nargs=3, action='append', \
+                     required=True, metavar=('NAME', 'START', 'STEP'), \
+                     help='parameter to converge eg. ecutwfc 20 5 or ' + \
+                          'kpoints 4,4,4 1,1,1, kpoints 4,4,4 auto to ' + \
+                          'plan grids from the cell, repeat to converge ' + \
+                          'several together')
+    run.add_argument('--tol', type=float, default=1e-6, \
+                     help='tolerance of the total energy')
+    run.add_argument('--work-dir', default='.', \
+                     help='directory of the job directories')
+    run.add_argument('--backend', default='pbs', \
+                     choices=['local', 'pbs', 'slurm'])
+    run.add_argument('--cores', type=int, default=16, \
+                     help='cores per job')
+    run.add_argument('--executable', default='pw.x')
+    run.add_argument('--batch', type=int, default=1, \
+                     help='points kept in the queue at once')
+    run.add_argument('--adaptive', action='store_true', \
+                     help='jump to the predicted converged value')
+    run.add_argument('--restart', action='store_true', \
+                     help='start points from the previous charge density')
+    run.add_argument('--cache', help='directory of a ResultCache')
+    run.add_argument('--store', help='directory of a ResultStore')
+    run.add_argument('--cost-model', help='JSON file of a CostModel that ' + \
+                     'learns run times, orders the points by them and ' + \
+                     'sets the time limit of each job')
+    
+    resume = commands.add_parser('resume', \
+                                 help='run a study again from its journal')
+    resume.add_argument('workDir', help='work directory of the study')
+    
+    status = commands.add_parser('status', \
+                                 help='print the points of a study')
+    status.add_argument('workDir', help='work directory of the study, or ' + \
+                        'its journal file')
+    status.add_argument('--queue', choices=['local', 'pbs', 'slurm'], \
+                        help='also ask this queue which jobs are running')
+    
+    parse = commands.add_parser('parse', help='print results of outputs')
+    parse.add_argument('patterns', nargs='+', \
+                       help='output files, globs or directories')
+    parse.add_argument('--json', action='store_true', \
+                       help='print the full record of each output as JSON')
+    parse.add_argument('--store', help='also add the results to the ' + \
+                       'ResultStore in this directory')
+    parse.add_argument('--label', default='', \
+                       help='label of the results added to the store')
+    
+    report = commands.add_parser('report', \
+                                 help='plot studies kept in a ResultStore')
+    report.add_argument('--store', required=True, \
+                        help='directory of the ResultStore')
+    report.add_argument('--label', action='append', \
+                        help='study to report, all if not given')
+    report.add_argument('--html', default='report.html', \
+                        help='HTML report of all the studies')
+    report.add_argument('--plot-dir', \
+                        help='directory for one PNG plot per study')
+    report.add_argument('--processes', type=int, \
+                        help='worker processes that render the plots')
+    return parser
+
+def cmd_run(args):
+    """
+    Start a study and save its arguments for resume
+    """
+    workDir = os.path.abspath(args.work_dir)
+    if not os.path.exists(workDir):
+        os.makedirs(workDir)
+    spec = vars(args).copy()
+    spec['input'] = os.path.abspath(args.input)
+    spec['work_dir'] = workDir
+    for key in ('cache', 'store', 'cost_model'):
+        if spec[key] is not None:
+            spec[key] = os.path.abspath(spec[key])
+    with open(os.path.join(workDir, _specFile), 'w') as fileptr:
+        json.dump(spec, fileptr, indent=2, sort_keys=True)
+    return run_spec(spec)
+
+def cmd_resume(args):
+    """
+    Run a study again with the arguments saved by run. Points recorded in
+    the journal are reused or reattached, see StudyJournal.
+    """
+    specPath = os.path.join(args.workDir, _specFile)
+    try:
+        fileptr = open(specPath, 'r')
+    except OSError:
+        print('Cannot open: ', specPath)
+        sys.exit(1)
+    with fileptr:
+        spec = json.load(fileptr)
+    return run_spec(spec)
+
+def run_spec(spec):
+    """
+    Run the study described by the arguments of run
+    
+    spec: dictionary, arguments of run with absolute paths
+    
+    returns: int, exit status
+    """
+    # the study pulls in NumPy, only load it here
+    from backends import get_backend
+    from converger import Converger
+    from cost_model import CostModel
+    from result_cache import ResultCache
+    from result_store import ResultStore
+    from study_journal import StudyJournal
+    
+    names = []
+    startVals = []
+    steps = []
+    for name, start, step in spec['param']:
+        names.append(name)
+        startVals.append([float(value) for value in start.split(',')])
+        if step == 'auto':
+            steps.append(step)
+        else:
+            steps.append([float(value) for value in step.split(',')])
+    
+    study = Converger(spec['input'], 'total energy', spec['tol'], 'qe', \
+                      get_backend(spec['backend'], \
+                                  coresPerJob=spec['cores']), \
+                      spec['executable'], \
+                      cache=None if spec['cache'] is None else \
+                            ResultCache(spec['cache']), \
+                      journal=StudyJournal(os.path.join(spec['work_dir'], \
+                                                        _journalFile)), \
+                      workDir=spec['work_dir'], \
+                      store=None if spec['store'] is None else \
+                            ResultStore(spec['store']), \
+                      costModel=None if spec.get('cost_model') is None \
+                                else CostModel(spec['cost_model']))
+    study.start_joint_convergence(names, startVals, steps, spec['batch'], \
+                                  spec['adaptive'], spec['restart'])
+    return 0
+
+def cmd_status(args):
+    """
+    Print the last state of every point in the journal of a study
+    """
+    from study_journal import StudyJournal
+    
+    journalPath = args.workDir
+    if os.path.isdir(journalPath):
+        journalPath = os.path.join(journalPath, _journalFile)
+    if not os.path.exists(journalPath):
+        print('Cannot open: ', journalPath)
+        sys.exit(1)
+    journal = StudyJournal(journalPath)
+    
+    points = sorted(journal.points())
+    entries = [journal.get(outPath) for outPath in points]
+    queued = None
+    if args.queue is not None:
+        from backends import get_backend
+        queued = get_backend(args.queue).status( \
+                     [entry['job'] for entry in entries \
+                      if entry['status'] == 'submitted' and entry['job']])
+    
+    counts = {}
+    for outPath, entry in zip(points, entries):
+        status = entry['status']
+        if queued is not None and status == 'submitted':
+            status = 'queued' if entry['job'] in queued else 'left queue'
+        counts[status] = counts.get(status, 0) + 1
+        line = '%-10s %-16s %s' % (status, entry['job'] or '-', outPath)
+        if entry['result'] is not None:
+            line += '  %.8f' % entry['result']['total energy']
+        print(line)
+    print(', '.join('%d %s' % (counts[status], status) \
+                    for status in sorted(counts)))
+    return 0
+
+def cmd_parse(args):
+    """
+    Print the results read from output files
+    """
+    from bulk_parser import find_outputs
+    from output_parser import OutputParser
+    from retry_policy import classify_outcome
+    
+    paths = find_outputs(args.patterns)
+    readOut = OutputParser('qe')
+    store = None
+    if args.store is not None:
+        from result_store import ResultStore
+        store = ResultStore(args.store)
+    
+    if not args.json:
+        print('\t'.join(('path',) + _parseColumns + ('outcome',)))
+    for path in paths:
+        readOut.parse_op_file(path)
+        record = readOut.get_record()
+        if args.json:
+            print(json.dumps(dict(record, path=path), sort_keys=True))
+        else:
+            print('\t'.join([path] + [str(record.get(column)) \
+                                      for column in _parseColumns] + \
+                             [classify_outcome(record)]))
+        if store is not None:
+            store.add(path, record, args.label)
+    if store is not None:
+        store.flush()
+    return 0
+
+def cmd_report(args):
+    """
+    Write the HTML report, and plots if asked, of studies in a store
+    """
+    from report import render_reports, store_summaries, write_html_report
+    from result_store import ResultStore
+    
+    summaries = store_summaries(ResultStore(args.store), args.label)
+    if args.plot_dir is not None:
+        if not os.path.exists(args.plot_dir):
+            os.makedirs(args.plot_dir)
+        for path in render_reports(summaries, \
+                                   [os.path.join(args.plot_dir, \
+                                                 summary['name'] + '.png') \
+                                    for summary in summaries], \
+                                   args.processes):
+            print(path)
+    write_html_report(summaries, args.html)
+    print(args.html)
+    return 0
+
+_commands = {'run': cmd_run, 'resume': cmd_resume, 'status': cmd_status, \
+             'parse': cmd_parse, 'report': cmd_report}
+
+def main(argv=None):
+    """
+    Run the subcommand given on the command line
+    
+    argv: list of strings, arguments after the program name, default is
+          sys.argv[1:]
+    
+    returns: int, exit status
+    """
+    args = make_parser().parse_args(argv)
+    return _commands[args.command](args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Plots and HTML reports of convergence studies, rendered to files without a
+display
+
+@author: abishekk
+"""
+import concurrent.futures
+import html
+import io
+import os
+
+# parameters stored as columns of a ResultStore, kpoints as the grid k1-k3
+_storeParams = ('ecutwfc', 'ecutrho', 'degauss', 'kpoints')
+
+def make_summary(name, params, criterion, results, converged=None):
+    """
+    Collect what is reported about one study
+    
+    name: string, name of the study eg. the input file
+    params: list of strings, parameters of the study eg. ['ecutwfc']
+    criterion: string, property used for convergence eg. 'total energy'
+    results: list of lists, one row per point, the value of each parameter
+             (number of k-points for a k-point grid) then of criterion
+    converged: list of lists, value of each parameter needed for
+               convergence, not reported if None
+    
+    returns: dictionary, summary of the study
+    """
+    return {'name': str(name), 'params': list(params), \
+            'criterion': str(criterion), \
+            'results': [[float(value) for value in row] for row in results], \
+            'converged': None if converged is None else \
+                         [[float(value) for value in values] \
+                          for values in converged]}
+
+def store_summaries(store, labels=None, criterion='total energy'):
+    """
+    Build the summaries of studies from the results kept in a ResultStore
+    
+    store: ResultStore, results of past runs
+    labels: list of strings, labels of the studies, all if None
+    criterion: string, column plotted against the parameters
+    
+    returns: list of dictionaries, see make_summary
+    """
+    # NumPy is only needed to read the store
+    import numpy as np
+    
+    table = store.query()
+    if labels is None:
+        labels = sorted(set(table['label']))
+    
+    summaries = []
+    for label in labels:
+        rows = table['label'] == label
+        params = []
+        columns = []
+        for param in _storeParams:
+            if param == 'kpoints':
+                if np.any(table['k1'][rows] > 0):
+                    params.append(param)
+                    columns.append(table['kpoints'][rows])
+            elif not np.all(np.isnan(table[param][rows])):
+                params.append(param)
+                columns.append(table[param][rows])
+        results = np.column_stack(columns + [table[criterion][rows]])
+        summaries.append(make_summary(label, params, criterion, results))
+    return summaries
+
+def plot_convergence(summary, outFile):
+    """
+    Plot the criterion of a study against its first parameter, one line per
+    value of the other parameters, and save the figure
+    
+    summary: dictionary, see make_summary
+    outFile: string, image file, its extension sets the format eg. .png,
+             .svg, .pdf
+    """
+    figure = _figure(summary)
+    figure.savefig(outFile)
+
+def write_html_report(summaries, outFile, title='Convergence tests'):
+    """
+    Write one HTML page with the converged values and the plot of every
+    study
+    
+    summaries: list of dictionaries, see make_summary
+    outFile: string, HTML file
+    title: string, heading of the page
+    """
+    parts = ['<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8">', \
+             '<title>' + html.escape(title) + '</title></head>\n<body>\n', \
+             '<h1>' + html.escape(title) + '</h1>\n']
+    for summary in summaries:
+        parts.append('<h2>' + html.escape(summary['name']) + '</h2>\n')
+        parts.append('<p>%d points</p>\n' % len(summary['results']))
+        if summary['converged'] is not None:
+            parts.append('<table>\n')
+            for param, values in zip(summary['params'], \
+                                     summary['converged']):
+                parts.append('<tr><td>' + html.escape(param) + \
+                             '</td><td>' + \
+                             ' '.join('%g' % value for value in values) + \
+                             '</td></tr>\n')
+            parts.append('</table>\n')
+        if summary['results']:
+            svg = io.StringIO()
+            _figure(summary).savefig(svg, format='svg')
+            # drop the XML header, the SVG is inlined in the page
+            parts.append(svg.getvalue()[svg.getvalue().find('<svg'):])
+    parts.append('</body>\n</html>\n')
+    
+    with open(outFile, 'w') as fileptr:
+        fileptr.write(''.join(parts))
+
+def _render_one(summary, outFile):
+    """
+    Render one plot or report, executed in a worker process of
+    render_reports
+    
+    returns: string, outFile
+    """
+    if os.path.splitext(outFile)[1].lower() in ('.html', '.htm'):
+        write_html_report([summary], outFile, summary['name'])
+    else:
+        plot_convergence(summary, outFile)
+    return outFile
+
+def render_reports(summaries, outFiles, processes=None):
+    """
+    Render the plot or report of many studies across a process pool. The
+    format of each file is set by its extension, .html writes a report.
+    
+    summaries: list of dictionaries, see make_summary
+    outFiles: list of strings, file of each summary
+    processes: int, number of worker processes, default is all cores
+    
+    returns: list of strings, files written
+    """
+    if processes == 1 or len(summaries) <= 1:
+        return [_render_one(summary, outFile) for summary, outFile in \
+                zip(summaries, outFiles)]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(_render_one, summaries, outFiles))
+
+def _figure(summary):
+    """
+    Returns matplotlib Figure with the plot of a study
+    """
+    # matplotlib is only imported when something is drawn, and Figure does
+    # not need pyplot or a display
+    from matplotlib.figure import Figure
+    
+    figure = Figure()
+    axes = figure.add_subplot(1, 1, 1)
+    results = sorted(summary['results'])
+    if len(summary['params']) <= 1:
+        axes.plot([row[0] for row in results], [row[-1] for row in results], \
+                  'ro-', linewidth=2, markersize=10)
+    else:
+        others = sorted(set(tuple(row[1:-1]) for row in results))
+        for values in others:
+            rows = [row for row in results if tuple(row[1:-1]) == values]
+            axes.plot([row[0] for row in rows], [row[-1] for row in rows], \
+                      'o-', linewidth=2, markersize=10, \
+                      label=', '.join('%g' % value for value in values))
+        axes.legend(title=', '.join(summary['params'][1:]))
+    axes.set_xlabel(summary['params'][0] if summary['params'] else '')
+    axes.set_ylabel(summary['criterion'])
+    axes.set_title('Convergence test')
+    return figure
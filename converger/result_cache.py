@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed results keyed by a hash of the generated input
+
+@author: abishekk
+"""
+import hashlib
+import json
+import os
+import time
+
+# the cards end the list of ATOMIC_SPECIES
+from input_reader import _qeCards
+
+class ResultCache(object):
+    """
+    Class to store parsed results of DFT runs so that a run with the same
+    input and pseudopotentials is never submitted twice. Each entry is a
+    small JSON file named after the hash of the input.
+    
+    Usage:
+        cache = ResultCache('.qecache', maxEntries=1000, maxAge=30*86400)
+        key = cache.input_key(linesList, '/path/to/job')
+        result = cache.get(key)
+        if result is None:
+            ...
+            cache.put(key, parser.get_record())
+    """
+    
+    def __init__(self, cacheDir='.qecache', maxEntries=None, maxAge=None):
+        """
+        Initializes a cache in cacheDir
+        
+        cacheDir: string, directory in which the entries are stored
+        maxEntries: int, entries kept after eviction, no limit if None
+        maxAge: float, age in s after which an entry expires, no limit if
+                None
+        
+        Has 3 attributes:
+            self.cacheDir: string, determined by cacheDir
+            self.maxEntries: int, determined by maxEntries
+            self.maxAge: float, determined by maxAge
+        """
+        self.cacheDir = os.path.abspath(cacheDir)
+        self.maxEntries = maxEntries
+        self.maxAge = maxAge
+        
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+    
+    def input_key(self, lines, workDir='.'):
+        """
+        Hash the normalized input and the pseudopotential files it uses
+        
+        Whitespace, blank lines and comments do not change the key. The
+        pseudopotentials listed under ATOMIC_SPECIES are read from pseudo_dir
+        and hashed by content; a file that cannot be found is hashed by name.
+        
+        lines: list of strings, lines of the generated input file
+        workDir: string, directory relative to which pseudo_dir is resolved
+        
+        returns: string, hex digest used as the cache key
+        """
+        digest = hashlib.sha256()
+        pseudoDir = workDir
+        pseudoFiles = []
+        inSpecies = False
+        
+        for line in lines:
+            # drop comments and normalize whitespace
+            line = line.split('!')[0].split('#')[0]
+            words = line.split()
+            if not words:
+                continue
+            digest.update((' '.join(words) + '\n').encode())
+            
+            if 'pseudo_dir' in line:
+                pseudoDir = line.split('=')[1].strip().strip(",'\"")
+                pseudoDir = os.path.expandvars(pseudoDir)
+            if words[0].upper() in _qeCards or words[0].startswith('&'):
+                inSpecies = False
+            if inSpecies and len(words) >= 3:
+                pseudoFiles.append(words[2])
+            if words[0].upper() == 'ATOMIC_SPECIES':
+                inSpecies = True
+        
+        for name in pseudoFiles:
+            path = os.path.join(workDir, pseudoDir, name)
+            digest.update(name.encode())
+            try:
+                with open(path, 'rb') as fileptr:
+                    digest.update(hashlib.sha256(fileptr.read()).digest())
+            except OSError:
+                pass
+        
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """
+        Look up the result stored for a key
+        
+        key: string, returned by input_key
+        
+        returns: dictionary of results, None if missing or expired
+        """
+        path = self._entry_path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.maxAge is not None and age > self.maxAge:
+                os.remove(path)
+                return None
+            with open(path, 'r') as fileptr:
+                return json.load(fileptr)
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, key, result):
+        """
+        Store the result for a key and evict old entries
+        
+        key: string, returned by input_key
+        result: dictionary, parsed results, must be JSON serializable
+        """
+        path = self._entry_path(key)
+        # write to a temporary file first so readers never see half an entry
+        with open(path + '.tmp', 'w') as fileptr:
+            json.dump(result, fileptr)
+        os.replace(path + '.tmp', path)
+        self.evict()
+    
+    def invalidate(self, key=None):
+        """
+        Remove the entry for a key, or every entry if key is None
+        
+        key: string, returned by input_key
+        """
+        if key is not None:
+            paths = [self._entry_path(key)]
+        else:
+            paths = [entry[1] for entry in self._entries()]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def evict(self):
+        """
+        Remove expired entries and then the oldest entries beyond maxEntries
+        """
+        entries = self._entries()
+        now = time.time()
+        if self.maxAge is not None:
+            for mtime, path in entries:
+                if now - mtime > self.maxAge:
+                    os.remove(path)
+            entries = [entry for entry in entries \
+                       if now - entry[0] <= self.maxAge]
+        if self.maxEntries is not None and len(entries) > self.maxEntries:
+            for mtime, path in entries[:len(entries) - self.maxEntries]:
+                os.remove(path)
+    
+    def _entries(self):
+        """
+        Returns list of [modification time, path] of all entries, oldest
+        first
+        """
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith('.json'):
+                path = os.path.join(self.cacheDir, name)
+                entries.append([os.path.getmtime(path), path])
+        entries.sort()
+        return entries
+    
+    def _entry_path(self, key):
+        """
+        Returns path of the file storing the entry for key (string)
+        """
+        return os.path.join(self.cacheDir, key + '.json')
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar on-disk store of the results of many studies, read back through
+memory maps
+
+@author: abishekk
+"""
+import glob
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+# columns of every row, the converged value of the varied parameters and the
+# results read by OutputParser. Values missing from a run are NaN or 0.
+_dtype = np.dtype([('time', 'f8'), ('label', 'i4'), ('ecutwfc', 'f8'), \
+                   ('ecutrho', 'f8'), ('degauss', 'f8'), ('k1', 'i4'), \
+                   ('k2', 'i4'), ('k3', 'i4'), ('total energy', 'f8'), \
+                   ('fermi energy', 'f8'), ('kpoints', 'i4'), \
+                   ('scf iterations', 'i4'), ('converged', '?'), \
+                   ('wall time', 'f8')])
+
+class ResultStore(object):
+    """
+    Class to keep the results of all the runs of many studies without
+    re-parsing their outputs. Rows are buffered and written as segments:
+    a structured NumPy array (.npy), the output paths of its rows, and a
+    small JSON index with the labels used in the segment and the range of
+    every column. Segments are only ever added, so several studies can
+    write to one store, and compact merges them. Queries skip the segments
+    whose ranges exclude the filter and read the others as memory maps.
+    
+    Usage:
+        store = ResultStore('results')
+        store.add('/path/to/out.pw.si', parser.get_record(), 'si',
+                  {'ecutwfc': 30.0})
+        store.flush()
+        table = store.query(label='si', ecutwfc=(20, 60), converged=True)
+        table['ecutwfc'], table['total energy']
+    """
+    
+    def __init__(self, storeDir='results', segmentRows=4096):
+        """
+        Initializes a store in storeDir
+        
+        storeDir: string, directory of the segments
+        segmentRows: int, rows buffered before a segment is written
+        
+        Has 3 attributes:
+            self.storeDir: string, absolute path of storeDir
+            self.segmentRows: int, determined by segmentRows
+            self._buffer: list, [output file, label, row] of rows not
+                          written yet
+        """
+        self.storeDir = os.path.abspath(storeDir)
+        self.segmentRows = int(segmentRows)
+        self._buffer = []
+        
+        if not os.path.exists(self.storeDir):
+            os.makedirs(self.storeDir)
+    
+    def add(self, outPath, result, label='', params=None, qeInput=None):
+        """
+        Add the result of one run. The cutoff and the k-point grid that
+        params does not give are taken from result or qeInput, so that
+        every row has them whichever parameters its study varied.
+        
+        outPath: string, output file of the run
+        result: dictionary, record from OutputParser
+        label: string, name of the study eg. the structure 'si'
+        params: dictionary, value of the parameters of the run, eg.
+                {'ecutwfc': 30.0, 'kpoints': [4,4,4]}
+        qeInput: InputReader, input of the run read with read_file, not
+                 used if None
+        """
+        known = {}
+        if qeInput is not None:
+            known.update(self._input_params(qeInput))
+        if result.get('ecutwfc') is not None:
+            known['ecutwfc'] = result['ecutwfc']
+        if params is not None:
+            known.update(params)
+        
+        row = np.zeros((), dtype=_dtype)
+        row['time'] = time.time()
+        for column in ('ecutwfc', 'ecutrho', 'degauss', 'total energy', \
+                       'fermi energy', 'wall time'):
+            row[column] = np.nan
+        for param, value in known.items():
+            if param == 'kpoints':
+                row['k1'], row['k2'], row['k3'] = [int(k) for k in value]
+            elif param in _dtype.names:
+                row[param] = np.ravel(value)[0]
+        for column in ('total energy', 'fermi energy', 'kpoints', \
+                       'scf iterations', 'converged', 'wall time'):
+            if result.get(column) is not None:
+                row[column] = result[column]
+        
+        self._buffer.append([os.path.abspath(outPath), str(label), row])
+        if len(self._buffer) >= self.segmentRows:
+            self.flush()
+    
+    def flush(self):
+        """
+        Write the buffered rows as a new segment
+        """
+        if not self._buffer:
+            return
+        paths = [entry[0] for entry in self._buffer]
+        labels = sorted(set(entry[1] for entry in self._buffer))
+        rows = np.array([entry[2] for entry in self._buffer], dtype=_dtype)
+        rows['label'] = [labels.index(entry[1]) for entry in self._buffer]
+        self.write_segment(rows, paths, labels)
+        self._buffer = []
+    
+    def write_segment(self, rows, paths, labels):
+        """
+        Write one segment, its index is written last so that readers never
+        see half a segment
+        
+        rows: structured array with the columns of the store
+        paths: list of strings, output file of each row
+        labels: list of strings, label of each value of the column 'label'
+        """
+        name = os.path.join(self.storeDir, 'seg.%d.%s' % (time.time()*1e6, \
+                            uuid.uuid4().hex[:8]))
+        np.save(name + '.npy', rows)
+        np.save(name + '.paths.npy', np.array(paths, dtype=str))
+        
+        ranges = {}
+        for column in _dtype.names:
+            values = rows[column][~np.isnan(rows[column])] \
+                     if rows.dtype[column].kind == 'f' else rows[column]
+            if len(values):
+                ranges[column] = [values.min().item(), values.max().item()]
+        with open(name + '.json.tmp', 'w') as fileptr:
+            json.dump({'rows': len(rows), 'labels': labels, \
+                       'ranges': ranges}, fileptr)
+        os.replace(name + '.json.tmp', name + '.json')
+    
+    def segments(self):
+        """
+        Returns list of [segment name, index] of the written segments,
+        oldest first
+        """
+        segments = []
+        for indexFile in sorted(glob.glob(os.path.join(self.storeDir, \
+                                                      'seg.*.json'))):
+            with open(indexFile, 'r') as fileptr:
+                segments.append([indexFile[:-len('.json')], \
+                                 json.load(fileptr)])
+        return segments
+    
+    def query(self, label=None, columns=None, **filters):
+        """
+        Select the rows of the written segments that pass every filter
+        
+        label: string, label of the rows, any label if None
+        columns: list of strings, columns returned, all if None
+        filters: column name -> value, or (low, high) to select low <=
+                 value <= high, eg. ecutwfc=(20, 60), converged=True
+        
+        returns: dictionary of NumPy arrays with the columns, 'label' and
+                 'path' of the selected rows
+        """
+        if columns is None:
+            columns = [column for column in _dtype.names \
+                       if column != 'label']
+        for column in list(columns) + list(filters):
+            if column not in _dtype.names:
+                raise Exception('Unknown column: ' + column)
+        
+        parts = {column: [] for column in columns}
+        parts['label'] = []
+        parts['path'] = []
+        for name, index in self.segments():
+            if label is not None and label not in index['labels']:
+                continue
+            if not self._may_match(index['ranges'], filters):
+                continue
+            
+            rows = np.load(name + '.npy', mmap_mode='r')
+            mask = np.ones(len(rows), dtype=bool)
+            if label is not None:
+                mask &= rows['label'] == index['labels'].index(label)
+            for column, value in filters.items():
+                if isinstance(value, (tuple, list)):
+                    mask &= (rows[column] >= value[0]) & \
+                            (rows[column] <= value[1])
+                else:
+                    mask &= rows[column] == value
+            if not mask.any():
+                continue
+            
+            for column in columns:
+                parts[column].append(np.asarray(rows[column][mask]))
+            parts['label'].append(np.array(index['labels'], dtype=str) \
+                                  [rows['label'][mask]])
+            parts['path'].append(np.load(name + '.paths.npy', \
+                                         mmap_mode='r')[mask])
+        
+        table = {}
+        for column, values in parts.items():
+            if column == 'label' or column == 'path':
+                table[column] = np.concatenate(values) if values else \
+                                np.array([], dtype=str)
+            else:
+                table[column] = np.concatenate(values) if values else \
+                                np.array([], dtype=_dtype[column])
+        return table
+    
+    def compact(self):
+        """
+        Merge all the written segments into one
+        """
+        segments = self.segments()
+        if len(segments) <= 1:
+            return
+        labels = sorted(set(label for name, index in segments \
+                            for label in index['labels']))
+        allRows = []
+        allPaths = []
+        for name, index in segments:
+            rows = np.load(name + '.npy')
+            rows['label'] = [labels.index(index['labels'][i]) \
+                             for i in rows['label']]
+            allRows.append(rows)
+            allPaths += list(np.load(name + '.paths.npy'))
+        self.write_segment(np.concatenate(allRows), allPaths, labels)
+        
+        # a reader may see both copies until the old segments are gone
+        for name, index in segments:
+            os.remove(name + '.json')
+            os.remove(name + '.npy')
+            os.remove(name + '.paths.npy')
+    
+    @staticmethod
+    def _input_params(qeInput):
+        """
+        Returns ecutwfc and the automatic k-point grid set in an input
+        (dictionary), the ones it does not set are left out
+        """
+        params = {}
+        value = qeInput.get_parameter('ecutwfc')
+        if value is not None:
+            params['ecutwfc'] = float(value.lower().replace('d', 'e'))
+        card = qeInput.get_card('K_POINTS')
+        if card is not None and card[0] == 'automatic' and card[1]:
+            params['kpoints'] = card[1][0].split()[:3]
+        return params
+    
+    @staticmethod
+    def _may_match(ranges, filters):
+        """
+        Returns False if the column ranges of a segment exclude the filters
+        (bool)
+        """
+        for column, value in filters.items():
+            if column not in ranges:
+                return False
+            low, high = value if isinstance(value, (tuple, list)) else \
+                        (value, value)
+            if high < ranges[column][0] or low > ranges[column][1]:
+                return False
+        return True
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Classify how a DFT job ended and decide whether and how to run it again
+
+@author: abishekk
+"""
+import glob
+import os
+import re
+
+# outcomes of a job
+OK = 'ok'
+SUBMIT_FAILED = 'submit failed'
+WALLTIME = 'walltime'
+SCF_NOT_CONVERGED = 'scf not converged'
+CRASHED = 'crashed'
+
+# messages of PBS/Torque and Slurm when a job is killed at its time limit
+_walltimePattern = re.compile(r'walltime\s+\S+\s+exceeded|' + \
+                              r'DUE\s+TO\s+TIME\s+LIMIT', re.I)
+
+# time limits in queue options: PBS '-l walltime=01:00:00', Slurm
+# '--time=01:00:00' or '-t 60'. '-t' is only a time limit for Slurm, for
+# PBS it requests a job array.
+_timePattern = re.compile(r'(walltime=|--time[= ])([\d:-]+)')
+_slurmTimePattern = re.compile(r'(walltime=|--time[= ]|-t\s+)([\d:-]+)')
+
+def classify_outcome(record, errors=None):
+    """
+    Find how a job ended from its parsed output and the messages of the
+    queue manager. A run counts as OK only if its SCF converged, so a
+    missing total energy can never pass for a result.
+    
+    record: dictionary, record from OutputParser, None if the job was never
+            submitted
+    errors: string, standard error of the job written by the queue manager,
+            see read_scheduler_errors
+    
+    returns: string, one of OK, SUBMIT_FAILED, WALLTIME, SCF_NOT_CONVERGED,
+             CRASHED
+    """
+    if record is None:
+        return SUBMIT_FAILED
+    if record.get('error'):
+        return CRASHED
+    if record.get('time exceeded') or \
+       (errors and _walltimePattern.search(errors)):
+        return WALLTIME
+    if record.get('converged') and record.get('total energy'):
+        return OK
+    # a SCF cycle that ran out of steps, or was cut short eg. by JobMonitor
+    if record.get('scf iterations') or \
+       record.get('scf accuracy') is not None:
+        return SCF_NOT_CONVERGED
+    return CRASHED
+
+def read_scheduler_errors(workDir, jobId, maxBytes=65536):
+    """
+    Read the end of the standard error files that PBS (<name>.e<number>)
+    and Slurm (slurm-<id>.out) write in the job directory
+    
+    workDir: string, directory in which the job ran
+    jobId: string, job id returned by the backend
+    maxBytes: int, bytes read from the end of each file
+    
+    returns: string, contents of the files, empty if there are none
+    """
+    if not jobId:
+        return ''
+    number = jobId.split('.')[0]
+    paths = glob.glob(os.path.join(workDir, '*.e' + number)) + \
+            glob.glob(os.path.join(workDir, 'slurm-' + number + '.out'))
+    texts = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as fileptr:
+                fileptr.seek(max(0, os.path.getsize(path) - maxBytes))
+                texts.append(fileptr.read().decode(errors='replace'))
+        except OSError:
+            pass
+    return '\n'.join(texts)
+
+def scale_walltime(params, factor, default=3600.0, \
+                   option='-l walltime='):
+    """
+    Multiply the time limit in queue options
+    
+    params: string, options passed to the queue manager eg.
+            '-l walltime=01:00:00'
+    factor: float, by which the time limit grows
+    default: float, time limit in s of a job whose params have none
+    option: string, added in front of the time limit when params has
+            none, '-l walltime=' for PBS, '--time=' for Slurm
+    
+    returns: string, params with the new time limit
+    """
+    def scale(match):
+        # [days-]hours:minutes:seconds, or minutes alone for Slurm
+        days, clock = ([''] + match.group(2).split('-'))[-2:]
+        parts = [int(part) for part in clock.split(':')]
+        if len(parts) == 1:
+            seconds = parts[0]*60
+        else:
+            seconds = 0
+            for part in parts:
+                seconds = seconds*60 + part
+        seconds = (seconds + int(days or 0)*86400)*factor
+        return match.group(1) + _clock(seconds)
+    pattern = _time_pattern(option)
+    if not pattern.search(params):
+        return set_walltime(params, default*factor, option)
+    return pattern.sub(scale, params)
+
+def set_walltime(params, seconds, option='-l walltime='):
+    """
+    Set the time limit in queue options
+    
+    params: string, options passed to the queue manager
+    seconds: float, new time limit
+    option: string, added in front of the time limit when params has
+            none, '-l walltime=' for PBS, '--time=' for Slurm
+    
+    returns: string, params with the new time limit
+    """
+    pattern = _time_pattern(option)
+    if pattern.search(params):
+        return pattern.sub(lambda match: match.group(1) + \
+                           _clock(seconds), params)
+    return (params + ' ' + option + _clock(seconds)).strip()
+
+def _time_pattern(option):
+    """
+    Returns the pattern of the time limits in the options of the queue
+    manager that option belongs to (compiled regex)
+    """
+    if option.startswith('--time'):
+        return _slurmTimePattern
+    return _timePattern
+
+def _clock(seconds):
+    """
+    Returns time as hours:minutes:seconds (string)
+    """
+    seconds = int(seconds + 0.5)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, \
+                             seconds % 60)
+
+class RetryPolicy(object):
+    """
+    Class to decide which failed jobs are submitted again, after how long,
+    and with which changes: a SCF that did not converge is rerun with less
+    mixing and more iterations, a job killed at its time limit asks for
+    more time, and a job that crashed or could not be submitted is rerun
+    as it was.
+    
+    Usage:
+        policy = RetryPolicy(maxRetries=2, delay=30.0)
+        outcome = classify_outcome(parser.get_record())
+        if outcome != OK and policy.should_retry(outcome, attempt):
+            time.sleep(policy.delay_for(attempt))
+            policy.adjust_input(qeInput, outcome)
+    """
+    
+    def __init__(self, maxRetries=2, delay=30.0, backoff=2.0, \
+                 mixingFactor=0.5, minMixing=0.1, maxStepFactor=2, \
+                 walltimeFactor=1.5, walltime=3600.0, retryOn=None):
+        """
+        Initializes a retry policy
+        
+        maxRetries: int, largest number of times a job is submitted again
+        delay: float, time in s before the first resubmission
+        backoff: float, factor by which the delay grows every retry
+        mixingFactor: float, multiplies mixing_beta after a SCF failure
+        minMixing: float, smallest mixing_beta used
+        maxStepFactor: int, multiplies electron_maxstep after a SCF failure
+        walltimeFactor: float, multiplies the time limit after a job is
+                        killed at it, see scale_walltime
+        walltime: float, time limit in s of a job whose queue options
+                  have none, scaled by walltimeFactor after it is killed
+        retryOn: list of strings, outcomes that are retried, all the
+                 failures if None
+        
+        Has 9 attributes:
+            self.maxRetries: int, determined by maxRetries
+            self.delay: float, determined by delay
+            self.backoff: float, determined by backoff
+            self.mixingFactor: float, determined by mixingFactor
+            self.minMixing: float, determined by minMixing
+            self.maxStepFactor: int, determined by maxStepFactor
+            self.walltimeFactor: float, determined by walltimeFactor
+            self.walltime: float, determined by walltime
+            self.retryOn: set of strings, determined by retryOn
+        """
+        self.maxRetries = int(maxRetries)
+        self.delay = float(delay)
+        self.backoff = float(backoff)
+        self.mixingFactor = float(mixingFactor)
+        self.minMixing = float(minMixing)
+        self.maxStepFactor = int(maxStepFactor)
+        self.walltimeFactor = float(walltimeFactor)
+        self.walltime = float(walltime)
+        self.retryOn = retryOn
+        
+        if self.retryOn is None:
+            self.retryOn = [SUBMIT_FAILED, WALLTIME, SCF_NOT_CONVERGED, \
+                            CRASHED]
+        self.retryOn = set(self.retryOn)
+    
+    def should_retry(self, outcome, attempt):
+        """
+        Returns True if a job that ended with outcome is submitted again
+        (bool)
+        
+        outcome: string, see classify_outcome
+        attempt: int, number of times the job was submitted again so far
+        """
+        return outcome in self.retryOn and attempt < self.maxRetries
+    
+    def delay_for(self, attempt):
+        """
+        Returns time in s to wait before resubmitting a job (float)
+        
+        attempt: int, number of times the job was submitted again so far
+        """
+        return self.delay*self.backoff**attempt
+    
+    def adjust_input(self, qeInput, outcome):
+        """
+        Change the input of a job before it is submitted again
+        
+        qeInput: InputReader, input of the job read with read_file
+        outcome: string, see classify_outcome
+        
+        returns: bool, True if the input was changed
+        """
+        if outcome != SCF_NOT_CONVERGED:
+            return False
+        beta = self._to_float(qeInput.get_parameter('mixing_beta'), 0.7)
+        maxStep = self._to_float(qeInput.get_parameter('electron_maxstep'), \
+                                 100)
+        qeInput.set_parameter('mixing_beta', '%g' % \
+                              max(self.minMixing, beta*self.mixingFactor), \
+                              'electrons')
+        qeInput.set_parameter('electron_maxstep', \
+                              str(int(maxStep*self.maxStepFactor)), \
+                              'electrons')
+        return True
+    
+    def adjust_params(self, params, outcome, option='-l walltime='):
+        """
+        Returns queue options for a job submitted again (string), with a
+        longer time limit after a WALLTIME outcome
+        
+        params: string, options passed to the queue manager
+        outcome: string, see classify_outcome
+        option: string, time limit option of the queue manager, see
+                set_walltime
+        """
+        if outcome != WALLTIME:
+            return params
+        return scale_walltime(params, self.walltimeFactor, self.walltime, \
+                              option)
+    
+    @staticmethod
+    def _to_float(value, default):
+        """
+        Returns value of a Fortran number (float), default if None
+        """
+        if value is None:
+            return float(default)
+        return float(value.lower().replace('d', 'e'))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only journal of the points of a convergence study, used to resume a
+study after the driving process dies
+
+@author: abishekk
+"""
+import json
+import os
+
+class StudyJournal(object):
+    """
+    Class to record every point of a study as it is submitted, finishes or
+    is cancelled. Each event is one JSON line appended to the journal, so a
+    crash loses at most the event being written. Reading the journal back
+    replays the events and gives the last state of every point.
+    
+    Usage:
+        journal = StudyJournal('study.jsonl')
+        journal.submitted('/path/to/out.pw.si', '1234.server', key)
+        ...
+        journal.finished('/path/to/out.pw.si', parser.get_record())
+        entry = journal.get('/path/to/out.pw.si')
+    """
+    
+    def __init__(self, filename='study.jsonl'):
+        """
+        Open a journal, replaying the events already stored in it
+        
+        filename: string, journal file, created when the first event is
+                  written
+        
+        Has 2 attributes:
+            self.journalFile: string, absolute path of filename
+            self._entries: dictionary, output file -> last state of point
+        """
+        self.journalFile = os.path.abspath(filename)
+        self._entries = {}
+        
+        if os.path.exists(self.journalFile):
+            self.replay()
+    
+    def replay(self):
+        """
+        Rebuild the state of every point from the events in the journal. A
+        line cut short by a crash is skipped, the events after it are still
+        replayed.
+        """
+        self._entries = {}
+        with open(self.journalFile, 'r') as fileptr:
+            for line in fileptr:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(event)
+    
+    def submitted(self, outPath, jobId, key=None):
+        """
+        Record a point submitted to the queue
+        
+        outPath: string, output file of the point, identifies the point
+        jobId: string, job id returned by the backend
+        key: string, cache key of the input, see ResultCache.input_key
+        """
+        self._write({'event': 'submitted', 'output': outPath, \
+                     'job': jobId, 'key': key})
+    
+    def finished(self, outPath, result):
+        """
+        Record the parsed result of a point
+        
+        outPath: string, output file of the point
+        result: dictionary, record from OutputParser
+        """
+        self._write({'event': 'finished', 'output': outPath, \
+                     'result': result})
+    
+    def cancelled(self, outPath):
+        """
+        Record a point removed from the queue before it finished
+        
+        outPath: string, output file of the point
+        """
+        self._write({'event': 'cancelled', 'output': outPath})
+    
+    def get(self, outPath):
+        """
+        Look up the last state of a point
+        
+        outPath: string, output file of the point
+        
+        returns: dictionary with keys 'status' ('submitted', 'finished' or
+                 'cancelled'), 'job', 'key' and 'result', None if the point
+                 is not in the journal
+        """
+        entry = self._entries.get(outPath)
+        return None if entry is None else dict(entry)
+    
+    def points(self):
+        """
+        Returns list of output files of all the points in the journal
+        """
+        return list(self._entries)
+    
+    def _write(self, event):
+        """
+        Append one event to the journal and apply it
+        """
+        line = (json.dumps(event) + '\n').encode()
+        with open(self.journalFile, 'a+b') as fileptr:
+            # end a line cut short by a crash, so that the event does not
+            # join it
+            if fileptr.seek(0, os.SEEK_END) > 0:
+                fileptr.seek(-1, os.SEEK_END)
+                if fileptr.read(1) != b'\n':
+                    line = b'\n' + line
+            fileptr.write(line)
+            fileptr.flush()
+        self._apply(event)
+    
+    def _apply(self, event):
+        """
+        Update the state of a point with one event
+        """
+        entry = self._entries.setdefault(event['output'], \
+                    {'status': None, 'job': None, 'key': None, \
+                     'result': None})
+        entry['status'] = event['event']
+        if event['event'] == 'submitted':
+            entry['job'] = event['job']
+            entry['key'] = event['key']
+            entry['result'] = None
+        elif event['event'] == 'finished':
+            entry['result'] = event['result']
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in backends.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0,'../')
+from backends import *
+
+class TestBackendsMethods(unittest.TestCase):
+    
+    def test_command(self):
+        """
+        Unit test for command
+        """
+        self.assertEqual(PBSBackend(16).command('pw.x'), 'mpirun -np 16 pw.x')
+        self.assertEqual(SlurmBackend(8).command('pw.x'), 'srun -n 8 pw.x')
+        self.assertEqual(LocalBackend(1, 4).command('pw.x'), 'pw.x')
+        self.assertEqual(LocalBackend(2, 4, mpiCmd='').command('pw.x'), \
+                         'pw.x')
+    
+    def test_get_backend(self):
+        """
+        Unit test for get_backend
+        """
+        backend = get_backend('pbs', coresPerJob=4)
+        self.assertIsInstance(backend, PBSBackend)
+        self.assertEqual(backend.coresPerJob, 4)
+        with self.assertRaises(Exception):
+            get_backend('lsf')
+    
+    def test_local_backend(self):
+        """
+        Unit test for LocalBackend submit and status
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        with tempfile.TemporaryDirectory() as workDir:
+            jobIds = []
+            for i in range(4):
+                with open(os.path.join(workDir, 'in.%d' % i), 'w') as fileptr:
+                    fileptr.write('job %d\n' % i)
+                jobIds.append(backend.submit('cat', 'in.%d' % i, \
+                                             'out.%d' % i, workDir))
+            self.assertEqual(len(set(jobIds)), 4)
+            
+            while backend.status(jobIds):
+                time.sleep(0.05)
+            backend.shutdown()
+            
+            for i in range(4):
+                with open(os.path.join(workDir, 'out.%d' % i)) as fileptr:
+                    self.assertEqual(fileptr.read(), 'job %d\n' % i)
+            
+            # a backend of another process never hands out the same ids
+            other = LocalBackend(coresPerJob=1, totalCores=1)
+            otherId = other.submit('cat', 'in.0', 'out.other', workDir)
+            other.shutdown()
+            self.assertNotIn(otherId, jobIds)
+            self.assertEqual(backend.status([otherId]), set())
+    
+    def test_local_cancel(self):
+        """
+        Unit test for LocalBackend cancel, a running job is killed with
+        the processes it started and a waiting job never starts
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=1)
+        with tempfile.TemporaryDirectory() as workDir:
+            with open(os.path.join(workDir, 'in'), 'w') as fileptr:
+                fileptr.write('job\n')
+            running = backend.submit('sh -c "sleep 30; echo done"', 'in', \
+                                     'out.running', workDir)
+            waiting = backend.submit('cat', 'in', 'out.waiting', workDir)
+            while running not in backend._processes:
+                time.sleep(0.01)
+            
+            start = time.monotonic()
+            backend.cancel(waiting)
+            backend.cancel(running)
+            backend.shutdown()
+            self.assertLess(time.monotonic() - start, 5.0)
+            self.assertEqual(backend.status([running, waiting]), set())
+            with open(os.path.join(workDir, 'out.running')) as fileptr:
+                self.assertEqual(fileptr.read(), '')
+            self.assertFalse(os.path.exists(os.path.join(workDir, \
+                                                         'out.waiting')))
+    
+    def test_packed_backend(self):
+        """
+        Unit test for PackedBackend, jobs submitted together run in one
+        allocation and a job cancelled before packing never runs
+        """
+        inner = LocalBackend(coresPerJob=2, totalCores=2)
+        backend = PackedBackend(inner, slots=2, mpiCmd='')
+        self.assertEqual(backend.coresPerJob, 1)
+        self.assertEqual(backend.command('cat'), 'cat')
+        with tempfile.TemporaryDirectory() as workDir:
+            jobIds = []
+            for i in range(5):
+                jobDir = os.path.join(workDir, 'job_%d' % i)
+                os.makedirs(jobDir)
+                with open(os.path.join(jobDir, 'in'), 'w') as fileptr:
+                    fileptr.write('job %d\n' % i)
+                jobIds.append(backend.submit('cat', 'in', 'out', jobDir))
+            backend.cancel(jobIds.pop())
+            
+            while backend.status(jobIds):
+                time.sleep(0.05)
+            inner.shutdown()
+            
+            self.assertEqual(len(inner._futures), 1)
+            self.assertTrue(os.path.isdir(os.path.join(workDir, 'packs')))
+            for i in range(4):
+                with open(os.path.join(workDir, 'job_%d' % i, 'out')) as \
+                     fileptr:
+                    self.assertEqual(fileptr.read(), 'job %d\n' % i)
+            self.assertFalse(os.path.exists(os.path.join(workDir, 'job_4', \
+                                                         'out')))
+        
+            # a new run in the same pack directory is not mistaken for the
+            # jobs of the first one
+            inner = LocalBackend(coresPerJob=2, totalCores=2)
+            backend = PackedBackend(inner, slots=2, mpiCmd='')
+            jobDir = os.path.join(workDir, 'job_0')
+            jobId = backend.submit('sed s/job/again/', 'in', 'out', \
+                                   jobDir)
+            self.assertNotIn(jobId, jobIds)
+            while backend.status([jobId]):
+                time.sleep(0.05)
+            inner.shutdown()
+            with open(os.path.join(jobDir, 'out')) as fileptr:
+                self.assertEqual(fileptr.read(), 'again 0\n')
+        
+            # a job packed by a process that died is followed from packDir,
+            # and one that cannot be found is never taken as finished
+            inner = LocalBackend(coresPerJob=2, totalCores=2)
+            packDir = os.path.join(workDir, 'packs')
+            backend = PackedBackend(inner, slots=2, mpiCmd='', \
+                                    packDir=packDir)
+            jobId = backend.submit('sleep 0.5; sed s/job/later/', 'in', \
+                                   'out', jobDir)
+            backend.flush()
+            resumed = PackedBackend(inner, slots=2, mpiCmd='', \
+                                    packDir=packDir)
+            self.assertEqual(resumed.status([jobId]), {jobId})
+            while resumed.status([jobId]):
+                time.sleep(0.05)
+            self.assertEqual(resumed.status(['packed.0dead0-1']), \
+                             {'packed.0dead0-1'})
+            inner.shutdown()
+            with open(os.path.join(jobDir, 'out')) as fileptr:
+                self.assertEqual(fileptr.read(), 'later 0\n')
+        
+        with self.assertRaises(Exception):
+            PackedBackend(LocalBackend(coresPerJob=2, totalCores=2), slots=4)
+    
+    def test_parse_status(self):
+        """
+        Unit test for PBSBackend.parse_status
+        """
+        qstatMsg = ('Job ID    Name  User  Time Use S Queue\n'
+                    '--------- ----- ----- -------- - -----\n'
+                    '101.serv  pw.x  user  00:01:00 R batch\n'
+                    '102.serv  pw.x  user  00:02:00 C batch\n')
+        queued = PBSBackend.parse_status(qstatMsg, \
+                    ['101.server', '102.server', '103.server'])
+        self.assertEqual(queued, {'101.server'})
+
+    def test_failed_status(self):
+        """
+        Unit test for status when the query of the queue manager fails
+        """
+        # jobs the queue manager no longer knows have finished
+        backend = PBSBackend(statusCmd='sh -c "echo qstat: Unknown Job ' + \
+                                       'Id $0 >&2; exit 153"')
+        self.assertEqual(backend.status(['101.server']), set())
+        backend = SlurmBackend(statusCmd='sh -c "echo slurm_load_jobs ' + \
+                                         'error: Invalid job id ' + \
+                                         'specified >&2; exit 1"')
+        self.assertEqual(backend.status(['101']), set())
+        
+        # any other failure says nothing about the jobs
+        for backend in [PBSBackend, SlurmBackend]:
+            backend = backend(statusCmd='sh -c "echo Connection ' + \
+                                        'refused >&2; exit 1"')
+            with self.assertRaises(Exception):
+                backend.status(['101'])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBackendsMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in benchmarks.py
+
+@author: abishekk
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from benchmarks import *
+
+class TestBenchmarksMethods(unittest.TestCase):
+    
+    def test_synthetic_files(self):
+        """
+        Unit test for make_qe_input and make_qe_output, the parsers read
+        the synthetic files
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            inPath = os.path.join(workDir, 'in.bench')
+            InputWriter(inPath, make_qe_input(7, 5)).write_lines_to_file()
+            inReader = InputReader(inPath, 'qe')
+            inReader.read_file()
+            self.assertEqual(inReader.get_parameter('nat'), '7')
+            self.assertEqual(len(inReader.get_card('K_POINTS')[1]), 6)
+            
+            outPath = os.path.join(workDir, 'out.bench')
+            with open(outPath, 'w') as fileptr:
+                fileptr.write(make_qe_output(7, 5, 12))
+            readOut = OutputParser('qe')
+            readOut.parse_op_file(outPath)
+            self.assertEqual(readOut.get_kpoints(), 5)
+            self.assertEqual(readOut.get_scf_iterations(), 12)
+            self.assertEqual(len(readOut.get_forces()), 7)
+            self.assertTrue(readOut.get_converged())
+    
+    def test_run_benchmarks(self):
+        """
+        Unit test for run_benchmarks at a small scale
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            outFile = os.path.join(workDir, 'bench.json')
+            run_benchmarks(outFile, scale=0.01)
+            with open(outFile) as fileptr:
+                results = json.load(fileptr)
+        
+        self.assertEqual(results['parse']['atoms'], 20)
+        self.assertEqual(results['schedule']['jobs'], 2)
+        self.assertGreater(results['input']['variants per s'], 0)
+        self.assertLessEqual(results['schedule']['status calls'], 20)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBenchmarksMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
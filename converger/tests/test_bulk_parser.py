@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in bulk_parser.py
+
+@author: abishekk
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from bulk_parser import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestBulkParserMethods(unittest.TestCase):
+    
+    def setUp(self):
+        """
+        Spread copies of the sample outputs over job directories
+        """
+        self.workDir = tempfile.TemporaryDirectory()
+        for i, sample in enumerate(['si.scf.cg.out', 'out.dummy_qe', \
+                                    'si.scf.cg.out']):
+            jobPath = os.path.join(self.workDir.name, 'kpoints_%d' % i)
+            os.makedirs(jobPath)
+            shutil.copy(sample, os.path.join(jobPath, 'out.kpoints_%d' % i))
+            shutil.copy('in.pw.si', os.path.join(jobPath, 'in.kpoints_%d' % i))
+    
+    def tearDown(self):
+        self.workDir.cleanup()
+    
+    def test_find_outputs(self):
+        """
+        Unit test for find_outputs
+        """
+        jobDirs = [os.path.join(self.workDir.name, 'kpoints_%d' % i) \
+                   for i in range(3)]
+        self.assertEqual(len(find_outputs(jobDirs)), 3)
+        self.assertEqual(find_outputs(os.path.join(self.workDir.name, \
+                                                   '*', 'out.*')), \
+                         find_outputs(jobDirs))
+    
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_parse_outputs(self):
+        """
+        Unit test for parse_outputs
+        """
+        table = parse_outputs(os.path.join(self.workDir.name, '*', 'out.*'), \
+                              processes=2, chunkSize=1)
+        self.assertEqual(len(table['path']), 3)
+        self.assertEqual(list(table['kpoints']), [10, 42, 10])
+        self.assertEqual(list(table['converged']), [True, False, True])
+        self.assertTrue(numpy.isnan(table['wall time'][1]))
+        self.assertEqual(table['stress'][0][1][1], -10.24)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBulkParserMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
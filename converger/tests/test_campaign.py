@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in campaign.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from backends import LocalBackend
+from converger import Converger
+from result_store import ResultStore
+from campaign import *
+
+class TestCampaignMethods(unittest.TestCase):
+    
+    def test_run(self):
+        """
+        Unit test for run, two studies share one engine and its limits
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        campaign = Campaign(backend, maxJobs=2, minInterval=0.02, \
+                            maxInterval=0.1)
+        with tempfile.TemporaryDirectory() as workDir:
+            store = ResultStore(os.path.join(workDir, 'results'))
+            for name in ['kpt', 'ecut']:
+                study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                                  executable=os.path.abspath('fake_pw'), \
+                                  workDir=os.path.join(workDir, name), \
+                                  store=store)
+                if name == 'kpt':
+                    campaign.add_study(study, ['kpoints'], [[2,2,2]], \
+                                       [[1,1,1]], batchSize=2)
+                else:
+                    campaign.add_study(study, ['ecutwfc'], [[20]], [[10]], \
+                                       batchSize=2)
+            
+            with self.assertRaises(Exception):
+                campaign.add_study(Converger('in.pw.si', 'total energy', \
+                                   1e-3, 'qe', workDir=study.workDir), \
+                                   ['kpoints'], [[2,2,2]], [[1,1,1]])
+            
+            campaign.run()
+            backend.shutdown()
+            stored = store.query(label='in.pw.si', k1=(10, 10))
+            written = campaign.report(os.path.join(workDir, 'campaign.html'), \
+                                      os.path.join(workDir, 'plots'), 1)
+            self.assertEqual([os.path.basename(path) for path in written], \
+                             ['kpt.png', 'ecut.png', 'campaign.html'])
+            self.assertTrue(all(os.path.exists(path) for path in written))
+        
+        kptStudy, ecutStudy = campaign.studies
+        self.assertEqual(list(stored['kpoints']), [1000])
+        self.assertEqual(list(kptStudy.convergedValue[0]), [10, 10, 10])
+        self.assertEqual(list(ecutStudy.convergedValue[0]), [90.0])
+        self.assertGreater(campaign.metrics.counters['status calls'], 0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCampaignMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in converger.py
+
+@author: abishekk
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from backends import LocalBackend
+from cost_model import CostModel
+from job_engine import JobEngine
+from job_monitor import JobMonitor
+from result_cache import ResultCache
+from retry_policy import RetryPolicy
+from study_journal import StudyJournal
+from converger import *
+
+class TestConvergerMethods(unittest.TestCase):
+    
+    def setUp(self):
+        self.workDir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.workDir.cleanup()
+    
+    @staticmethod
+    def process_running(pid):
+        """
+        Returns True if process pid is running (bool), a process that has
+        exited but was not reaped yet counts as gone
+        """
+        try:
+            with open('/proc/%d/stat' % pid) as fileptr:
+                return fileptr.read().rsplit(')', 1)[1].split()[0] != 'Z'
+        except OSError:
+            return False
+    
+    def run_study(self, study, backend, batchSize=1, convParms=None, \
+                  startVals=None, steps=None, restart=False):
+        """
+        Converge convParms with a fast engine and shut the backend down,
+        ecutwfc from 20 Ry in steps of 10 Ry if convParms is None
+        """
+        if convParms is None:
+            convParms, startVals, steps = ['ecutwfc'], [[20]], [[10]]
+        modLines, slots = study.prepare_study(convParms, startVals, steps, \
+                                              restart)
+        engine = JobEngine(backend, minInterval=0.02, maxInterval=0.1)
+        try:
+            asyncio.run(study.run_points(modLines, slots, batchSize, \
+                                         engine=engine))
+        finally:
+            backend.shutdown()
+    
+    def test_prepare_study(self):
+        """
+        Unit test for prepare_study, a parameter missing from the sample is
+        added and every slot points at the line of its own value
+        """
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          backend=LocalBackend(1, 1), \
+                          workDir=self.workDir.name)
+        # degauss needs smeared occupations
+        with self.assertRaises(Exception):
+            study.prepare_study(['smearing'], [[0.01]], [[0.01]])
+        
+        with open('in.pw.si', 'r') as fileptr:
+            text = fileptr.read().replace('ibrav=  2,', \
+                                          "ibrav=  2, occupations='smearing',")
+        inPath = os.path.join(self.workDir.name, 'in.pw.metal')
+        with open(inPath, 'w') as fileptr:
+            fileptr.write(text)
+        study = Converger(inPath, 'total energy', 1e-3, 'qe', \
+                          backend=LocalBackend(1, 1), \
+                          workDir=self.workDir.name)
+        modLines, slots = study.prepare_study(['kpoints', 'smearing'], \
+                                              [[2,2,2], [0.02]], \
+                                              [[1,1,1], [-0.01]])
+        self.assertEqual(study.convergeParam, ['kpoints', 'degauss'])
+        self.assertEqual(modLines[slots['kpoints'] - 1], \
+                         'K_POINTS automatic\n')
+        self.assertEqual(modLines[slots['kpoints']], '0 0 0 0 0 0\n')
+        self.assertIn('degauss', modLines[slots['degauss']])
+        # a negative step takes the smearing to 0 at the second step
+        self.assertTrue(study.point_valid((5, 1)))
+        self.assertFalse(study.point_valid((0, 2)))
+
+    def test_batched_submission(self):
+        """
+        Unit test for run_points with batchSize > 1, the points beyond the
+        converged one are submitted speculatively and cancelled once the
+        study has converged
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=1)
+        journal = StudyJournal(os.path.join(self.workDir.name, \
+                                            'study.jsonl'))
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw'), \
+                          journal=journal, workDir=self.workDir.name)
+        self.run_study(study, backend, batchSize=3)
+        
+        self.assertEqual(list(study.convergedValue[0]), [90.0])
+        entries = [journal.get(outPath) for outPath in journal.points()]
+        finished = [entry for entry in entries \
+                    if entry['status'] == 'finished']
+        cancelled = [outPath for outPath in journal.points() \
+                     if journal.get(outPath)['status'] == 'cancelled']
+        self.assertEqual(len(finished), len(study._records))
+        self.assertGreater(len(cancelled), 0)
+        self.assertEqual(study.metrics.counters['jobs submitted'], \
+                         len(finished) + len(cancelled))
+        # cancelled points never reach the results
+        self.assertFalse(set(cancelled) & set(outPath for outPath, record \
+                                              in study._records))
+    
+    def test_cache(self):
+        """
+        Unit test for a study run again with the same ResultCache, every
+        point is found in the cache and nothing is submitted
+        """
+        cache = ResultCache(os.path.join(self.workDir.name, 'cache'))
+        studies = []
+        for name in ['first', 'second']:
+            backend = LocalBackend(coresPerJob=1, totalCores=2)
+            study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                              backend=backend, \
+                              executable=os.path.abspath('fake_pw'), \
+                              cache=cache, \
+                              workDir=os.path.join(self.workDir.name, name))
+            self.run_study(study, backend)
+            studies.append(study)
+        
+        first, second = studies
+        self.assertEqual(list(second.convergedValue[0]), [90.0])
+        self.assertEqual(second.metrics.counters.get('jobs submitted', 0), 0)
+        self.assertEqual(second.metrics.counters['cache hits'], \
+                         first.metrics.counters['jobs submitted'])
+        self.assertEqual([record['total energy'] for outPath, record in \
+                          second._records], \
+                         [record['total energy'] for outPath, record in \
+                          first._records])
+    
+    def test_monitor(self):
+        """
+        Unit test for a study followed by a JobMonitor, the point whose SCF
+        diverges is cancelled before it ends and run again with less mixing
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw_diverging'), \
+                          monitor=JobMonitor(interval=0.05), \
+                          retry=RetryPolicy(delay=0.0), \
+                          workDir=self.workDir.name)
+        self.run_study(study, backend, batchSize=2)
+        
+        self.assertEqual(list(study.convergedValue[0]), [90.0])
+        self.assertEqual(study.metrics.counters['jobs retried'], 1)
+        # the wrong energy printed after the divergence never gets in
+        self.assertTrue(all(record['total energy'] > -300 for outPath, \
+                            record in study._records))
+        
+        # the diverging run was killed before it could print its energy
+        with open(os.path.join(self.workDir.name, 'ecutwfc_30', \
+                               'out.ecutwfc_30.failed1')) as fileptr:
+            lines = fileptr.readlines()
+        self.assertFalse(any(line.startswith('!') for line in lines))
+        self.assertFalse(self.process_running(int(lines[0].split()[2])))
+
+    def test_restart(self):
+        """
+        Unit test for a study with restart, later points start from the
+        charge density of earlier points and need fewer SCF iterations
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=1)
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw'), \
+                          workDir=self.workDir.name)
+        self.run_study(study, backend, restart=True)
+        
+        inputs = []
+        for outFile, record in study._records:
+            inpFile = outFile.replace(os.sep + 'out.', os.sep + 'in.')
+            with open(inpFile, 'r') as fileptr:
+                inputs.append(fileptr.read())
+        
+        self.assertEqual(study.restartPrefix, 'silicon')
+        self.assertIn("outdir='./out/'", inputs[0])
+        self.assertIn("startingpot = 'atomic'", inputs[0])
+        for text in inputs[1:]:
+            self.assertIn("startingpot = 'file'", text)
+        iterations = [record['scf iterations'] for outFile, record in \
+                      study._records]
+        self.assertEqual(iterations[0], 5)
+        self.assertTrue(all(it == 2 for it in iterations[1:]))
+    
+    def test_retry(self):
+        """
+        Unit test for retries, points whose SCF does not converge are run
+        again with less mixing and a point that keeps failing stops the
+        study
+        """
+        os.environ['FAKE_PW_MAX_BETA'] = '0.5'
+        try:
+            backend = LocalBackend(coresPerJob=1, totalCores=2)
+            study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                              backend=backend, \
+                              executable=os.path.abspath('fake_pw'), \
+                              workDir=os.path.join(self.workDir.name, \
+                                                   'retry'), \
+                              retry=RetryPolicy(delay=0.0))
+            self.run_study(study, backend, batchSize=2)
+            self.assertEqual(list(study.convergedValue[0]), [90.0])
+            self.assertGreater(study.metrics.counters['jobs retried'], 0)
+            self.assertEqual(study.metrics.counters['jobs retried'], \
+                             study.metrics.counters['jobs failed'])
+            self.assertTrue(all(record['converged'] for outFile, record \
+                                in study._records))
+            
+            backend = LocalBackend(coresPerJob=1, totalCores=2)
+            study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                              backend=backend, \
+                              executable=os.path.abspath('fake_pw'), \
+                              workDir=os.path.join(self.workDir.name, \
+                                                   'fail'), \
+                              retry=RetryPolicy(maxRetries=0))
+            with self.assertRaises(Exception):
+                self.run_study(study, backend)
+        finally:
+            del os.environ['FAKE_PW_MAX_BETA']
+    
+    def test_walltime_retry(self):
+        """
+        Unit test for retries of points killed at their time limit, each is
+        submitted again with a longer limit without changing the backend
+        """
+        class TimedBackend(LocalBackend):
+            # jobs given the shortest time limit run out of time
+            def submit(self, cmd, inputFile, outputFile, workDir, \
+                       params=None):
+                if params is None:
+                    params = self.params
+                self.submitted.append(params)
+                if params == '-l walltime=00:10:00':
+                    cmd = 'echo "     Maximum CPU time exceeded"'
+                return super().submit(cmd, inputFile, outputFile, workDir)
+        
+        backend = TimedBackend(coresPerJob=1, totalCores=2, \
+                               params='-l walltime=00:10:00')
+        backend.submitted = []
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          executable=os.path.abspath('fake_pw'), \
+                          workDir=self.workDir.name, backend=backend, \
+                          retry=RetryPolicy(delay=0.0, walltimeFactor=2.0))
+        self.run_study(study, backend, batchSize=2)
+        
+        self.assertEqual(list(study.convergedValue[0]), [90.0])
+        self.assertEqual(backend.params, '-l walltime=00:10:00')
+        self.assertEqual(study.metrics.counters['jobs retried'], \
+                         backend.submitted.count('-l walltime=00:10:00'))
+        self.assertEqual(backend.submitted.count('-l walltime=0:20:00'), \
+                         study.metrics.counters['jobs retried'])
+    
+    def test_shared_line(self):
+        """
+        Unit test for parameters on one line of the input, both values are
+        changed in that line and the line is written once
+        """
+        with open('in.pw.si', 'r') as fileptr:
+            text = fileptr.read().replace('ecutwfc =18.0,', \
+                                          'ecutwfc =18.0, ecutrho = 240,')
+        inPath = os.path.join(self.workDir.name, 'in.pw.cut')
+        with open(inPath, 'w') as fileptr:
+            fileptr.write(text)
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        study = Converger(inPath, 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw'), \
+                          workDir=os.path.join(self.workDir.name, 'cut'))
+        self.run_study(study, backend, 2, ['ecutwfc', 'ecutrho'], \
+                       [[20], [100]], [[10], [40]])
+        
+        for outFile, record in study._records:
+            inpFile = outFile.replace(os.sep + 'out.', os.sep + 'in.')
+            with open(inpFile, 'r') as fileptr:
+                lines = [line for line in fileptr if 'ecut' in line]
+            words = os.path.basename(outFile).split('_')
+            self.assertEqual(lines, ['    ecutwfc =' + words[1] + \
+                                     ', ecutrho = ' + words[3] + ',\n'])
+        self.assertEqual(list(study.convergedValue[0]), [90.0])
+    
+    def test_planned_kpoints(self):
+        """
+        Unit test for planned k-point grids, odd grids of a simple cubic
+        cell are run although they have no more irreducible k-points than
+        the even grids before them
+        """
+        with open('in.pw.si', 'r') as fileptr:
+            text = fileptr.read().replace('ibrav=  2', 'ibrav=  1')
+        inPath = os.path.join(self.workDir.name, 'in.pw.sc')
+        with open(inPath, 'w') as fileptr:
+            fileptr.write(text)
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        study = Converger(inPath, 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw'), \
+                          workDir=os.path.join(self.workDir.name, 'sc'))
+        self.run_study(study, backend, 2, ['kpoints'], [[2,2,2]], ['auto'])
+        
+        grids = sorted(int(round(record['kpoints']**(1.0/3.0))) \
+                       for outFile, record in study._records)
+        self.assertEqual(grids, list(range(2, len(grids) + 2)))
+        self.assertIn(3, grids)
+        self.assertIn(int(study.convergedValue[0][0]), grids)
+        self.assertEqual(study.point_values((1,)), [study.kGrids.grid(1)])
+    
+    def test_cost_model(self):
+        """
+        Unit test for a study with a cost model, every run is learnt, the
+        cost of the next points is their predicted wall time and their jobs
+        ask for a time limit to match
+        """
+        modelFile = os.path.join(self.workDir.name, 'cost.json')
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        study = Converger('in.pw.si', 'total energy', 1e-3, 'qe', \
+                          backend=backend, \
+                          executable=os.path.abspath('fake_pw'), \
+                          workDir=os.path.join(self.workDir.name, 'kpt'), \
+                          costModel=CostModel(modelFile))
+        self.run_study(study, backend, 2, ['kpoints', 'ecutwfc'], \
+                       [[2,2,2], [20]], [[1,1,1], [20]])
+        self.assertEqual(len(CostModel(modelFile).runs), \
+                         len(study._records))
+        
+        # a stepped grid counts its irreducible k-points
+        kpoints = study.kpoint_count([3, 3, 3])
+        self.assertLess(kpoints, 27)
+        features = {'kpoints': kpoints, 'ecutwfc': 40.0, 'atoms': 2}
+        seconds = study.costModel.predict_time(features, 1)
+        self.assertEqual(study.point_cost((1, 1)), seconds)
+        self.assertLess(study.point_cost((1, 0)), study.point_cost((1, 1)))
+        self.assertEqual(study.point_params((1, 1)), '-l walltime=0:05:00')
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestConvergerMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
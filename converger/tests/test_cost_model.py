@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in cost_model.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from input_reader import InputReader
+from cost_model import *
+
+def make_record(kpoints, ecut, atoms, processors):
+    """
+    Returns record of a run whose wall time and memory follow power laws
+    """
+    return {'kpoints': kpoints, 'ecutwfc': ecut, 'atoms': atoms, \
+            'processors': processors, \
+            'wall time': 0.01*kpoints*ecut**1.5*atoms**2.5/processors, \
+            'memory': 0.1*ecut**1.5*atoms**2}
+
+class TestCostModelMethods(unittest.TestCase):
+    
+    def test_input_features(self):
+        """
+        Unit test for input_features, irreducible k-points of silicon
+        """
+        qeInput = InputReader('in.pw.si')
+        qeInput.read_file()
+        self.assertEqual(input_features(qeInput), {'kpoints': 3, \
+                         'ecutwfc': 18.0, 'atoms': 2.0})
+    
+    def test_set_cores(self):
+        """
+        Unit test for set_cores
+        """
+        self.assertEqual(set_cores('-l nodes=1:ppn=16 -q batch', 4), \
+                         '-l nodes=1:ppn=4 -q batch')
+        self.assertEqual(set_cores('--ntasks=16', 8), '--ntasks=8')
+        self.assertEqual(set_cores('-q batch', 8), '-q batch')
+    
+    def test_fit_predict(self):
+        """
+        Unit test for add_record, predict_time and predict_memory, with and
+        without the expected exponents
+        """
+        model = CostModel()
+        self.assertIsNone(model.predict_time({'kpoints': 10, \
+                          'ecutwfc': 30, 'atoms': 2}, 4))
+        self.assertFalse(model.add_record({'kpoints': 10, \
+                                           'wall time': None}))
+        
+        # one run is scaled with the expected exponents
+        self.assertTrue(model.add_record(make_record(10, 20.0, 2, 4)))
+        self.assertAlmostEqual(model.predict_time({'kpoints': 20, \
+                               'ecutwfc': 20.0, 'atoms': 2}, 4), \
+                               2*make_record(10, 20.0, 2, 4)['wall time'])
+        
+        model = CostModel(weight=0.0)
+        for kpoints, ecut, atoms, processors in [[10, 20.0, 2, 4], \
+                [20, 20.0, 2, 4], [10, 40.0, 2, 4], [10, 20.0, 4, 4], \
+                [10, 20.0, 2, 8], [35, 60.0, 8, 16]]:
+            model.add_record(make_record(kpoints, ecut, atoms, processors))
+        features = {'kpoints': 50, 'ecutwfc': 45.0, 'atoms': 6}
+        self.assertAlmostEqual(model.predict_time(features, 32), \
+                               make_record(50, 45.0, 6, 32)['wall time'])
+        self.assertAlmostEqual(model.predict_memory(features, 32), \
+                               make_record(50, 45.0, 6, 32)['memory'])
+    
+    def test_requests(self):
+        """
+        Unit test for request_time, choose_cores and save
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            modelFile = os.path.join(workDir, 'cost.json')
+            model = CostModel(modelFile, safety=2.0, minTime=60.0, \
+                              maxTime=1000.0, memoryPerCore=100.0)
+            model.add_record(make_record(10, 20.0, 2, 4))
+            model.save()
+            model = CostModel(modelFile, safety=2.0, minTime=60.0, \
+                              maxTime=1000.0, memoryPerCore=100.0)
+        self.assertEqual(len(model.runs), 1)
+        
+        features = {'kpoints': 10, 'ecutwfc': 20.0, 'atoms': 2}
+        self.assertEqual(model.request_time(features, 4), 60.0)
+        features['kpoints'] = 2000
+        seconds = model.predict_time(features, 4)
+        self.assertEqual(model.request_time(features, 4), \
+                         60*((2*seconds) // 60 + 1))
+        self.assertEqual(model.choose_cores(features, [16, 4, 8, 32]), 16)
+        features['atoms'] = 20
+        self.assertEqual(model.choose_cores(features, [4, 8]), 8)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCostModelMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in extrapolation.py
+
+@author: abishekk
+"""
+import sys
+import unittest
+
+sys.path.insert(0,'../')
+from extrapolation import *
+
+class TestExtrapolationMethods(unittest.TestCase):
+    
+    def test_fit_exponential(self):
+        """
+        Unit test for fit_exponential
+        """
+        indices = [0, 1, 2, 4]
+        energies = [-10.0 + 2.0*0.5**n for n in indices]
+        c, a, r, residual = fit_exponential(indices, energies)
+        self.assertAlmostEqual(c, -10.0)
+        self.assertAlmostEqual(a, 2.0)
+        self.assertAlmostEqual(r, 0.5)
+        self.assertIsNone(fit_exponential([0, 1], [1.0, 0.5]))
+    
+    def test_fit_power_law(self):
+        """
+        Unit test for fit_power_law
+        """
+        cutoffs = [10.0, 15.0, 20.0, 30.0]
+        energies = [-10.0 - 100.0*x**(-3.0) for x in cutoffs]
+        c, a, p, residual = fit_power_law(cutoffs, energies)
+        self.assertAlmostEqual(c, -10.0)
+        self.assertAlmostEqual(a, -100.0)
+        self.assertAlmostEqual(p, 3.0)
+    
+    def test_predict_index(self):
+        """
+        Unit test for predict_index
+        """
+        # steps are 0.5**n*0.5, first one below 1e-3 at n = 9
+        energies = [-10.0 + 0.5**n for n in range(3)]
+        self.assertEqual(predict_index([0, 1, 2], energies, 1e-3), 9)
+        
+        # power law in the cutoff 10 + 5*n
+        measure = lambda n: 10.0 + 5.0*n
+        energies = [-10.0 - 100.0*measure(n)**(-3.0) for n in range(4)]
+        predicted = predict_index(list(range(4)), energies, 1e-3, measure)
+        steps = [100.0*(measure(n)**(-3.0) - measure(n+1)**(-3.0)) \
+                 for n in range(predicted - 1, predicted + 1)]
+        self.assertGreater(steps[0], 1e-3)
+        self.assertLessEqual(steps[1], 1e-3)
+        
+        # a flat line is converged from the start
+        self.assertEqual(predict_index([0, 1, 2], [1.0, 1.0, 1.0], 1e-3), 0)
+        self.assertIsNone(predict_index([0, 1], [1.0, 0.5], 1e-3))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestExtrapolationMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
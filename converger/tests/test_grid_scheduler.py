@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in grid_scheduler.py
+
+@author: abishekk
+"""
+import sys
+import unittest
+
+sys.path.insert(0,'../')
+from grid_scheduler import *
+
+def energy(point):
+    """
+    Model energy converging along both axes
+    """
+    return -10.0 - sum(1.0 - 0.5**(index + 1) for index in point)
+
+class TestGridSchedulerMethods(unittest.TestCase):
+    
+    def run_study(self, sched, queue=None):
+        """
+        Run points one at a time in the order they are handed out
+        """
+        if queue is None:
+            queue = []
+        runs = []
+        while not sched.is_converged():
+            queue += sched.next_points(len(queue))
+            point = queue.pop(0)
+            runs.append(point)
+            sched.add_result(point, energy(point))
+        return runs
+    
+    def test_serial(self):
+        """
+        Unit test for a one parameter study with batchSize 1
+        """
+        sched = GridScheduler(1, 0.1)
+        runs = self.run_study(sched)
+        # energy steps are 0.25, 0.125, 0.0625: converged between 2 and 3
+        self.assertEqual(runs, [(0,), (1,), (2,), (3,)])
+        self.assertEqual(sched.current, (2,))
+        self.assertEqual(sched.converged_point(), (3,))
+    
+    def test_next_points(self):
+        """
+        Unit test for next_points with speculation
+        """
+        sched = GridScheduler(1, 0.1, batchSize=3)
+        self.assertEqual(sched.next_points(0), [(0,), (1,), (2,)])
+        self.assertEqual(sched.next_points(3), [])
+        sched.add_result((0,), energy((0,)))
+        sched.add_result((1,), energy((1,)))
+        self.assertEqual(sched.current, (1,))
+        self.assertEqual(sched.next_points(1), [(3,), (4,)])
+    
+    def test_joint(self):
+        """
+        Unit test for a two parameter study ordered by cost
+        """
+        # the second axis is much more expensive
+        sched = GridScheduler(2, 0.1, batchSize=3, \
+                              cost=lambda point: point[0] + 10*point[1])
+        queue = sched.next_points(0)
+        self.assertEqual(queue, [(0, 0), (1, 0), (0, 1)])
+        runs = self.run_study(sched, queue)
+        self.assertEqual(sched.current, (2, 2))
+        # every point needed to check (2, 2) was run
+        for point in [(2, 2), (3, 2), (2, 3)]:
+            self.assertIn(point, runs)
+    
+    def test_obsolete(self):
+        """
+        Unit test for obsolete
+        """
+        sched = GridScheduler(2, 0.1, batchSize=6)
+        for point in [(0, 0), (1, 0), (0, 1)]:
+            sched.add_result(point, energy(point))
+        self.assertEqual(sched.current, (1, 1))
+        self.assertEqual(sched.obsolete([(2, 0), (1, 2), (0, 3)]), \
+                         [(2, 0), (0, 3)])
+    def test_adaptive(self):
+        """
+        Unit test for adaptive mode, fewer runs than one step at a time
+        """
+        serial = self.run_study(GridScheduler(1, 1e-4))
+        sched = GridScheduler(1, 1e-4, adaptive=True, maxJump=8)
+        adaptive = self.run_study(sched)
+        self.assertTrue(sched.is_converged())
+        self.assertLess(len(adaptive), len(serial))
+        self.assertLessEqual(sched.current[0], 13)
+
+    def test_valid(self):
+        """
+        Unit test for points that cannot be run, they are not speculated on
+        or jumped to, and a study that needs one stops
+        """
+        sched = GridScheduler(1, 0.1, batchSize=4, \
+                              valid=lambda point: point[0] < 3)
+        self.assertEqual(sched.next_points(0), [(0,), (1,), (2,)])
+        sched.add_result((0,), energy((0,)))
+        sched.add_result((1,), energy((1,)))
+        sched.add_result((2,), energy((2,)))
+        self.assertEqual(sched.current, (2,))
+        with self.assertRaises(Exception):
+            sched.next_points(0)
+        
+        sched = GridScheduler(1, 1e-4, adaptive=True, maxJump=8, \
+                              valid=lambda point: point[0] < 5)
+        for point in [(0,), (1,), (2,)]:
+            sched.add_result(point, energy(point))
+        self.assertLessEqual(sched.current[0], 4)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestGridSchedulerMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -45,6 +45,56 @@ class TestInputReaderMethods(unittest.TestCase):
         self.assertEqual(inReader.find_line_number('kpoints'),24)
         self.assertEqual(
                 inReader.find_line_number('kinetic energy cutoff'),11)
+        self.assertEqual(inReader.find_line_number('&electrons'),13)
+        self.assertEqual(inReader.find_line_number('ATOMIC_SPECIES'),19)
+        self.assertEqual(inReader.find_line_number('ecutrho'),None)
+    
+    def test_parameters(self):
+        """
+        Unit test for get_parameter and set_parameter
+        """
+        inReader = InputReader('in.pw.si','qe')
+        inReader.read_file()
+        
+        self.assertEqual(inReader.get_parameter('celldm(1)'),'10.20')
+        self.assertEqual(inReader.get_parameter('nat'),'2')
+        self.assertEqual(inReader.get_parameter('ecutrho'),None)
+        
+        # in place change keeps the other parameters of the line
+        inReader.set_parameter('nat','4')
+        linesRead = inReader.get_lines_file()
+        self.assertEqual(linesRead[10], '    ibrav=  2, ' + \
+                         'celldm(1) =10.20, nat=  4, ntyp= 1,\n')
+        
+        # missing parameter is added after the namelist and lines move
+        inReader.set_parameter('charge density cutoff','72.0')
+        self.assertEqual(inReader.get_parameter('ecutrho'),'72.0')
+        self.assertEqual(inReader.find_line_number('ecutrho'),10)
+        self.assertEqual(inReader.find_line_number('kpoints'),25)
+        self.assertEqual(len(inReader.get_lines_file()),27)
+    
+    def test_cards(self):
+        """
+        Unit test for get_card and set_card
+        """
+        inReader = InputReader('in.pw.si','qe')
+        inReader.read_file()
+        
+        self.assertEqual(inReader.get_card('K_POINTS'), \
+                         ['automatic', ['2 2 2 0 0 0\n']])
+        self.assertEqual(inReader.get_card('ATOMIC_POSITIONS')[1], \
+                         [' Si 0.00 0.00 0.00\n', ' Si 0.25 0.25 0.25\n'])
+        self.assertEqual(inReader.get_card('CELL_PARAMETERS'),None)
+        
+        # a list of k-points is replaced by an automatic grid
+        inReader.set_card('K_POINTS', 'crystal', \
+                          ['2\n', '0 0 0 1\n', '0.5 0.5 0.5 1\n'])
+        self.assertEqual(len(inReader.get_lines_file()),28)
+        inReader.set_card('K_POINTS', 'automatic', ['4 4 4 0 0 0\n'])
+        linesRead = inReader.get_lines_file()
+        self.assertEqual(len(linesRead),26)
+        self.assertEqual(linesRead[-1], '4 4 4 0 0 0\n')
+        self.assertEqual(inReader.find_line_number('kpoints'),24)
 
 if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(TestInputReaderMethods)
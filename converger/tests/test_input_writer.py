@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in input_writer.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0,'../')
+from input_writer import *
+
+class TestInputWriterMethods(unittest.TestCase):
+    
+    def test_fill(self):
+        """
+        Unit test for InputTemplate.fill
+        """
+        lines = ['&system\n', '    ecutwfc = 0\n', '/\n', \
+                 'K_POINTS automatic\n', '0 0 0 0 0 0\n']
+        template = InputTemplate(lines, {'kpoints': 4, 'ecutwfc': 1})
+        
+        self.assertEqual(template.fill({}), ''.join(lines))
+        self.assertEqual(template.fill({'kpoints': '4 4 4 0 0 0\n', \
+                                        'ecutwfc': '    ecutwfc = 30\n'}), \
+                         '&system\n    ecutwfc = 30\n/\n' + \
+                         'K_POINTS automatic\n4 4 4 0 0 0\n')
+        
+        # slots on one line write that line once
+        lines = ['&system\n', '    ecutwfc = 0, ecutrho = 0,\n', '/\n']
+        template = InputTemplate(lines, {'ecutwfc': 1, 'ecutrho': 1})
+        self.assertEqual(template.fill({}), ''.join(lines))
+        line = '    ecutwfc = 30, ecutrho = 240,\n'
+        self.assertEqual(template.fill({'ecutwfc': line, 'ecutrho': line}), \
+                         '&system\n' + line + '/\n')
+    
+    def test_write_batch(self):
+        """
+        Unit test for InputTemplate.write_batch
+        """
+        template = InputTemplate(['a\n', 'b\n', 'c\n'], {'x': 1})
+        variants = [['in.%d' % i, {'x': '%d\n' % i}] for i in range(3)]
+        
+        with tempfile.TemporaryDirectory() as workDir:
+            files = [[os.path.join(workDir, filename), values] \
+                     for filename, values in variants]
+            texts = template.write_batch(files)
+            self.assertEqual(texts[2], 'a\n2\nc\n')
+            with open(os.path.join(workDir, 'in.1')) as fileptr:
+                self.assertEqual(fileptr.read(), 'a\n1\nc\n')
+            
+            bundle = os.path.join(workDir, 'inputs.zip')
+            template.write_batch(variants, bundle)
+            with zipfile.ZipFile(bundle) as arch:
+                self.assertEqual(arch.read('in.0'), b'a\n0\nc\n')
+            
+            bundle = os.path.join(workDir, 'inputs.tar.gz')
+            template.write_batch(variants, bundle)
+            with tarfile.open(bundle) as arch:
+                self.assertEqual(arch.getnames(), ['in.0', 'in.1', 'in.2'])
+                self.assertEqual(arch.extractfile('in.2').read(), \
+                                 b'a\n2\nc\n')
+            
+            with self.assertRaises(Exception):
+                template.write_batch(variants, 'inputs.rar')
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestInputWriterMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in job_engine.py
+
+@author: abishekk
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0,'../')
+from backends import PBSBackend
+from benchmarks import FakeQueue
+from job_engine import *
+
+class TestJobEngineMethods(unittest.TestCase):
+    
+    def setUp(self):
+        """
+        Point the engine at the fake queue scripts in the tests folder
+        """
+        self.queueDir = tempfile.TemporaryDirectory()
+        os.environ['FAKE_QUEUE_DIR'] = self.queueDir.name
+        backend = PBSBackend(submitCmd=os.path.abspath('fake_qsub'), \
+                             statusCmd=os.path.abspath('fake_qstat'), \
+                             cancelCmd=os.path.abspath('fake_qdel'))
+        self.engine = JobEngine(backend, minInterval=0.05, maxInterval=0.2)
+    
+    def tearDown(self):
+        self.queueDir.cleanup()
+    
+    def test_submit(self):
+        """
+        Unit test for submit, many jobs resolved by a shared poller
+        """
+        workDir = self.queueDir.name
+        numJobs = 6
+        for i in range(numJobs):
+            with open(os.path.join(workDir, 'in.%d' % i), 'w') as fileptr:
+                fileptr.write('job %d\n' % i)
+        
+        async def study():
+            handles = []
+            for i in range(numJobs):
+                handles.append(await self.engine.submit( \
+                    'sleep 0.2; cat', 'in.%d' % i, 'out.%d' % i, workDir))
+            return await asyncio.gather(*handles)
+        
+        jobIds = asyncio.run(study())
+        
+        self.assertEqual(len(set(jobIds)), numJobs)
+        for i in range(numJobs):
+            with open(os.path.join(workDir, 'out.%d' % i)) as fileptr:
+                self.assertEqual(fileptr.read(), 'job %d\n' % i)
+        # one status call covers every outstanding job
+        self.assertLess(self.engine.statusCalls, numJobs)
+    
+    def test_cancel(self):
+        """
+        Unit test for cancel
+        """
+        workDir = self.queueDir.name
+        with open(os.path.join(workDir, 'in.slow'), 'w') as fileptr:
+            fileptr.write('slow\n')
+        
+        async def study():
+            handle = await self.engine.submit('sleep 5; cat', 'in.slow', \
+                                              'out.slow', workDir)
+            await self.engine.cancel(handle)
+            return await asyncio.wait_for(handle, 1.0)
+        
+        self.assertTrue(asyncio.run(study()).endswith('.fake'))
+
+    def test_attach(self):
+        """
+        Unit test for attach, a second engine follows a queued job
+        """
+        workDir = self.queueDir.name
+        with open(os.path.join(workDir, 'in.job'), 'w') as fileptr:
+            fileptr.write('job\n')
+        
+        async def submit():
+            handle = await self.engine.submit('sleep 0.3; cat', 'in.job', \
+                                              'out.job', workDir)
+            return handle.jobId
+        
+        async def study(jobId):
+            engine = JobEngine(self.engine.backend, minInterval=0.05)
+            handle = await engine.attach(jobId)
+            await asyncio.wait_for(handle, 2.0)
+            return await engine.attach(jobId)
+        
+        jobId = asyncio.run(submit())
+        self.assertEqual(asyncio.run(study(jobId)), None)
+        with open(os.path.join(workDir, 'out.job')) as fileptr:
+            self.assertEqual(fileptr.read(), 'job\n')
+
+    def test_limits(self):
+        """
+        Unit test for maxJobs and the fair sharing of slots between owners
+        """
+        engine = JobEngine(FakeQueue(0.0, lambda: 0.1), minInterval=0.02, \
+                           maxInterval=0.05, maxJobs=2)
+        workDir = self.queueDir.name
+        with open(os.path.join(workDir, 'in.job'), 'w') as fileptr:
+            fileptr.write('job\n')
+        order = []
+        inQueue = []
+        
+        async def owner(name, numJobs):
+            handles = []
+            for i in range(numJobs):
+                handles.append(await engine.submit('pw.x', 'in.job', \
+                               'out.job', workDir, owner=name))
+                order.append(name)
+                inQueue.append(engine.in_queue())
+            await asyncio.gather(*handles)
+        
+        async def study():
+            await asyncio.gather(owner('a', 4), owner('b', 2))
+        
+        asyncio.run(study())
+        
+        self.assertLessEqual(max(inQueue), 2)
+        # b is not starved by the jobs a submitted first
+        self.assertEqual(order[:4], ['a', 'b', 'a', 'b'])
+
+    def test_failed_status(self):
+        """
+        Unit test for status queries that fail
+        """
+        class FlakyQueue(FakeQueue):
+            def status(self, jobIds):
+                self.failures -= 1
+                if self.failures >= 0:
+                    raise Exception('qstat: cannot connect to server')
+                return super().status(jobIds)
+        
+        workDir = self.queueDir.name
+        with open(os.path.join(workDir, 'in.job'), 'w') as fileptr:
+            fileptr.write('job\n')
+        
+        async def study(engine):
+            handle = await engine.submit('pw.x', 'in.job', 'out.job', \
+                                         workDir)
+            return await handle
+        
+        # the poller retries and the job is still followed to its end
+        queue = FlakyQueue(0.0, lambda: 0.05)
+        queue.failures = 3
+        engine = JobEngine(queue, minInterval=0.02, maxInterval=0.05)
+        self.assertEqual(asyncio.run(study(engine)), '1.fake')
+        self.assertGreater(engine.statusCalls, 3)
+        
+        # the handles fail once the queue cannot be queried any more
+        queue = FlakyQueue(0.0, lambda: 0.05)
+        queue.failures = 10
+        engine = JobEngine(queue, minInterval=0.02, maxInterval=0.05, \
+                           maxFailures=3)
+        with self.assertRaises(Exception):
+            asyncio.run(study(engine))
+        self.assertEqual(engine.statusCalls, 3)
+        self.assertEqual(engine.in_queue(), 0)
+
+    def test_failed_submit(self):
+        """
+        Unit test for a submit that raises while another owner waits for
+        its slot
+        """
+        class FlakyQueue(FakeQueue):
+            def submit(self, cmd, inputFile, outputFile, workDir, \
+                       params=None):
+                if not self.submitted:
+                    self.submitted += 1
+                    time.sleep(0.05)
+                    raise Exception('qsub: cannot connect to server')
+                return super().submit(cmd, inputFile, outputFile, workDir)
+        
+        engine = JobEngine(FlakyQueue(0.0, lambda: 0.05), minInterval=0.02, \
+                           maxInterval=0.05, maxJobs=1)
+        workDir = self.queueDir.name
+        with open(os.path.join(workDir, 'in.job'), 'w') as fileptr:
+            fileptr.write('job\n')
+        
+        async def owner(name):
+            try:
+                handle = await engine.submit('pw.x', 'in.job', 'out.job', \
+                                             workDir, owner=name)
+            except Exception:
+                return 'failed'
+            return await handle
+        
+        async def study():
+            return await asyncio.wait_for(asyncio.gather(owner('a'), \
+                                                         owner('b')), 5.0)
+        
+        # b gets the slot a did not use instead of waiting forever
+        self.assertEqual(asyncio.run(study()), ['failed', '2.fake'])
+        self.assertEqual(engine.in_queue(), 0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestJobEngineMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in job_launcher.py
+
+@author: abishekk
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0,'../')
+from backends import Backend, LocalBackend, SlurmBackend
+from cost_model import CostModel
+from job_launcher import *
+from retry_policy import RetryPolicy
+
+class TestJobLauncherMethods(unittest.TestCase):
+    
+    def test_work_dir(self):
+        """
+        Unit test for job_submit, the job runs in the directory of its
+        input whatever the current directory is when it is submitted
+        """
+        backend = LocalBackend(coresPerJob=1, totalCores=2)
+        testDir = os.getcwd()
+        with tempfile.TemporaryDirectory() as workDir:
+            for name in ['a', 'b']:
+                os.makedirs(os.path.join(workDir, name))
+                with open(os.path.join(workDir, name, 'in.job'), 'w') \
+                     as fileptr:
+                    fileptr.write('job ' + name + '\n')
+            
+            jobA = JobLauncher('cat', os.path.join(workDir, 'a', 'in.job'), \
+                               'out.job', backend=backend)
+            jobB = JobLauncher('cat', 'in.job', 'out.job', backend=backend, \
+                               workDir=os.path.join(workDir, 'b'))
+            self.assertEqual(jobA.inFile, 'in.job')
+            self.assertEqual(jobA.workDir, os.path.join(workDir, 'a'))
+            
+            try:
+                os.chdir(workDir)
+                jobA.job_submit()
+                jobB.job_submit()
+            finally:
+                os.chdir(testDir)
+            while not (jobA.job_done() and jobB.job_done()):
+                time.sleep(0.05)
+            backend.shutdown()
+            
+            for name in ['a', 'b']:
+                with open(os.path.join(workDir, name, 'out.job')) as fileptr:
+                    self.assertEqual(fileptr.read(), 'job ' + name + '\n')
+            self.assertFalse(os.path.exists(os.path.join(workDir, \
+                                                         'out.job')))
+
+    def test_job_run_retry(self):
+        """
+        Unit test for job_run, a SCF that does not converge is run again
+        with less mixing, and a failed submission does not wait
+        """
+        os.environ['FAKE_PW_MAX_BETA'] = '0.5'
+        backend = LocalBackend(coresPerJob=1, totalCores=1)
+        try:
+            with tempfile.TemporaryDirectory() as workDir:
+                inPath = os.path.join(workDir, 'in.pw.si')
+                shutil.copy('in.pw.si', inPath)
+                jobMgr = JobLauncher(os.path.abspath('fake_pw'), inPath, \
+                                     'out.pw.si', backend=backend, \
+                                     retry=RetryPolicy(delay=0.0))
+                self.assertEqual(jobMgr.job_run(interval=0.05), 'ok')
+                self.assertEqual(jobMgr.attempts, 1)
+                self.assertTrue(os.path.exists(os.path.join(workDir, \
+                                               'out.pw.si.failed1')))
+                with open(inPath) as fileptr:
+                    self.assertIn('mixing_beta = 0.35', fileptr.read())
+                
+                shutil.copy('in.pw.si', os.path.join(workDir, 'in.2'))
+                noRetry = JobLauncher(os.path.abspath('fake_pw'), 'in.2', \
+                                      'out.2', backend=backend, \
+                                      workDir=workDir)
+                self.assertEqual(noRetry.job_run(interval=0.05), \
+                                 'scf not converged')
+        finally:
+            del os.environ['FAKE_PW_MAX_BETA']
+            backend.shutdown()
+        
+        class NoQueue(Backend):
+            def submit(self, cmd, inputFile, outputFile, workDir, \
+                       params=None):
+                return ''
+        
+        jobMgr = JobLauncher('pw.x', 'in.pw.si', 'out.pw.si', \
+                             backend=NoQueue(1))
+        self.assertEqual(jobMgr.job_run(), 'submit failed')
+    
+    def test_walltime_retry(self):
+        """
+        Unit test for job_run, a job killed at its time limit is submitted
+        again with a longer limit, the shared backend keeps its options
+        """
+        class TimedBackend(LocalBackend):
+            # jobs given the shortest time limit run out of time
+            def submit(self, cmd, inputFile, outputFile, workDir, \
+                       params=None):
+                self.submitted.append(params)
+                if params == '-l walltime=00:10:00':
+                    cmd = 'echo "     Maximum CPU time exceeded"'
+                return super().submit(cmd, inputFile, outputFile, workDir)
+        
+        backend = TimedBackend(coresPerJob=1, totalCores=1, \
+                               params='-l walltime=00:10:00')
+        backend.submitted = []
+        try:
+            with tempfile.TemporaryDirectory() as workDir:
+                inPath = os.path.join(workDir, 'in.pw.si')
+                shutil.copy('in.pw.si', inPath)
+                jobMgr = JobLauncher(os.path.abspath('fake_pw'), inPath, \
+                                     'out.pw.si', backend=backend, \
+                                     retry=RetryPolicy(delay=0.0, \
+                                                       walltimeFactor=2.0))
+                self.assertEqual(jobMgr.job_run(interval=0.05), 'ok')
+        finally:
+            backend.shutdown()
+        self.assertEqual(backend.submitted, ['-l walltime=00:10:00', \
+                                             '-l walltime=0:20:00'])
+        self.assertEqual(backend.params, '-l walltime=00:10:00')
+
+    def test_size_request(self):
+        """
+        Unit test for size_request and learning from the finished run
+        """
+        model = CostModel(minTime=60.0, maxTime=4000.0)
+        backend = Backend(16, params='-l nodes=1:ppn=16 -l walltime=24:00:00')
+        jobMgr = JobLauncher('mpirun -np 16 pw.x', 'in.pw.si', 'out.pw.si', \
+                             backend=backend, costModel=model, \
+                             coreOptions=[4, 8, 16])
+        self.assertIsNone(jobMgr.size_request())
+        self.assertEqual(jobMgr.pbsParams, \
+                         '-l nodes=1:ppn=16 -l walltime=24:00:00')
+        
+        # silicon with 3 irreducible k-points, 2 hours on 4 cores
+        model.add_record({'kpoints': 3, 'ecutwfc': 18.0, 'atoms': 2, \
+                          'processors': 4, 'wall time': 7200.0})
+        self.assertEqual(jobMgr.size_request(), 5400.0)
+        self.assertEqual(jobMgr.cmdStr, 'mpirun -np 8 pw.x')
+        self.assertEqual(jobMgr.pbsParams, \
+                         '-l nodes=1:ppn=8 -l walltime=1:30:00')
+        self.assertEqual(jobMgr.cores, 8)
+        # the backend may be shared by other jobs
+        self.assertEqual(backend.coresPerJob, 16)
+        self.assertEqual(backend.params, \
+                         '-l nodes=1:ppn=16 -l walltime=24:00:00')
+        
+        slurm = SlurmBackend(16, params='--time=24:00:00')
+        jobMgr = JobLauncher('srun -n 16 pw.x', 'in.pw.si', 'out.pw.si', \
+                             backend=slurm, costModel=model, \
+                             coreOptions=[4, 8, 16])
+        self.assertEqual(jobMgr.size_request(), 5400.0)
+        self.assertEqual(jobMgr.cmdStr, 'srun -n 8 pw.x')
+        self.assertEqual(jobMgr.pbsParams, '--time=1:30:00 --ntasks=8')
+        self.assertEqual(slurm.params, '--time=24:00:00')
+        
+        backend = LocalBackend(coresPerJob=1, totalCores=1)
+        with tempfile.TemporaryDirectory() as workDir:
+            inPath = os.path.join(workDir, 'in.pw.si')
+            shutil.copy('in.pw.si', inPath)
+            jobMgr = JobLauncher(os.path.abspath('fake_pw'), inPath, \
+                                 'out.pw.si', backend=backend, \
+                                 costModel=model)
+            self.assertEqual(jobMgr.job_run(interval=0.05), 'ok')
+        backend.shutdown()
+        self.assertEqual(len(model.runs), 2)
+        self.assertEqual(model.runs[1][:4], [8, 18.0, 2, 1])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestJobLauncherMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
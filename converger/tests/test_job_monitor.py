@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in job_monitor.py
+
+@author: abishekk
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from job_monitor import *
+
+class TestJobMonitorMethods(unittest.TestCase):
+    
+    def test_update(self):
+        """
+        Unit test for update, diverging and report
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            done = os.path.join(workDir, 'out.done')
+            bad = os.path.join(workDir, 'out.bad')
+            shutil.copy('si.scf.cg.out', done)
+            with open(bad, 'w') as fileptr:
+                for i, accuracy in enumerate([1e-2, 1e-3, 1e-1, 1.0]):
+                    fileptr.write('     iteration #%3d\n' % (i+1))
+                    fileptr.write('     estimated scf accuracy    <  ' + \
+                                  '%.8f Ry\n' % accuracy)
+            
+            monitor = JobMonitor('qe', window=2, factor=10.0)
+            monitor.follow(done)
+            monitor.follow(bad)
+            newAccuracy = monitor.update()
+            self.assertEqual(len(newAccuracy[done]), 6)
+            self.assertEqual(len(newAccuracy[bad]), 4)
+            self.assertEqual(monitor.update()[bad], [])
+            self.assertEqual(monitor.diverging(), [bad])
+            self.assertIn('diverging', monitor.report().splitlines()[1])
+            
+            monitor.forget(bad)
+            self.assertEqual(monitor.diverging(), [])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestJobMonitorMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in kgrid_planner.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0,'../')
+from input_reader import InputReader
+from kgrid_planner import *
+
+class TestKGridPlannerMethods(unittest.TestCase):
+    
+    def test_cell_from_input(self):
+        """
+        Unit test for cell_from_input, with celldm and CELL_PARAMETERS
+        """
+        qeInput = InputReader('in.pw.si')
+        qeInput.read_file()
+        cell = cell_from_input(qeInput)
+        self.assertTrue(np.allclose(cell, [[-5.1, 0, 5.1], [0, 5.1, 5.1], \
+                                           [-5.1, 5.1, 0]]))
+        
+        with open('in.pw.si', 'r') as fileptr:
+            text = fileptr.read()
+        text = text.replace('ibrav=  2, celldm(1) =10.20', 'ibrav = 0')
+        text += 'CELL_PARAMETERS angstrom\n 2.0 0.0 0.0\n 0.0 2.0 0.0\n' + \
+                ' 0.0 0.0 5.0\n'
+        with tempfile.TemporaryDirectory() as workDir:
+            inPath = os.path.join(workDir, 'in.pw.tet')
+            with open(inPath, 'w') as fileptr:
+                fileptr.write(text)
+            qeInput = InputReader(inPath)
+            qeInput.read_file()
+            cell = cell_from_input(qeInput)
+        self.assertTrue(np.allclose(cell*0.52917721067, \
+                                    np.diag([2.0, 2.0, 5.0])))
+    
+    def test_irreducible_count(self):
+        """
+        Unit test for lattice_symmetries and irreducible_count, the counts
+        of pw.x for silicon
+        """
+        rotations = lattice_symmetries(bravais_cell(2, [10.2, 0, 0, 0, 0, 0]))
+        self.assertEqual(len(rotations), 48)
+        self.assertEqual(irreducible_count([2,2,2], rotations), 3)
+        self.assertEqual(irreducible_count([4,4,4], rotations), 8)
+        self.assertEqual(irreducible_count([4,4,4], rotations, [1,1,1]), 10)
+        cubic = lattice_symmetries(bravais_cell(1, [8.0, 0, 0, 0, 0, 0]))
+        self.assertEqual(irreducible_count([2,2,2], cubic), 4)
+        self.assertEqual(irreducible_count([3,3,3], cubic), 4)
+        hexagonal = bravais_cell(4, [6.0, 0, 1.6, 0, 0, 0])
+        self.assertEqual(len(lattice_symmetries(hexagonal)), 24)
+    
+    def test_planner(self):
+        """
+        Unit test for KGridPlanner, equal spacing in anisotropic cells and
+        grids kept when they have no more irreducible k-points
+        """
+        planner = KGridPlanner(bravais_cell(8, [6.0, 1.0, 2.0, 0, 0, 0]), \
+                               start=[4,4,2])
+        grids = [list(planner.grid(i)) for i in range(6)]
+        self.assertEqual(grids[0], [4, 4, 2])
+        for grid in grids:
+            self.assertLessEqual(abs(grid[0] - 2*grid[2]), 1)
+        self.assertEqual(len(set(map(tuple, grids))), 6)
+        counts = [planner.count(i) for i in range(6)]
+        self.assertEqual(counts, sorted(counts))
+        
+        planner = KGridPlanner(bravais_cell(1, [8.0, 0, 0, 0, 0, 0]), \
+                               maxDivisions=4)
+        self.assertEqual([list(planner.grid(i)) for i in range(6)], \
+                         [[1, 1, 1], [2, 2, 2], [3, 3, 3], [4, 4, 4], \
+                          [5, 5, 5], [6, 6, 6]])
+        self.assertEqual(planner.maxDivisions, 8)
+        self.assertEqual(planner.count(1), planner.count(2))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase( \
+                TestKGridPlannerMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in metrics.py
+
+@author: abishekk
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0,'../')
+from metrics import *
+
+class TestMetricsMethods(unittest.TestCase):
+    
+    def test_spans(self):
+        """
+        Unit test for span, start, stop, record and totals
+        """
+        metrics = Metrics()
+        with metrics.span('a/out.a', 'parse'):
+            time.sleep(0.01)
+        metrics.start('a/out.a', 'turnaround')
+        self.assertGreater(metrics.stop('a/out.a', 'turnaround'), 0.0)
+        self.assertEqual(metrics.stop('a/out.a', 'turnaround'), None)
+        metrics.record('a/out.a', 'run', 2.0)
+        metrics.record('b/out.b', 'run', 3.0)
+        metrics.count('status calls', 4)
+        metrics.count('status calls')
+        
+        spans = metrics.get_spans('a/out.a')
+        self.assertGreaterEqual(spans['parse'], 0.01)
+        self.assertEqual(sorted(spans), ['parse', 'run', 'turnaround'])
+        self.assertEqual(metrics.totals()['run'], 5.0)
+        self.assertEqual(metrics.counters['status calls'], 5)
+    
+    def test_export(self):
+        """
+        Unit test for write_json and to_prometheus
+        """
+        metrics = Metrics()
+        metrics.record('a/"out".a', 'queue wait', 1.5)
+        metrics.count('status calls', 2)
+        
+        text = metrics.to_prometheus()
+        self.assertIn('qetools_span_seconds{point="a/\\"out\\".a",' + \
+                      'span="queue wait"} 1.5\n', text)
+        self.assertIn('qetools_span_seconds_total{span="queue wait"} 1.5\n', \
+                      text)
+        self.assertIn('qetools_status_calls_total 2\n', text)
+        
+        with tempfile.TemporaryDirectory() as workDir:
+            jsonFile = os.path.join(workDir, 'metrics.json')
+            metrics.write_json(jsonFile)
+            with open(jsonFile) as fileptr:
+                data = json.load(fileptr)
+            
+            profileFile = os.path.join(workDir, 'study.prof')
+            with Metrics(profileFile).profile():
+                sum(range(1000))
+            self.assertTrue(os.path.exists(profileFile))
+        
+        self.assertEqual(data['counters'], {'status calls': 2})
+        self.assertEqual(data['totals'], {'queue wait': 1.5})
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMetricsMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -5,8 +5,10 @@ Unit tests for functions in output_parser.py
 
 @author: abishekk
 """
-import unittest
+import os
 import sys
+import tempfile
+import unittest
 
 sys.path.insert(0,'../')
 from output_parser import *
@@ -27,6 +29,102 @@ class TestOutputParserMethods(unittest.TestCase):
         self.assertEqual(testOutRead.get_totenergy(), \
                          -15.84452726*testOutRead.rydtoev)
 
+    def test_parse_qe_record(self):
+        """
+        Unit test for the properties read in one pass
+        """
+        testOutRead = OutputParser('qe')
+        testOutRead.parse_op_file('./si.scf.cg.out')
+        self.assertEqual(testOutRead.get_fermienergy(), 5.9568)
+        self.assertEqual(testOutRead.get_scf_iterations(), 6)
+        self.assertTrue(testOutRead.get_converged())
+        self.assertEqual(testOutRead.get_walltime(), 0.27)
+        self.assertEqual(len(testOutRead.get_forces()), 2)
+        self.assertEqual(testOutRead.get_stress()[1][1], -10.24)
+        record = testOutRead.get_record()
+        self.assertEqual([record['atoms'], record['ecutwfc'], \
+                          record['processors'], record['memory']], \
+                         [2, 18.0, 4, 1.92])
+        
+        # early exit keeps only what was asked for
+        testOutRead = OutputParser('qe')
+        testOutRead.parse_op_file('./si.scf.cg.out', ['kpoints'])
+        self.assertEqual(testOutRead.get_kpoints(), 10)
+        self.assertIsNone(testOutRead.get_walltime())
+        
+        with self.assertRaises(Exception):
+            testOutRead.parse_op_file('./si.scf.cg.out', ['band gap'])
+        
+        # the energy of the last ionic step is kept
+        with open('./si.scf.cg.out', 'r') as fileptr:
+            text = fileptr.read()
+        with tempfile.TemporaryDirectory() as workDir:
+            outPath = os.path.join(workDir, 'out.relax')
+            with open(outPath, 'w') as fileptr:
+                fileptr.write(text.replace('     PWSCF        :', \
+                    '!    total energy              =     -15.9 Ry\n' + \
+                    '     PWSCF        :'))
+            testOutRead = OutputParser('qe')
+            testOutRead.parse_op_file(outPath, ['total energy', 'kpoints'])
+        self.assertEqual(testOutRead.get_totenergy(), \
+                         -15.9*testOutRead.rydtoev)
+        self.assertEqual(testOutRead.get_kpoints(), 10)
+    
+    def test_qe_time_to_seconds(self):
+        """
+        Unit test for qe_time_to_seconds
+        """
+        self.assertEqual(qe_time_to_seconds('0.27s'), 0.27)
+        self.assertEqual(qe_time_to_seconds('1m30.00s'), 90.0)
+        self.assertEqual(qe_time_to_seconds('2h 5m'), 7500.0)
+    
+    def test_qe_memory_to_mb(self):
+        """
+        Unit test for qe_memory_to_mb
+        """
+        self.assertEqual(qe_memory_to_mb('0.48Mb'), 0.48)
+        self.assertEqual(qe_memory_to_mb('1.50 GB'), 1536.0)
+        self.assertEqual(qe_memory_to_mb('512 KB'), 0.5)
+    
+    def test_parse_qe_increment(self):
+        """
+        Unit test for parse_qe_increment and scf_diverging
+        """
+        with open('./si.scf.cg.out', 'rb') as fileptr:
+            data = fileptr.read()
+        
+        with tempfile.TemporaryDirectory() as workDir:
+            outFile = os.path.join(workDir, 'out.running')
+            testOutRead = OutputParser('qe')
+            self.assertEqual(testOutRead.parse_qe_increment(outFile), [])
+            
+            # the job writes the output in pieces, one ending mid-line
+            cut = data.index(b'estimated scf accuracy') + 30
+            newAccuracy = []
+            with open(outFile, 'wb') as fileptr:
+                for chunk in (data[:cut], data[cut:len(data)//2], \
+                              data[len(data)//2:]):
+                    fileptr.write(chunk)
+                    fileptr.flush()
+                    newAccuracy += testOutRead.parse_qe_increment(outFile)
+            
+            self.assertEqual(len(newAccuracy), 6)
+            self.assertEqual(newAccuracy[-1], 1.1e-09)
+            self.assertEqual(testOutRead.get_totenergy(), \
+                             -15.84452726*testOutRead.rydtoev)
+            self.assertEqual(testOutRead.get_stress()[1][1], -10.24)
+            self.assertFalse(testOutRead.scf_diverging())
+            
+            # accuracy grows for the last 5 iterations of a new cycle
+            with open(outFile, 'a') as fileptr:
+                for i, accuracy in enumerate([1e-1, 1e-3, 1e-2, 1e-1, \
+                                              1.0, 10.0, 100.0]):
+                    fileptr.write('     iteration #%3d\n' % (i+1))
+                    fileptr.write('     estimated scf accuracy    <  ' + \
+                                  '%.8f Ry\n' % accuracy)
+            self.assertEqual(len(testOutRead.parse_qe_increment(outFile)), 7)
+            self.assertTrue(testOutRead.scf_diverging(window=5, factor=5.0))
+
 
 if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(TestOutputParserMethods)
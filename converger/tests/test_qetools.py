@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in qetools.py
+
+@author: abishekk
+"""
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from output_parser import OutputParser
+from qetools import *
+
+def run_main(argv):
+    """
+    Returns exit status and printed text of main(argv)
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        status = main(argv)
+    return status, out.getvalue()
+
+class TestQetoolsMethods(unittest.TestCase):
+    
+    def test_parse(self):
+        """
+        Unit test for the parse subcommand
+        """
+        status, out = run_main(['parse', 'si.scf.cg.out'])
+        self.assertEqual(status, 0)
+        lines = out.splitlines()
+        self.assertEqual(lines[0].split('\t')[:2], ['path', 'total energy'])
+        readOut = OutputParser('qe')
+        readOut.parse_op_file('si.scf.cg.out')
+        self.assertEqual(lines[1].split('\t')[:2], ['si.scf.cg.out', \
+                         str(readOut.get_record()['total energy'])])
+        
+        status, out = run_main(['parse', 'si.scf.cg.out', '--json'])
+        record = json.loads(out)
+        self.assertEqual(record['kpoints'], readOut.get_record()['kpoints'])
+        self.assertEqual(record['path'], 'si.scf.cg.out')
+    
+    def test_light_imports(self):
+        """
+        Unit test that status and parse do not import NumPy or matplotlib
+        """
+        code = ('import sys; sys.path.insert(0, "../"); import qetools; ' + \
+                'qetools.main(["parse", "si.scf.cg.out"]); ' + \
+                'print(sorted(m for m in ("numpy", "matplotlib") ' + \
+                'if m in sys.modules))')
+        out = subprocess.check_output([sys.executable, '-c', code], \
+                                      universal_newlines=True)
+        self.assertEqual(out.splitlines()[-1], '[]')
+    
+    def test_run_resume_status_report(self):
+        """
+        Unit test for the run, resume, status and report subcommands
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            studyDir = os.path.join(workDir, 'si')
+            storeDir = os.path.join(workDir, 'results')
+            status, out = run_main(['run', 'in.pw.si', '-p', 'ecutwfc', \
+                                    '20', '10', '--tol', '1e-3', \
+                                    '--batch', '8', \
+                                    '--backend', 'local', '--cores', '1', \
+                                    '--executable', \
+                                    os.path.abspath('fake_pw'), \
+                                    '--work-dir', studyDir, \
+                                    '--store', storeDir])
+            self.assertEqual(status, 0)
+            self.assertIn('Value of ecutwfc needed for convergence: 90', out)
+            self.assertTrue(os.path.exists(os.path.join(studyDir, \
+                                                        'qetools.json')))
+            
+            status, out = run_main(['status', studyDir])
+            self.assertEqual(out.splitlines()[-1], '8 finished')
+            
+            # every point is in the journal, nothing is submitted again
+            status, out = run_main(['resume', studyDir])
+            self.assertIn('Value of ecutwfc needed for convergence: 90', out)
+            status, out = run_main(['status', studyDir])
+            self.assertEqual(out.splitlines()[-1], '8 finished')
+            
+            htmlPath = os.path.join(workDir, 'report.html')
+            status, out = run_main(['report', '--store', storeDir, \
+                                    '--html', htmlPath, '--plot-dir', \
+                                    os.path.join(workDir, 'plots')])
+            self.assertEqual(out.split(), [os.path.join(workDir, 'plots', \
+                                                        'in.pw.si.png'), \
+                                           htmlPath])
+            with open(htmlPath) as fileptr:
+                self.assertIn('<h2>in.pw.si</h2>', fileptr.read())
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestQetoolsMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in report.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from report import *
+from result_store import ResultStore
+
+class TestReportMethods(unittest.TestCase):
+    
+    def setUp(self):
+        self.workDir = tempfile.TemporaryDirectory()
+        self.single = make_summary('in.pw.si', ['ecutwfc'], 'total energy', \
+                                   [[30, -15.2], [20, -15.1], [40, -15.21]], \
+                                   [[40.0]])
+        self.joint = make_summary('in.pw.ge', ['ecutwfc', 'kpoints'], \
+                                  'total energy', \
+                                  [[20, 8, -20.1], [30, 8, -20.2], \
+                                   [20, 27, -20.15], [30, 27, -20.25]])
+    
+    def tearDown(self):
+        self.workDir.cleanup()
+    
+    def test_plot_convergence(self):
+        """
+        Unit test for plot_convergence, the format follows the extension
+        """
+        for name in ['si.png', 'si.svg']:
+            path = os.path.join(self.workDir.name, name)
+            plot_convergence(self.single, path)
+            self.assertGreater(os.path.getsize(path), 0)
+        with open(os.path.join(self.workDir.name, 'si.svg')) as fileptr:
+            self.assertIn('<svg', fileptr.read())
+        self.assertNotIn('matplotlib.pyplot', sys.modules)
+    
+    def test_write_html_report(self):
+        """
+        Unit test for write_html_report
+        """
+        path = os.path.join(self.workDir.name, 'report.html')
+        write_html_report([self.single, self.joint], path)
+        with open(path) as fileptr:
+            page = fileptr.read()
+        self.assertEqual(page.count('<svg'), 2)
+        self.assertIn('<h2>in.pw.ge</h2>', page)
+        self.assertIn('<tr><td>ecutwfc</td><td>40</td></tr>', page)
+    
+    def test_render_reports(self):
+        """
+        Unit test for render_reports in worker processes
+        """
+        paths = [os.path.join(self.workDir.name, name) for name in \
+                 ['si.png', 'ge.html']]
+        self.assertEqual(render_reports([self.single, self.joint], paths, \
+                                        processes=2), paths)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+    
+    def test_store_summaries(self):
+        """
+        Unit test for store_summaries
+        """
+        store = ResultStore(os.path.join(self.workDir.name, 'results'))
+        for ecut, energy in [[20.0, -15.1], [30.0, -15.2]]:
+            store.add('out.%d' % ecut, {'total energy': energy, \
+                      'kpoints': 10}, 'si', {'ecutwfc': [ecut]})
+        store.add('out.k', {'total energy': -20.0, 'kpoints': 27}, 'ge', \
+                  {'kpoints': [3, 3, 3]})
+        store.flush()
+        
+        summaries = store_summaries(store)
+        self.assertEqual([summary['name'] for summary in summaries], \
+                         ['ge', 'si'])
+        self.assertEqual(summaries[0]['params'], ['kpoints'])
+        self.assertEqual(summaries[0]['results'], [[27.0, -20.0]])
+        self.assertEqual(summaries[1]['params'], ['ecutwfc'])
+        self.assertEqual(summaries[1]['results'], [[20.0, -15.1], \
+                                                   [30.0, -15.2]])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestReportMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in result_cache.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from input_reader import InputReader
+from result_cache import *
+
+class TestResultCacheMethods(unittest.TestCase):
+    
+    def setUp(self):
+        self.cacheDir = tempfile.TemporaryDirectory()
+        inReader = InputReader('in.pw.si','qe')
+        inReader.read_file()
+        self.lines = inReader.get_lines_file()
+    
+    def tearDown(self):
+        self.cacheDir.cleanup()
+    
+    def test_input_key(self):
+        """
+        Unit test for input_key
+        """
+        cache = ResultCache(self.cacheDir.name)
+        key = cache.input_key(self.lines)
+        
+        # whitespace and comments do not change the key
+        spaced = [line.replace(' ', '   ') for line in self.lines]
+        spaced.insert(3, '! a comment\n')
+        self.assertEqual(cache.input_key(spaced), key)
+        
+        # a different k-point grid does
+        changed = self.lines.copy()
+        changed[-1] = '4 4 4 0 0 0\n'
+        self.assertNotEqual(cache.input_key(changed), key)
+        
+        # so does the content of a pseudopotential in pseudo_dir
+        os.environ['PSEUDO_DIR'] = self.cacheDir.name
+        with open(os.path.join(self.cacheDir.name, 'Si.pz-vbc.UPF'), \
+                  'w') as fileptr:
+            fileptr.write('pseudo\n')
+        keyPseudo = cache.input_key(self.lines)
+        with open(os.path.join(self.cacheDir.name, 'Si.pz-vbc.UPF'), \
+                  'w') as fileptr:
+            fileptr.write('another pseudo\n')
+        self.assertNotEqual(cache.input_key(self.lines), keyPseudo)
+    
+    def test_get_put_invalidate(self):
+        """
+        Unit test for get, put and invalidate
+        """
+        cache = ResultCache(self.cacheDir.name)
+        key = cache.input_key(self.lines)
+        self.assertIsNone(cache.get(key))
+        
+        cache.put(key, {'kpoints': 10, 'total energy': -215.57})
+        self.assertEqual(cache.get(key)['kpoints'], 10)
+        
+        cache.invalidate(key)
+        self.assertIsNone(cache.get(key))
+    
+    def test_evict(self):
+        """
+        Unit test for evict
+        """
+        cache = ResultCache(self.cacheDir.name, maxEntries=2)
+        for i in range(4):
+            cache.put('key%d' % i, {'total energy': float(i)})
+            # make the modification times distinct
+            os.utime(cache._entry_path('key%d' % i), (i, i))
+        self.assertIsNone(cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key3')['total energy'], 3.0)
+        
+        cache = ResultCache(self.cacheDir.name, maxAge=60)
+        self.assertIsNone(cache.get('key3'))
+        cache.put('fresh', {'total energy': 1.0})
+        self.assertEqual(cache.get('fresh')['total energy'], 1.0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestResultCacheMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
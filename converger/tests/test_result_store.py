@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in result_store.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from input_reader import InputReader
+from result_store import *
+
+class TestResultStoreMethods(unittest.TestCase):
+    
+    def setUp(self):
+        """
+        Store an ecutwfc study of si in two segments and a k-point study of
+        ge in a third
+        """
+        self.workDir = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.workDir.name, 'results'), \
+                                 segmentRows=3)
+        for ecut in [20.0, 30.0, 40.0, 50.0]:
+            self.store.add('ecutwfc_%d/out' % ecut, \
+                           {'total energy': -15.0 - 1.0/ecut, \
+                            'kpoints': 10, 'scf iterations': 6, \
+                            'converged': True, 'wall time': 1.5}, \
+                           'si', {'ecutwfc': [ecut]})
+        self.store.flush()
+        for k in [4, 6]:
+            self.store.add('kpoints_%d/out' % k, \
+                           {'total energy': -20.0, 'kpoints': k**3, \
+                            'converged': k > 4}, \
+                           'ge', {'kpoints': [k, k, k]})
+        self.store.flush()
+    
+    def tearDown(self):
+        self.workDir.cleanup()
+    
+    def test_query(self):
+        """
+        Unit test for query
+        """
+        self.assertEqual(len(self.store.segments()), 3)
+        
+        table = self.store.query(label='si', ecutwfc=(25, 45))
+        self.assertEqual(list(table['ecutwfc']), [30.0, 40.0])
+        self.assertAlmostEqual(table['total energy'][0], -15.0 - 1.0/30)
+        self.assertEqual(list(table['label']), ['si', 'si'])
+        self.assertTrue(table['path'][0].endswith('ecutwfc_30/out'))
+        
+        table = self.store.query(converged=True, columns=['k1', 'kpoints'])
+        self.assertEqual(sorted(table), ['k1', 'kpoints', 'label', 'path'])
+        self.assertEqual(list(table['kpoints']), [10, 10, 10, 10, 216])
+        self.assertEqual(list(self.store.query(label='ge')['k1']), [4, 6])
+        
+        self.assertEqual(len(self.store.query(label='c')['path']), 0)
+        self.assertEqual(len(self.store.query(ecutwfc=100.0)['path']), 0)
+        with self.assertRaises(Exception):
+            self.store.query(volume=(1, 2))
+    
+    def test_compact(self):
+        """
+        Unit test for compact
+        """
+        before = self.store.query()
+        self.store.compact()
+        self.assertEqual(len(self.store.segments()), 1)
+        after = self.store.query()
+        self.assertEqual(list(after['path']), list(before['path']))
+        self.assertEqual(list(after['label']), list(before['label']))
+        self.assertEqual(list(after['ecutwfc'][:4]), [20.0, 30.0, 40.0, 50.0])
+
+    def test_add_fixed(self):
+        """
+        Unit test for add, the cutoff and k-point grid that a study does not
+        vary are taken from the record or the input of the run
+        """
+        qeInput = InputReader('in.pw.si')
+        qeInput.read_file()
+        self.store.add('ecut/out', {'total energy': -15.8}, 'fixed', \
+                       {'ecutwfc': [30.0]}, qeInput)
+        self.store.add('kpt/out', {'total energy': -15.8, 'ecutwfc': 25.0}, \
+                       'fixed', {'kpoints': [6, 6, 6]}, qeInput)
+        self.store.add('parsed/out', {'total energy': -15.8}, 'fixed', \
+                       qeInput=qeInput)
+        self.store.flush()
+        
+        table = self.store.query(label='fixed')
+        self.assertEqual(list(table['ecutwfc']), [30.0, 25.0, 18.0])
+        self.assertEqual(list(table['k1']), [2, 6, 2])
+        self.assertEqual(list(table['k3']), [2, 6, 2])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestResultStoreMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in retry_policy.py
+
+@author: abishekk
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from input_reader import InputReader
+from retry_policy import *
+
+class TestRetryPolicyMethods(unittest.TestCase):
+    
+    def test_classify_outcome(self):
+        """
+        Unit test for classify_outcome, a zero energy is never OK
+        """
+        self.assertEqual(classify_outcome(None), SUBMIT_FAILED)
+        self.assertEqual(classify_outcome({'total energy': -215.5, \
+                                           'converged': True}), OK)
+        self.assertEqual(classify_outcome({'total energy': 0.0, \
+                                           'converged': False}), CRASHED)
+        self.assertEqual(classify_outcome({}), CRASHED)
+        self.assertEqual(classify_outcome({'error': 'cdiaghg (3): S ' + \
+                                           'matrix not positive definite'}), \
+                         CRASHED)
+        self.assertEqual(classify_outcome({'scf iterations': 100, \
+                                           'converged': False}), \
+                         SCF_NOT_CONVERGED)
+        self.assertEqual(classify_outcome({'scf accuracy': 0.1}), \
+                         SCF_NOT_CONVERGED)
+        self.assertEqual(classify_outcome({'time exceeded': True}), WALLTIME)
+        self.assertEqual(classify_outcome({}, '=>> PBS: job killed: ' + \
+                                          'walltime 3610 exceeded limit ' + \
+                                          '3600'), WALLTIME)
+        self.assertEqual(classify_outcome({}, 'slurmstepd: error: *** JOB ' + \
+                                          '12 CANCELLED AT 2018-04-17 DUE ' + \
+                                          'TO TIME LIMIT ***'), WALLTIME)
+    
+    def test_read_scheduler_errors(self):
+        """
+        Unit test for read_scheduler_errors
+        """
+        with tempfile.TemporaryDirectory() as workDir:
+            with open(os.path.join(workDir, 'STDIN.e1234'), 'w') as fileptr:
+                fileptr.write('walltime 3610 exceeded limit 3600\n')
+            with open(os.path.join(workDir, 'STDIN.e999'), 'w') as fileptr:
+                fileptr.write('other job\n')
+            self.assertEqual(read_scheduler_errors(workDir, '1234.server'), \
+                             'walltime 3610 exceeded limit 3600\n')
+            self.assertEqual(read_scheduler_errors(workDir, '55'), '')
+            self.assertEqual(read_scheduler_errors(workDir, None), '')
+    
+    def test_scale_walltime(self):
+        """
+        Unit test for scale_walltime
+        """
+        self.assertEqual(scale_walltime('-l nodes=1 -l walltime=01:00:00', \
+                                        1.5), '-l nodes=1 -l walltime=1:30:00')
+        self.assertEqual(scale_walltime('--time=1-00:00:00', 2), \
+                         '--time=48:00:00')
+        self.assertEqual(scale_walltime('-t 40', 1.5, option='--time='), \
+                         '-t 1:00:00')
+        # a PBS job array is not a time limit
+        self.assertEqual(scale_walltime('-t 1-10 -l walltime=1:00:00', 2), \
+                         '-t 1-10 -l walltime=2:00:00')
+        self.assertEqual(scale_walltime('-q debug', 2), \
+                         '-q debug -l walltime=2:00:00')
+        self.assertEqual(scale_walltime('-p debug', 2, 600, '--time='), \
+                         '-p debug --time=0:20:00')
+    
+    def test_set_walltime(self):
+        """
+        Unit test for set_walltime
+        """
+        self.assertEqual(set_walltime('-l nodes=1 -l walltime=24:00:00', \
+                                      5400), '-l nodes=1 -l walltime=1:30:00')
+        self.assertEqual(set_walltime('', 600), '-l walltime=0:10:00')
+        self.assertEqual(set_walltime('-p debug', 3600, '--time='), \
+                         '-p debug --time=1:00:00')
+    
+    def test_policy(self):
+        """
+        Unit test for should_retry, delay_for, adjust_input and
+        adjust_params
+        """
+        policy = RetryPolicy(maxRetries=2, delay=10.0, backoff=3.0, \
+                             retryOn=[SCF_NOT_CONVERGED, WALLTIME])
+        self.assertTrue(policy.should_retry(SCF_NOT_CONVERGED, 1))
+        self.assertFalse(policy.should_retry(SCF_NOT_CONVERGED, 2))
+        self.assertFalse(policy.should_retry(CRASHED, 0))
+        self.assertEqual(policy.delay_for(2), 90.0)
+        self.assertEqual(policy.adjust_params('-l walltime=02:00:00', \
+                                              WALLTIME), \
+                         '-l walltime=3:00:00')
+        self.assertEqual(policy.adjust_params('', WALLTIME, '--time='), \
+                         '--time=1:30:00')
+        self.assertEqual(policy.adjust_params('-l walltime=02:00:00', \
+                                              CRASHED), \
+                         '-l walltime=02:00:00')
+        
+        with tempfile.TemporaryDirectory() as workDir:
+            inPath = os.path.join(workDir, 'in.pw.si')
+            shutil.copy('in.pw.si', inPath)
+            qeInput = InputReader(inPath)
+            qeInput.read_file()
+            self.assertFalse(policy.adjust_input(qeInput, WALLTIME))
+            self.assertTrue(policy.adjust_input(qeInput, SCF_NOT_CONVERGED))
+            self.assertEqual(qeInput.get_parameter('mixing_beta'), '0.35')
+            self.assertEqual(qeInput.get_parameter('electron_maxstep'), '200')
+            for i in range(3):
+                policy.adjust_input(qeInput, SCF_NOT_CONVERGED)
+            self.assertEqual(qeInput.get_parameter('mixing_beta'), '0.1')
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRetryPolicyMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for functions in study_journal.py
+
+@author: abishekk
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0,'../')
+from study_journal import *
+
+class TestStudyJournalMethods(unittest.TestCase):
+    
+    def setUp(self):
+        self.journalDir = tempfile.TemporaryDirectory()
+        self.journalFile = os.path.join(self.journalDir.name, 'study.jsonl')
+    
+    def tearDown(self):
+        self.journalDir.cleanup()
+    
+    def test_events(self):
+        """
+        Unit test for submitted, finished, cancelled and get
+        """
+        journal = StudyJournal(self.journalFile)
+        self.assertEqual(journal.get('a/out.a'), None)
+        
+        journal.submitted('a/out.a', '101.server', 'abc')
+        journal.submitted('b/out.b', '102.server')
+        journal.finished('a/out.a', {'total energy': -15.8})
+        journal.cancelled('b/out.b')
+        
+        entry = journal.get('a/out.a')
+        self.assertEqual(entry['status'], 'finished')
+        self.assertEqual(entry['job'], '101.server')
+        self.assertEqual(entry['key'], 'abc')
+        self.assertEqual(entry['result'], {'total energy': -15.8})
+        self.assertEqual(journal.get('b/out.b')['status'], 'cancelled')
+        self.assertEqual(sorted(journal.points()), ['a/out.a', 'b/out.b'])
+    
+    def test_replay(self):
+        """
+        Unit test for replay, a new journal reads back the events
+        """
+        journal = StudyJournal(self.journalFile)
+        journal.submitted('a/out.a', '101.server')
+        journal.finished('a/out.a', {'total energy': -15.8})
+        journal.submitted('a/out.a', '103.server')
+        journal.submitted('b/out.b', '102.server')
+        
+        # a line cut short by a crash is ignored
+        with open(self.journalFile, 'a') as fileptr:
+            fileptr.write('{"event": "finished", "outp')
+        
+        journal = StudyJournal(self.journalFile)
+        entry = journal.get('a/out.a')
+        self.assertEqual(entry['status'], 'submitted')
+        self.assertEqual(entry['job'], '103.server')
+        self.assertEqual(entry['result'], None)
+        self.assertEqual(journal.get('b/out.b')['job'], '102.server')
+
+        # events written after the cut line are kept
+        journal.finished('b/out.b', {'total energy': -15.9})
+        journal = StudyJournal(self.journalFile)
+        self.assertEqual(journal.get('b/out.b')['status'], 'finished')
+        self.assertEqual(journal.get('a/out.a')['job'], '103.server')
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStudyJournalMethods)
+    unittest.TextTestRunner(verbosity=2).run(suite)